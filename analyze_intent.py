@@ -1,16 +1,24 @@
+import hashlib
 import json
 import os
 import sys
 import argparse
+import asyncio
 import time
 import sqlite3
+from customer_intent_scraper.analysis import LLM_ANALYZER, AnalysisStore, pending_filter, selection_filters
+from customer_intent_scraper.db import iter_discussions, top_replies
+from customer_intent_scraper.ratelimit import RateLimiter, backoff, retry_after
+from customer_intent_scraper.schema import apply_migrations
+from customer_intent_scraper.shaping import estimate_tokens, shape_text, strip_boilerplate, truncate
+from customer_intent_scraper.stores import BoundedCache
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
 try:
-    from openai import AzureOpenAI
+    from openai import APIConnectionError, APIStatusError, AsyncAzureOpenAI
 except ImportError:
     print("Error: 'openai' library not found. Please install it using 'pip install openai'")
     sys.exit(1)
@@ -20,81 +28,49 @@ try:
 except ImportError:
     def tqdm(iterable, **kwargs): return iterable
 
-def load_data_from_db(db_path, limit=0):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    # Select items that haven't been analyzed by AI yet (optional optimization)
-    # For now, just select all or limit
-    query = "SELECT * FROM discussions"
-    if limit > 0:
-        query += f" LIMIT {limit}"
-        
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    data = [dict(row) for row in rows]
-    conn.close()
-    return data
+# Part of the stored analysis version: bump it when the prompt changes
+PROMPT_VERSION = "1"
 
-def update_db_with_analysis(db_path, item_id, analysis):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Add columns if they don't exist
-    columns = [
-        "analysis_category", "analysis_product_area", "analysis_sentiment", 
-        "analysis_intent", "analysis_summary", "analysis_pain_points"
-    ]
-    
-    for col in columns:
-        try:
-            cursor.execute(f"ALTER TABLE discussions ADD COLUMN {col} TEXT")
-        except sqlite3.OperationalError:
-            pass # Column likely exists
-
-    # Update row
-    cursor.execute("""
-        UPDATE discussions 
-        SET analysis_category = ?, 
-            analysis_product_area = ?, 
-            analysis_sentiment = ?,
-            analysis_intent = ?,
-            analysis_summary = ?,
-            analysis_pain_points = ?
-        WHERE id = ?
-    """, (
-        analysis.get('category'),
-        analysis.get('product_area'),
-        analysis.get('sentiment'),
-        analysis.get('category'), # Mapping category to intent for consistency with local script
-        analysis.get('summary'),
-        json.dumps(analysis.get('pain_points', [])),
-        item_id
-    ))
-            
-    conn.commit()
-    conn.close()
+# What the model returns (author role and clusters come from the local script)
+LLM_FIELDS = ("category", "product_area", "sentiment", "intent", "summary", "pain_points")
 
-def analyze_intent(client, discussion, deployment_name):
-    """
-    Analyzes the customer intent and pain points of a discussion using an LLM.
+# Rough completion size, counted against the tokens/min quota until the real usage is known
+COMPLETION_TOKENS = 300
+
+# All the prompt needs; the other columns of discussions are never loaded
+PROMPT_COLUMNS = ("id", "title", "content", "text_hash")
+
+# Shorter posts are not worth a request (compressed content is always longer)
+MIN_CONTENT_LENGTH = 10
+HAS_CONTENT_FILTER = (
+    f"discussions.content_compressed = 1 OR length(discussions.content) >= {MIN_CONTENT_LENGTH}", ()
+)
+
+def load_data_from_db(conn, filters=(), limit=0, chunk_size=100, reply_count=0):
+    """Yields the discussions to analyse, reading ``chunk_size`` rows at a time.
+
+    With ``reply_count``, each comes with its most-kudoed replies (``replies``).
     """
-    title = discussion.get('title', '')
-    content = discussion.get('content', '')
-    
-    # Skip empty content
-    if not content or len(content) < 10:
-        return None
+    # Near-duplicates (cross-posts) are skipped: only their canonical discussion is sent
+    count = 0
+    for chunk in iter_discussions(conn, PROMPT_COLUMNS, filters, chunk_size):
+        replies = top_replies(conn, [item["id"] for item in chunk], reply_count)
+        for item in chunk:
+            item["replies"] = replies.get(item["id"], [])
+            if limit > 0 and count >= limit:
+                return
+            count += 1
+            yield item
 
-    system_prompt = "You are an expert product analyst for Microsoft 365 Copilot. Your goal is to identify customer pain points and categorize feedback."
-    user_prompt = f"""
-    Analyze the following customer discussion thread.
-    
-    Title: {title}
-    Content: {content}
-    
-    Provide the output in JSON format with the following keys:
+def result_for(item, analysis):
+    # Category doubles as intent, for consistency with the local script
+    return item['id'], item.get('text_hash'), dict(
+        analysis, intent=analysis.get('category'), pain_points=analysis.get('pain_points', [])
+    )
+
+SYSTEM_PROMPT = "You are an expert product analyst for Microsoft 365 Copilot. Your goal is to identify customer pain points and categorize feedback."
+
+OUTPUT_KEYS = """
     - "category": (e.g., "Bug/Issue", "Feature Request", "How-to/Question", "Pricing/Licensing", "General Discussion")
     - "product_area": (e.g., "Excel", "Outlook", "Teams", "PowerPoint", "Admin Center", "Copilot Studio", "General")
     - "pain_points": A list of specific struggles or issues mentioned (max 3).
@@ -102,25 +78,309 @@ def analyze_intent(client, discussion, deployment_name):
     - "summary": A concise one-sentence summary of the core issue.
     """
 
-    try:
-        response = client.chat.completions.create(
-            model=deployment_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0,
-            response_format={ "type": "json_object" }
+# A packed response entry must have these to be accepted
+REQUIRED_KEYS = ("category", "product_area", "sentiment", "summary")
+
+def shape_discussion(discussion, args, totals):
+    """The discussion as it will be sent: boilerplate stripped, content and replies within budget."""
+    content = discussion.get('content') or ''
+    stripped = content if args.no_strip else strip_boilerplate(content)
+    shaped = dict(discussion, content=truncate(stripped, args.max_content_tokens, args.head_ratio))
+    replies = []
+    remaining = args.reply_tokens
+    for reply in discussion.get('replies', []):
+        text = shape_text(reply.get('content') or '', remaining, args.head_ratio, not args.no_strip)
+        cost = estimate_tokens(text)
+        if not text or cost > remaining:
+            break
+        replies.append({"thumbs_up_count": reply.get('thumbs_up_count') or 0, "content": text})
+        remaining -= cost
+    shaped['replies'] = replies
+
+    totals["raw_tokens"] += estimate_tokens(content)
+    totals["shaped_tokens"] += estimate_tokens(shaped['content'])
+    totals["truncated"] += int(shaped['content'] is not stripped)
+    totals["replies"] += len(replies)
+    totals["reply_tokens"] += args.reply_tokens - remaining
+    return shaped
+
+def thread_text(discussion):
+    text = f"""Title: {discussion.get('title', '')}
+    Content: {discussion.get('content', '')}"""
+    if discussion.get('replies'):
+        text += "\n    Most helpful replies:" + "".join(
+            f"\n    - ({reply['thumbs_up_count']} kudos) {reply['content']}" for reply in discussion['replies']
         )
-        return json.loads(response.choices[0].message.content)
-    except Exception as e:
-        print(f"Error analyzing item '{title[:30]}...': {e}")
-        return None
+    return text
+
+def build_messages(discussion):
+    user_prompt = f"""
+    Analyze the following customer discussion thread.
+    
+    {thread_text(discussion)}
+    
+    Provide the output in JSON format with the following keys:{OUTPUT_KEYS}"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def build_batch_messages(discussions):
+    # The instructions are sent once for the whole batch; json_object mode
+    # needs an object at the top level, so the array is wrapped in "results"
+    threads = "\n".join(
+        f"""
+    <discussion id="{d['id']}">
+    {thread_text(d)}
+    </discussion>"""
+        for d in discussions
+    )
+    user_prompt = f"""
+    Analyze each of the following {len(discussions)} customer discussion threads independently.
+    {threads}
+    
+    Provide the output in JSON format as {{"results": [...]}}, with one object per discussion, in any order.
+    Each object has an "id" key with the discussion's id and the following keys:{OUTPUT_KEYS}"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def discussion_tokens(discussion):
+    """Rough cost of one discussion inside a packed request: its text plus its answer."""
+    return estimate_tokens(thread_text(discussion)) + COMPLETION_TOKENS
+
+def valid_analysis(analysis):
+    return (
+        isinstance(analysis, dict)
+        and all(analysis.get(key) for key in REQUIRED_KEYS)
+        and isinstance(analysis.get("pain_points", []), list)
+    )
+
+def cache_key(deployment_name, discussion):
+    # Same key whether the discussion was sent alone or packed with others
+    raw = json.dumps(
+        [deployment_name, PROMPT_VERSION, SYSTEM_PROMPT, OUTPUT_KEYS, thread_text(discussion)],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class LLMAnalyzer:
+    """Sends discussions to the deployment, alone or packed, within the rate limits."""
+
+    def __init__(self, client, deployment_name, limiter, max_retries=5, cache=None):
+        self.client = client
+        self.deployment_name = deployment_name
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.cache = cache
+        self.stats = {"requests": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                      "packed": 0, "fallbacks": 0}
+        self.latencies = []
+
+    async def complete(self, messages, completion_tokens=COMPLETION_TOKENS):
+        """One chat completion, retrying throttling and server errors."""
+        estimated = estimate_tokens("".join(m["content"] for m in messages)) + completion_tokens
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(estimated)
+            self.stats["requests"] += 1
+            started = time.perf_counter()
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.deployment_name,
+                    messages=messages,
+                    temperature=0,
+                    response_format={ "type": "json_object" }
+                )
+            except APIStatusError as e:
+                if (e.status_code != 429 and e.status_code < 500) or attempt == self.max_retries:
+                    raise
+                delay = retry_after(e.response.headers) or backoff(attempt)
+                if e.status_code == 429:
+                    # Over quota: everyone waits, not just this request
+                    self.limiter.pause(delay)
+            except APIConnectionError:
+                if attempt == self.max_retries:
+                    raise
+                delay = backoff(attempt)
+            else:
+                self.latencies.append(time.perf_counter() - started)
+                usage = getattr(response, "usage", None)
+                self.limiter.record_usage(estimated, usage.total_tokens if usage else None)
+                if usage:
+                    self.stats["prompt_tokens"] += usage.prompt_tokens
+                    self.stats["completion_tokens"] += usage.completion_tokens
+                return response
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    def cached(self, discussion):
+        if self.cache is None:
+            return None
+        analysis = self.cache.get(cache_key(self.deployment_name, discussion))
+        # Entries cached before answers were validated may be unusable
+        return analysis if valid_analysis(analysis) else None
+
+    def remember(self, discussion, analysis):
+        if self.cache is not None:
+            self.cache.set(cache_key(self.deployment_name, discussion), analysis)
+
+    async def analyze_intent(self, discussion):
+        """
+        Analyzes the customer intent and pain points of a discussion using an LLM.
+        """
+        title = discussion.get('title', '')
+        content = discussion.get('content', '')
+        
+        # Skip empty content
+        if not content or len(content) < MIN_CONTENT_LENGTH:
+            return None
+
+        cached = self.cached(discussion)
+        if cached is not None:
+            return cached
+
+        try:
+            response = await self.complete(build_messages(discussion))
+            analysis = json.loads(response.choices[0].message.content)
+        except Exception as e:
+            print(f"Error analyzing item '{(title or '')[:30]}...': {e}")
+            return None
+        if not valid_analysis(analysis):
+            # Not cached: a later run asks again
+            print(f"Error analyzing item '{(title or '')[:30]}...': unexpected answer {str(analysis)[:80]!r}")
+            return None
+        self.remember(discussion, analysis)
+        return analysis
+
+    async def analyze_batch(self, discussions):
+        """Analyses for ``discussions`` (None where it failed), in one request when possible."""
+        if len(discussions) == 1:
+            return [await self.analyze_intent(discussions[0])]
+
+        by_id = {}
+        try:
+            response = await self.complete(
+                build_batch_messages(discussions), completion_tokens=COMPLETION_TOKENS * len(discussions)
+            )
+            parsed = json.loads(response.choices[0].message.content)
+            entries = parsed.get("results", []) if isinstance(parsed, dict) else parsed
+            for entry in entries if isinstance(entries, list) else []:
+                if isinstance(entry, dict) and valid_analysis(entry):
+                    by_id[str(entry.get("id"))] = {k: v for k, v in entry.items() if k != "id"}
+        except Exception as e:
+            print(f"Error analyzing a batch of {len(discussions)}: {e}; sending them one by one")
+
+        analyses = []
+        for discussion in discussions:
+            analysis = by_id.get(str(discussion["id"]))
+            if analysis is not None:
+                self.stats["packed"] += 1
+                self.remember(discussion, analysis)
+            else:
+                # Missing, malformed or the whole batch failed: ask again on its own
+                self.stats["fallbacks"] += 1
+                analysis = await self.analyze_intent(discussion)
+            analyses.append(analysis)
+        return analyses
+
+async def analyze_all(args, analyzer, data, store):
+    """Keeps args.concurrency requests in flight; results are stored as they come back."""
+    results = []
+    totals = {"analysed": 0, "failed": 0, "cached": 0,
+              "raw_tokens": 0, "shaped_tokens": 0, "truncated": 0, "replies": 0, "reply_tokens": 0}
+    data = iter(data)
+    carry = []
+
+    def record(item, analysis):
+        try:
+            result = result_for(item, analysis) if analysis else None
+        except Exception as e:
+            # One bad answer must not stop the other workers
+            print(f"Error recording analysis of {item.get('id')}: {e}")
+            result = None
+        if result:
+            results.append(result)
+            totals["analysed"] += 1
+        else:
+            totals["failed"] += 1
+        # Written in batches: one transaction per args.batch_size results
+        if len(results) >= args.batch_size:
+            flush()
+
+    def flush():
+        store.write(results, fields=LLM_FIELDS)
+        results.clear()
+
+    def next_batch():
+        # Up to args.pack uncached discussions within args.pack_tokens; the one
+        # that does not fit starts the next batch
+        batch = list(carry)
+        carry.clear()
+        tokens = sum(discussion_tokens(item) for item in batch)
+        for item in data:
+            item = shape_discussion(item, args, totals)
+            cached = analyzer.cached(item)
+            if cached is not None:
+                totals["cached"] += 1
+                record(item, cached)
+                continue
+            cost = discussion_tokens(item)
+            if batch and (len(batch) >= args.pack or tokens + cost > args.pack_tokens):
+                carry.append(item)
+                break
+            batch.append(item)
+            tokens += cost
+        return batch
+
+    async def worker():
+        # The workers share one iterator: each takes the next batch when it is free
+        while True:
+            batch = next_batch()
+            if not batch:
+                return
+            for item, analysis in zip(batch, await analyzer.analyze_batch(batch)):
+                record(item, analysis)
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    flush()
+    return totals
 
 def main():
     parser = argparse.ArgumentParser(description="Analyze discussion intents using Azure OpenAI.")
     parser.add_argument("--db", default="discussions.db", help="Input SQLite database path")
     parser.add_argument("--limit", type=int, default=10, help="Number of items to analyze (default: 10). Set to 0 for all.")
+    parser.add_argument("--batch-size", type=int, default=20, help="Results stored per database transaction")
+    parser.add_argument("--chunk-size", type=int, default=100, help="Discussions read from the database at a time")
+    parser.add_argument("--since", help="Only analyse discussions scraped or changed since this date (YYYY-MM-DD)")
+    parser.add_argument("--platform", help="Only analyse discussions from this platform (e.g. 'Tech Community')")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--rpm", type=int, default=int(os.getenv("AZURE_OPENAI_RPM", "0")),
+                        help="Requests per minute allowed by the deployment (0: no limit)")
+    parser.add_argument("--tpm", type=int, default=int(os.getenv("AZURE_OPENAI_TPM", "0")),
+                        help="Tokens per minute allowed by the deployment (0: no limit)")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries for throttled (429) and failed (5xx) requests")
+    parser.add_argument("--reanalyse", action="store_true",
+                        help="Also send discussions already analysed with this deployment and prompt version")
+    parser.add_argument("--cache", default="llm_cache.db",
+                        help="Persistent cache of model responses, keyed by model, prompt and text ('' to disable)")
+    parser.add_argument("--cache-max-entries", type=int, default=0,
+                        help="Responses kept in the cache, newest first (0: no limit; they never expire)")
+    parser.add_argument("--pack", type=int, default=1,
+                        help="Discussions sent together in one request (1: one request per discussion)")
+    parser.add_argument("--pack-tokens", type=int, default=8000,
+                        help="Estimated tokens (texts plus answers) a packed request may hold")
+    parser.add_argument("--max-content-tokens", type=int, default=2000,
+                        help="Longer posts keep their start and end within this many tokens (0: no limit)")
+    parser.add_argument("--head-ratio", type=float, default=0.7, help="Share of a truncated post kept from its start")
+    parser.add_argument("--no-strip", action="store_true",
+                        help="Send posts as stored, without removing greetings, sign-offs and forum footers")
+    parser.add_argument("--top-replies", type=int, default=0, help="Also send the K most-kudoed replies of each discussion")
+    parser.add_argument("--reply-tokens", type=int, default=500, help="Token budget for those replies, per discussion")
+    parser.add_argument("--input-price", type=float, default=float(os.getenv("AZURE_OPENAI_INPUT_PRICE", "0")),
+                        help="Price per million prompt tokens, for the cost report")
+    parser.add_argument("--output-price", type=float, default=float(os.getenv("AZURE_OPENAI_OUTPUT_PRICE", "0")),
+                        help="Price per million completion tokens, for the cost report")
     args = parser.parse_args()
 
     # Check for Azure OpenAI Environment Variables
@@ -138,27 +398,55 @@ def main():
         print(f"Error: {args.db} not found.")
         return
 
-    print(f"Loading data from {args.db}...")
-    data = load_data_from_db(args.db, args.limit)
-    
-    print(f"Processing {len(data)} items...")
-
-    client = AzureOpenAI(
+    client = AsyncAzureOpenAI(
         api_key=api_key,
         api_version=api_version,
-        azure_endpoint=endpoint
+        azure_endpoint=endpoint,
+        # Retries are ours (complete), so they go through the rate limiter
+        max_retries=0
     )
     
-    print("Starting analysis...")
-    
-    for item in tqdm(data, desc="Analyzing"):
-        analysis = analyze_intent(client, item, deployment_name)
-        if analysis:
-            update_db_with_analysis(args.db, item['id'], analysis)
-        # Small sleep to avoid aggressive rate limiting if needed
-        # time.sleep(0.1) 
-
-    print(f"\nAnalysis complete.")
+    print(f"Starting analysis ({args.concurrency} concurrent requests, up to {args.pack} discussions each)...")
+
+    conn = sqlite3.connect(args.db)
+    apply_migrations(conn)
+    version = f"{deployment_name}:{PROMPT_VERSION}"
+    filters = [HAS_CONTENT_FILTER] + selection_filters(args)
+    if not args.reanalyse:
+        # New discussions and those whose content changed since their last analysis
+        filters.append(pending_filter(LLM_ANALYZER, version))
+    # Streamed from the database: only one chunk of discussions is held at a time
+    data = load_data_from_db(conn, filters, args.limit, args.chunk_size, args.top_replies)
+    store = AnalysisStore(conn, LLM_ANALYZER, version)
+    # Everything stays on disk (no TTL); only recent entries are kept in memory
+    cache = BoundedCache(
+        max_entries=1000, ttl=0, db_path=args.cache, max_disk_entries=args.cache_max_entries
+    ) if args.cache else None
+    analyzer = LLMAnalyzer(client, deployment_name, RateLimiter(args.rpm, args.tpm), args.max_retries, cache)
+
+    started = time.perf_counter()
+    totals = asyncio.run(analyze_all(args, analyzer, tqdm(data, desc="Analyzing", total=args.limit or None), store))
+    conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"\nAnalysis complete: {totals['analysed']} analysed, {totals['failed']} failed or skipped "
+          f"in {elapsed:.1f}s ({totals['analysed'] / max(elapsed, 1e-9) * 60:.0f}/min).")
+    stats = analyzer.stats
+    sent = totals["analysed"] - totals["cached"]
+    print(f"{stats['requests']} requests ({stats['retries']} retried), "
+          f"{stats['prompt_tokens'] / max(sent, 1):.0f} prompt tokens per discussion; "
+          f"{stats['packed']} answered in packed requests, {stats['fallbacks']} sent again on their own, "
+          f"{totals['cached']} from the response cache.")
+    print(f"Input shaping: {totals['raw_tokens']} -> {totals['shaped_tokens']} estimated tokens of post text "
+          f"({totals['truncated']} posts truncated), plus {totals['reply_tokens']} for {totals['replies']} replies.")
+    if analyzer.latencies:
+        latencies = sorted(analyzer.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"Request latency: {sum(latencies) / len(latencies):.2f}s mean, {p95:.2f}s p95.")
+    cost = (stats["prompt_tokens"] * args.input_price + stats["completion_tokens"] * args.output_price) / 1e6
+    print(f"Tokens: {stats['prompt_tokens']} prompt + {stats['completion_tokens']} completion"
+          + (f", cost {cost:.4f} ({cost / max(sent, 1):.6f} per discussion)." if cost else
+             " (set --input-price/--output-price for a cost estimate)."))
 
 if __name__ == "__main__":
     main()
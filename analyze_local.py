@@ -1,80 +1,52 @@
 import json
+import os
 import re
+import time
 import argparse
 import sqlite3
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
+import joblib
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from scipy import sparse
+from customer_intent_scraper.analysis import LOCAL_ANALYZER, AnalysisStore, pending_filter, selection_filters
+from customer_intent_scraper.classifier import DEFAULT_TAXONOMIES, KeywordClassifier
+from customer_intent_scraper.db import iter_discussions
+from customer_intent_scraper.schema import apply_migrations
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.pipeline import make_pipeline
+from sklearn.utils import murmurhash3_32
 from collections import Counter
 
-def load_data_from_db(db_path):
+# Bump when the saved model layout changes; older files are then refitted
+MODEL_FORMAT = 1
+
+# Labels from the keyword taxonomies, stored next to the cluster's category and id
+KEYWORD_FIELDS = ("product_area", "sentiment", "intent", "author_role")
+# What analyze_local writes to the analysis table
+LOCAL_FIELDS = ("category", "cluster_id") + KEYWORD_FIELDS
+
+# All the analysis reads; the other columns of discussions are never loaded
+ANALYSIS_COLUMNS = ("id", "title", "content", "text_hash")
+
+def load_data_from_db(db_path, filters=(), chunk_size=1000):
     conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM discussions")
-    rows = cursor.fetchall()
-    data = [dict(row) for row in rows]
+    apply_migrations(conn)
+    data = []
+    for chunk in iter_discussions(conn, ANALYSIS_COLUMNS, filters, chunk_size):
+        data.extend(chunk)
     conn.close()
     return data
 
-def update_db_with_analysis(db_path, data):
+def update_db_with_analysis(db_path, data, version, supersede=False):
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Add columns if they don't exist
-    try:
-        cursor.execute("ALTER TABLE discussions ADD COLUMN analysis_category TEXT")
-    except sqlite3.OperationalError:
-        pass # Column likely exists
-        
-    try:
-        cursor.execute("ALTER TABLE discussions ADD COLUMN analysis_product_area TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE discussions ADD COLUMN analysis_sentiment TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE discussions ADD COLUMN analysis_intent TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE discussions ADD COLUMN analysis_author_role TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    try:
-        cursor.execute("ALTER TABLE discussions ADD COLUMN analysis_cluster_id INTEGER")
-    except sqlite3.OperationalError:
-        pass
-
-    # Update rows
-    for item in data:
-        if 'analysis' in item:
-            analysis = item['analysis']
-            cursor.execute("""
-                UPDATE discussions 
-                SET analysis_category = ?, 
-                    analysis_product_area = ?, 
-                    analysis_sentiment = ?,
-                    analysis_intent = ?,
-                    analysis_author_role = ?,
-                    analysis_cluster_id = ?
-                WHERE id = ?
-            """, (
-                analysis.get('category'),
-                analysis.get('product_area'),
-                analysis.get('sentiment'),
-                analysis.get('intent'),
-                analysis.get('author_role'),
-                analysis.get('cluster_id'),
-                item.get('id')
-            ))
-            
-    conn.commit()
+    store = AnalysisStore(conn, LOCAL_ANALYZER, version)
+    store.write(
+        ((item['id'], item.get('text_hash'), item['analysis']) for item in data if 'analysis' in item),
+        fields=LOCAL_FIELDS,
+        supersede=supersede,
+    )
     conn.close()
 
 def clean_text(text):
@@ -86,177 +58,102 @@ def clean_text(text):
     text = re.sub(r'[^a-zA-Z\s]', '', text)
     return text.lower()
 
-def get_product_area(text):
-    text = text.lower()
-    products = {
-        "excel": "Excel",
-        "word": "Word",
-        "powerpoint": "PowerPoint",
-        "outlook": "Outlook",
-        "teams": "Teams",
-        "copilot studio": "Copilot Studio",
-        "loop": "Loop",
-        "onenote": "OneNote",
-        "whiteboard": "Whiteboard",
-        "admin": "Admin Center",
-        "security": "Security",
-        "compliance": "Compliance",
-        "windows": "Windows",
-        "power bi": "Power BI",
-        "power automate": "Power Automate",
-        "sharepoint": "SharePoint",
-        "onedrive": "OneDrive",
-        "viva": "Viva",
-        "stream": "Stream",
-        "yammer": "Yammer",
-        "planner": "Planner",
-        "lists": "Lists",
-        "forms": "Forms"
-    }
-    
-    for key, value in products.items():
-        if key in text:
-            return value
-    return "General"
-
-def analyze_sentiment_keyword(text):
-    # Very basic keyword-based sentiment since we don't have a model
-    text = text.lower()
-    neg_words = ["fail", "error", "bug", "broken", "issue", "problem", "slow", "crash", "stuck", "hate", "useless", "frustrat"]
-    pos_words = ["great", "love", "amazing", "helpful", "thanks", "good", "excellent", "awesome"]
-    
-    neg_count = sum(1 for w in neg_words if w in text)
-    pos_count = sum(1 for w in pos_words if w in text)
-    
-    if neg_count > pos_count:
-        return "Negative"
-    elif pos_count > neg_count:
-        return "Positive"
-    else:
-        return "Neutral"
-
-def analyze_intent_keyword(text):
-    text = text.lower()
-    
-    # Bug / Issue
-    bug_keywords = ["error", "fail", "crash", "bug", "not working", "broken", "issue", "problem", "stuck", "glitch", "exception", "slow", "latency"]
-    if any(w in text for w in bug_keywords):
-        return "Bug/Issue"
-        
-    # Feature Request
-    request_keywords = ["feature request", "please add", "wish", "missing", "would like", "should have", "suggestion", "idea", "feedback", "improve"]
-    if any(w in text for w in request_keywords):
-        return "Feature Request"
-        
-    # Pricing / Licensing
-    pricing_keywords = ["price", "cost", "license", "subscription", "billing", "expensive", "cheap", "pay", "e3", "e5"]
-    if any(w in text for w in pricing_keywords):
-        return "Pricing/Licensing"
-
-    # How-to / Question
-    question_keywords = ["how to", "how do i", "can i", "is it possible", "where is", "help", "guide", "tutorial", "?"]
-    if any(w in text for w in question_keywords):
-        return "How-to/Question"
-        
-    return "General Discussion"
-
-def analyze_author_role(text):
-    text = text.lower()
-    
-    # Developer
-    dev_keywords = ["api", "sdk", "code", "script", "json", "xml", "endpoint", "token", "auth", "react", "node", "c#", "python", "javascript", "graph api", "rest", "webhook", "bot", "framework", "library", "spfx", "csom", "pnp"]
-    if any(w in text for w in dev_keywords):
-        return "Developer"
-
-    # IT Admin (Merged with IT Professional)
-    admin_keywords = [
-        "admin center", "tenant", "global admin", "permissions", "policy", "migration", "powershell", 
-        "active directory", "entra", "compliance", "security", "audit", "users", "groups", "license", 
-        "configure", "deploy", "provision",
-        # IT Pro keywords merged in:
-        "server", "network", "infrastructure", "hybrid", "on-prem", "sharepoint server", 
-        "exchange server", "deployment", "configuration", "topology", "farm", "bandwidth", "latency"
-    ]
-    if any(w in text for w in admin_keywords):
-        return "IT Admin"
-
-    # End User (Heuristic: "How do I", "Where is", simple complaints)
-    user_keywords = ["how do i", "where is", "button", "screen", "stopped working", "help", "tutorial", "guide", "confused", "can't find", "missing", "slow", "crash", "error message", "my app"]
-    if any(w in text for w in user_keywords):
-        return "End User"
+def document_text(item):
+    return str(item.get('title', '')) + " " + str(item.get('content', ''))
 
-    return "End User" # Default to End User as they are the most common source of feedback
-
-def main():
-    parser = argparse.ArgumentParser(description="Analyze discussion intents using local clustering.")
-    parser.add_argument("--db", default="discussions.db", help="Input SQLite database path")
-    parser.add_argument("--clusters", type=int, default=8, help="Number of clusters")
-    args = parser.parse_args()
-
-    print(f"Loading data from {args.db}...")
-    try:
-        data = load_data_from_db(args.db)
-    except Exception as e:
-        print(f"Error loading database: {e}")
-        return
-
-    if not data:
-        print("No data found in database.")
-        return
-    
-    # Prepare text for clustering
+def prepare_documents(data):
+    # Cleaned text of every row long enough to cluster, with its index in data
     documents = []
     valid_indices = []
-    
     for i, item in enumerate(data):
-        text = (str(item.get('title', '')) + " " + str(item.get('content', '')))
-        cleaned = clean_text(text)
+        cleaned = clean_text(document_text(item))
         if len(cleaned) > 10:
             documents.append(cleaned)
             valid_indices.append(i)
-            
-    if not documents:
-        print("Not enough data for clustering.")
-        return
+    return documents, valid_indices
 
+def fit_model(documents, n_clusters):
     print(f"Vectorizing {len(documents)} documents...")
     vectorizer = TfidfVectorizer(stop_words='english', max_features=1000)
     X = vectorizer.fit_transform(documents)
-    
-    # Adjust clusters if we have fewer documents than requested clusters
-    n_clusters = min(args.clusters, len(documents))
-    if n_clusters < args.clusters:
-        print(f"Reducing clusters to {n_clusters} due to small dataset.")
-    
+
     print(f"Clustering into {n_clusters} topics...")
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42)
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3)
     kmeans.fit(X)
-    
-    # Get cluster keywords
-    print("Identifying cluster themes...")
+
     feature_names = vectorizer.get_feature_names_out()
+    return new_model(vectorizer, kmeans, name_clusters(kmeans, feature_names), X)
+
+def name_clusters(kmeans, feature_names):
+    # Get cluster keywords; feature_names maps a feature index to its term
+    print("Identifying cluster themes...")
     cluster_names = {}
-    
-    for i in range(n_clusters):
+
+    for i in range(kmeans.n_clusters):
         center = kmeans.cluster_centers_[i]
         top_ind = center.argsort()[:-6:-1]
         keywords = [feature_names[ind] for ind in top_ind]
         cluster_names[i] = f"Topic: {', '.join(keywords)}"
         print(f"Cluster {i}: {', '.join(keywords)}")
+    return cluster_names
 
-    # Assign results back to data
+def new_model_version():
+    return time.strftime("%Y%m%d-%H%M%S")
+
+def new_model(vectorizer, kmeans, cluster_names, X, version=None):
+    return {
+        "format": MODEL_FORMAT,
+        "version": version or new_model_version(),
+        "vectorizer": vectorizer,
+        "kmeans": kmeans,
+        "cluster_names": cluster_names,
+        # Mean distance of the training documents to their centroid; drift is measured against it
+        "baseline_distance": float(kmeans.transform(X).min(axis=1).mean()),
+        # Documents assigned incrementally since the fit, and their summed distances
+        "assigned": 0,
+        "assigned_distance": 0.0,
+    }
+
+def load_model(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        model = joblib.load(path)
+    except Exception as e:
+        print(f"Could not load model {path}: {e}")
+        return None
+    if not isinstance(model, dict) or model.get("format") != MODEL_FORMAT:
+        print(f"Model {path} was saved by an older version.")
+        return None
+    return model
+
+def save_model(model, path):
+    # Write then rename, so an interrupted run never leaves a truncated model behind
+    tmp_path = f"{path}.tmp"
+    joblib.dump(model, tmp_path)
+    os.replace(tmp_path, path)
+
+def drift(model):
+    if not model["assigned"] or not model["baseline_distance"]:
+        return 0.0
+    return model["assigned_distance"] / model["assigned"] / model["baseline_distance"] - 1
+
+def tag_data(data, valid_indices, labels, model, classifier):
     print("Tagging data...")
-    
+
     # Create a map of doc_idx -> cluster_id for quick lookup
-    doc_to_cluster = {doc_idx: kmeans.labels_[idx] for idx, doc_idx in enumerate(valid_indices)}
+    doc_to_cluster = {doc_idx: labels[idx] for idx, doc_idx in enumerate(valid_indices)}
+
+    # Product area, sentiment, intent and author role in one scan per document
+    keyword_labels = classifier.classify_many(document_text(item) for item in data)
 
     for i, item in enumerate(data):
-        full_text = (str(item.get('title', '')) + " " + str(item.get('content', '')))
+        keywords = keyword_labels[i]
         
         # Determine cluster info
         if i in doc_to_cluster:
             cluster_id = doc_to_cluster[i]
-            category = cluster_names[cluster_id]
+            category = model["cluster_names"][cluster_id]
             cid = int(cluster_id)
         else:
             category = "General / Short Content"
@@ -265,18 +162,287 @@ def main():
         analysis = {
             "category": category,
             "cluster_id": cid,
-            "product_area": get_product_area(full_text),
-            "sentiment": analyze_sentiment_keyword(full_text),
-            "intent": analyze_intent_keyword(full_text),
-            "author_role": analyze_author_role(full_text),
+            "product_area": keywords["product_area"],
+            "sentiment": keywords["sentiment"],
+            "intent": keywords["intent"],
+            "author_role": keywords["author_role"],
             "pain_points": [], 
-            "summary": item.get('title', '') 
+            "summary": item.get('title', ''),
         }
         
         item['analysis'] = analysis
 
+def assign_incrementally(args, model, classifier):
+    """Label new/changed rows with the saved model. Returns False when a full refit is needed.
+
+    Rows are read, assigned and written chunk by chunk, so memory does not grow
+    with the backlog.
+    """
+    # New rows, rows whose content hash changed and rows labelled by another model version
+    filters = [pending_filter(LOCAL_ANALYZER, model["version"])] + selection_filters(args)
+    conn = sqlite3.connect(args.db)
+    apply_migrations(conn)
+    store = AnalysisStore(conn, LOCAL_ANALYZER, model["version"])
+    # Let the centroids follow the new documents without renumbering the clusters
+    model["kmeans"].set_params(reassignment_ratio=0)
+    labelled = 0
+    try:
+        for data in iter_discussions(conn, ANALYSIS_COLUMNS, filters, args.chunk_size):
+            documents, valid_indices = prepare_documents(data)
+            labels = []
+            if documents:
+                print(f"Assigning {len(documents)} new or changed documents with model {model['version']}...")
+                X = model["vectorizer"].transform(documents)
+                distances = model["kmeans"].transform(X)
+                labels = distances.argmin(axis=1)
+                model["assigned"] += len(documents)
+                model["assigned_distance"] += float(distances.min(axis=1).sum())
+
+                current = drift(model)
+                print(f"Drift since last refit: {current:+.1%} over {model['assigned']} documents")
+                if current > args.drift_threshold:
+                    # Rows already written are relabelled (and superseded) by the refit
+                    print(f"Drift exceeds {args.drift_threshold:.0%}; refitting on the full corpus.")
+                    return False
+
+                model["kmeans"].partial_fit(X)
+
+            tag_data(data, valid_indices, labels, model, classifier)
+            labelled += store.write(
+                ((item['id'], item.get('text_hash'), item['analysis']) for item in data),
+                fields=LOCAL_FIELDS,
+            )
+        if not labelled:
+            print(f"Nothing new to analyse (model {model['version']}).")
+            return True
+        # Rows relabelled from another model version drop their old result
+        store.supersede()
+    finally:
+        conn.close()
+
+    save_model(model, args.model)
+    print(f"Saved analysis of {labelled} rows back to {args.db}.")
+    print(f"Analysis complete. Database updated.")
+    return True
+
+# Parallel mode (--workers > 1): rows are streamed from SQLite in chunks to a
+# process pool. Workers clean and label their chunk and return hashed term
+# counts (HashingVectorizer is stateless, so chunks need no shared
+# vocabulary); the main process writes the labels as chunks come back, stacks
+# the sparse counts, fits TF-IDF weights and clusters, then writes the
+# cluster of every row. Only ids and sparse features are held in memory.
+
+HASH_FEATURES = 2 ** 18
+SHORT_CONTENT = ("General / Short Content", -1)
+
+# Per-process state, set up by init_worker
+worker = {}
+
+def hashing_vectorizer():
+    return HashingVectorizer(n_features=HASH_FEATURES, stop_words='english', alternate_sign=False, norm=None)
+
+def init_worker(taxonomies):
+    worker["classifier"] = KeywordClassifier.from_file(taxonomies)
+    worker["analyzer"] = hashing_vectorizer().build_analyzer()
+    # Hashes pre-tokenised documents exactly like hashing_vectorizer() hashes text
+    worker["hasher"] = FeatureHasher(n_features=HASH_FEATURES, input_type="string", alternate_sign=False)
+
+def analyze_chunk(rows):
+    """Labels, hashed term counts and term frequencies for ``[(id, text_hash, text)]``."""
+    labels = worker["classifier"].classify_many(text for _, _, text in rows)
+    documents = []
+    valid_ids = []
+    short_ids = []
+    for discussion_id, text_hash, text in rows:
+        cleaned = clean_text(text)
+        if len(cleaned) > 10:
+            documents.append(cleaned)
+            valid_ids.append((discussion_id, text_hash))
+        else:
+            short_ids.append((discussion_id, text_hash))
+
+    # Tokenise once: the tokens give both the hashed counts and the term
+    # frequencies that turn the topic keywords' hash indexes back into words
+    tokens = [worker["analyzer"](document) for document in documents]
+    terms = Counter()
+    for document_tokens in tokens:
+        terms.update(document_tokens)
+
+    counts = worker["hasher"].transform(tokens) if tokens else None
+    keyword_results = [
+        (discussion_id, text_hash, keywords)
+        for keywords, (discussion_id, text_hash, _) in zip(labels, rows)
+    ]
+    return keyword_results, valid_ids, short_ids, counts, terms
+
+def iter_chunks(conn, chunk_size, filters=()):
+    for records in iter_discussions(conn, ANALYSIS_COLUMNS, filters, chunk_size):
+        yield [(r["id"], r["text_hash"], document_text(r)) for r in records]
+
+def hashed_feature_names(terms, indexes):
+    # Most frequent term for each wanted hash index (HashingVectorizer uses abs(murmurhash3) % n_features)
+    names = {}
+    for term, _ in terms.most_common():
+        index = abs(murmurhash3_32(term, seed=0)) % HASH_FEATURES
+        if index in indexes and index not in names:
+            names[index] = term
+            if len(names) == len(indexes):
+                break
+    return names
+
+def analyze_parallel(args):
+    conn = sqlite3.connect(args.db, timeout=30)
+    apply_migrations(conn)
+    # Known up front, so the keyword labels can be stored before the clustering is done
+    version = new_model_version()
+    store = AnalysisStore(conn, LOCAL_ANALYZER, version)
+
+    matrices = []
+    valid_ids = []
+    short_ids = []
+    terms = Counter()
+    labelled = 0
+
+    def collect(result):
+        nonlocal labelled
+        keyword_results, chunk_valid, chunk_short, counts, chunk_terms = result
+        # Keyword labels do not depend on the clustering: store them right away
+        labelled += store.write(keyword_results, fields=KEYWORD_FIELDS)
+        if counts is not None:
+            matrices.append(counts)
+        valid_ids.extend(chunk_valid)
+        short_ids.extend(chunk_short)
+        terms.update(chunk_terms)
+
+    print(f"Labelling {args.db} with {args.workers} workers...")
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.taxonomies,)) as pool:
+        # Only a few chunks in flight, so rows stream through instead of piling up in memory
+        in_flight = deque()
+        for chunk in iter_chunks(conn, args.chunk_size, selection_filters(args)):
+            in_flight.append(pool.submit(analyze_chunk, chunk))
+            if len(in_flight) >= args.workers * 2:
+                collect(in_flight.popleft().result())
+        while in_flight:
+            collect(in_flight.popleft().result())
+    print(f"Labelled {labelled} discussions.")
+
+    if not valid_ids:
+        print("Not enough data for clustering.")
+        conn.close()
+        return
+
+    # Adjust clusters if we have fewer documents than requested clusters
+    n_clusters = min(args.clusters, len(valid_ids))
+    if n_clusters < args.clusters:
+        print(f"Reducing clusters to {n_clusters} due to small dataset.")
+
+    counts = sparse.vstack(matrices).tocsr()
+    del matrices
+    print(f"Weighting {counts.shape[0]} documents...")
+    tfidf = TfidfTransformer().fit(counts)
+    X = tfidf.transform(counts)
+    del counts
+
+    print(f"Clustering into {n_clusters} topics...")
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3)
+    kmeans.fit(X)
+
+    top_indexes = {int(i) for center in kmeans.cluster_centers_ for i in center.argsort()[:-6:-1]}
+    feature_names = hashed_feature_names(terms, top_indexes)
+    model = new_model(
+        make_pipeline(hashing_vectorizer(), tfidf),
+        kmeans,
+        name_clusters(kmeans, {i: feature_names.get(i, f"#{i}") for i in top_indexes}),
+        X,
+        version=version,
+    )
+    save_model(model, args.model)
+    print(f"Saved model {model['version']} to {args.model}")
+
+    print(f"Saving clusters back to {args.db}...")
+    cluster_results = [
+        (discussion_id, text_hash, {"category": model["cluster_names"][label], "cluster_id": int(label)})
+        for (discussion_id, text_hash), label in zip(valid_ids, kmeans.labels_)
+    ]
+    category, cluster_id = SHORT_CONTENT
+    cluster_results.extend(
+        (discussion_id, text_hash, {"category": category, "cluster_id": cluster_id})
+        for discussion_id, text_hash in short_ids
+    )
+    for start in range(0, len(cluster_results), args.chunk_size):
+        store.write(cluster_results[start:start + args.chunk_size], fields=("category", "cluster_id"))
+    # Results of earlier full runs are now superseded
+    store.supersede()
+    conn.close()
+    print(f"Analysis complete. Database updated.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze discussion intents using local clustering.")
+    parser.add_argument("--db", default="discussions.db", help="Input SQLite database path")
+    parser.add_argument("--clusters", type=int, default=8, help="Number of clusters")
+    parser.add_argument("--model", default="analysis_model.joblib", help="Where the fitted vectorizer and clusters are saved")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only label new or changed rows with the saved model (refits if there is none)")
+    parser.add_argument("--drift-threshold", type=float, default=0.2,
+                        help="Refit when new documents sit this much further from their centroids than the training set")
+    parser.add_argument("--taxonomies", default=DEFAULT_TAXONOMIES, help="Keyword taxonomies (JSON) for the labels")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes for a full analysis; more than 1 streams the database through a process pool")
+    parser.add_argument("--chunk-size", type=int, default=1000,
+                        help="Discussions read from the database at a time (and per worker task in parallel mode)")
+    parser.add_argument("--since", help="Only analyse discussions scraped or changed since this date (YYYY-MM-DD)")
+    parser.add_argument("--platform", help="Only analyse discussions from this platform (e.g. 'Tech Community')")
+    args = parser.parse_args()
+
+    classifier = KeywordClassifier.from_file(args.taxonomies)
+
+    if args.incremental:
+        model = load_model(args.model)
+        if model is None:
+            print("No usable saved model; running a full analysis.")
+        else:
+            try:
+                if assign_incrementally(args, model, classifier):
+                    return
+            except Exception as e:
+                print(f"Error during incremental analysis: {e}")
+                return
+
+    if args.workers > 1:
+        analyze_parallel(args)
+        return
+
+    print(f"Loading data from {args.db}...")
+    try:
+        data = load_data_from_db(args.db, selection_filters(args), args.chunk_size)
+    except Exception as e:
+        print(f"Error loading database: {e}")
+        return
+
+    if not data:
+        print("No data found in database.")
+        return
+    
+    # Prepare text for clustering
+    documents, valid_indices = prepare_documents(data)
+            
+    if not documents:
+        print("Not enough data for clustering.")
+        return
+
+    # Adjust clusters if we have fewer documents than requested clusters
+    n_clusters = min(args.clusters, len(documents))
+    if n_clusters < args.clusters:
+        print(f"Reducing clusters to {n_clusters} due to small dataset.")
+
+    model = fit_model(documents, n_clusters)
+    tag_data(data, valid_indices, model["kmeans"].labels_, model, classifier)
+    save_model(model, args.model)
+    print(f"Saved model {model['version']} to {args.model}")
+
     print(f"Saving analysis back to {args.db}...")
-    update_db_with_analysis(args.db, data)
+    # A full refit replaces the results of earlier model versions
+    update_db_with_analysis(args.db, data, model["version"], supersede=True)
         
     print(f"Analysis complete. Database updated.")
 
@@ -5,9 +5,14 @@ import os
 import plotly.express as px
 import subprocess
 import sys
+import json
 from collections import Counter
 import re
 from dotenv import load_dotenv
+from customer_intent_scraper.analysis import ANALYSIS_FIELDS
+from customer_intent_scraper.db import load_content
+from customer_intent_scraper.schema import apply_migrations, table_columns
+from customer_intent_scraper.search import search_discussion_ids
 
 load_dotenv()
 
@@ -106,11 +111,16 @@ with st.sidebar.expander("Run Analysis"):
     
     if analysis_type == "Local (Keyword)":
         st.write("Fast, free, runs offline using keyword matching.")
+        full_refit = st.checkbox("Re-cluster everything", value=False,
+                                 help="By default only new or changed discussions are labelled with the saved topic model.")
         if st.button("Run Local Analysis"):
             st.info("Analysis started...")
             try:
+                command = [sys.executable, "analyze_local.py"]
+                if not full_refit:
+                    command.append("--incremental")
                 result = subprocess.run(
-                    [sys.executable, "analyze_local.py"],
+                    command,
                     capture_output=True,
                     text=True
                 )
@@ -186,24 +196,29 @@ def load_data(ttl_hash=None):
         
     try:
         conn = sqlite3.connect(db_path)
-        query = "SELECT * FROM discussions"
+        apply_migrations(conn)
+        # Everything but the post bodies (loaded on demand by load_contents) and the
+        # legacy analysis_* columns: results come from the discussion_analysis view,
+        # which prefers LLM results over the local keyword/cluster labels
+        columns = [
+            f"d.{col}" for col in table_columns(conn, "discussions")
+            if col != "content" and not col.startswith("analysis_")
+        ]
+        analysis_columns = [f"a.{col}" for col in ANALYSIS_FIELDS]
+        query = f"""
+            SELECT {', '.join(columns + analysis_columns)}
+            FROM discussions d
+            JOIN discussion_analysis a ON a.discussion_id = d.id
+        """
         df = pd.read_sql_query(query, conn)
         conn.close()
         
         # Convert date
         if "publish_date" in df.columns:
             df["publish_date"] = pd.to_datetime(df["publish_date"], errors='coerce')
-            
-        # Rename analysis columns to match expected format
-        column_mapping = {
-            "analysis_category": "category",
-            "analysis_product_area": "product_area",
-            "analysis_sentiment": "sentiment",
-            "analysis_intent": "intent",
-            "analysis_author_role": "author_role",
-            "analysis_cluster_id": "cluster_id"
-        }
-        df = df.rename(columns=column_mapping)
+
+        # Stored as JSON text
+        df["pain_points"] = df["pain_points"].map(lambda v: json.loads(v) if v else [])
         
         # Normalize sub_source to lowercase to merge duplicates
         if "sub_source" in df.columns:
@@ -214,6 +229,37 @@ def load_data(ttl_hash=None):
         st.error(f"Error loading database: {e}")
         return pd.DataFrame()
 
+@st.cache_data
+def load_contents(table, ids, ttl_hash=None):
+    # Post bodies by id, decompressed if stored compressed
+    del ttl_hash
+    conn = sqlite3.connect("discussions.db")
+    try:
+        return load_content(conn, table, list(ids))
+    finally:
+        conn.close()
+
+def with_content(frame, ttl_hash=None):
+    # title + body of each row, for keyword extraction
+    contents = load_contents("discussions", tuple(frame["id"]), ttl_hash=ttl_hash)
+    return frame["title"].fillna("") + " " + frame["id"].map(contents).fillna("")
+
+@st.cache_data
+def load_replies(discussion_id, ttl_hash=None):
+    # Only the selected thread's replies, via idx_replies_parent_id
+    conn = sqlite3.connect("discussions.db")
+    try:
+        replies = pd.read_sql_query(
+            "SELECT id, author, publish_date FROM replies WHERE parent_id = ? ORDER BY publish_date",
+            conn,
+            params=(discussion_id,)
+        )
+    finally:
+        conn.close()
+    contents = load_contents("replies", tuple(replies["id"]), ttl_hash=ttl_hash)
+    replies["content"] = replies["id"].map(contents)
+    return replies
+
 # Get the last modification time of the db to force cache invalidation if it changes
 db_path = "discussions.db"
 last_updated = os.path.getmtime(db_path) if os.path.exists(db_path) else 0
@@ -248,12 +294,22 @@ else:
                 filtered_df = filtered_df[filtered_df["sub_source"] == selected_sub_source]
 
         # Search
-        search_term = st.sidebar.text_input("Search (Title/Content)")
+        search_term = st.sidebar.text_input(
+            "Search (Title/Content/Replies)",
+            help='Words must all match. Use "quotes" for phrases and a trailing * for prefixes (e.g. licens*).'
+        )
         if search_term:
-            filtered_df = filtered_df[
-                filtered_df["title"].str.contains(search_term, case=False, na=False) | 
-                filtered_df["content"].str.contains(search_term, case=False, na=False)
-            ]
+            matches = search_discussion_ids(db_path, search_term, limit=5000)
+            if matches is not None:
+                # FTS5 index: ranked by relevance, includes discussions matched through replies
+                ranks = {discussion_id: position for position, (discussion_id, _) in enumerate(matches)}
+                filtered_df = filtered_df[filtered_df["id"].isin(ranks)]
+                filtered_df = filtered_df.sort_values("id", key=lambda ids: ids.map(ranks))
+            else:
+                # No FTS index (old SQLite build): plain substring scan of titles and content
+                filtered_df = filtered_df[
+                    with_content(filtered_df, ttl_hash=last_updated).str.contains(search_term, case=False, na=False, regex=False)
+                ]
 
         # Category Filter (if analyzed)
         if "category" in filtered_df.columns:
@@ -387,15 +443,16 @@ else:
                     st.markdown("**Pain Points:**")
                     for pp in item["pain_points"]:
                         st.markdown(f"- {pp}")
-                if "summary" in item:
+                if item.get("summary"):
                     st.markdown(f"**Summary:** {item['summary']}")
 
             with st.expander("Full Content", expanded=True):
-                st.write(item.get("content", ""))
+                st.write(load_contents("discussions", (item["id"],), ttl_hash=last_updated).get(item["id"], ""))
 
-            if "replies" in item and isinstance(item["replies"], list):
-                st.markdown(f"#### Replies ({len(item['replies'])})")
-                for reply in item["replies"]:
+            replies = load_replies(item["id"], ttl_hash=last_updated).to_dict("records")
+            if replies:
+                st.markdown(f"#### Replies ({len(replies)})")
+                for reply in replies:
                     st.markdown("---")
                     st.markdown(f"**{reply.get('author', 'Unknown')}** ({reply.get('publish_date', '')})")
                     st.write(reply.get("content", ""))
@@ -442,7 +499,7 @@ else:
                 st.markdown("### 🛡️ IT Admin")
                 admin_df = topic_df[topic_df["author_role"] == "IT Admin"]
                 if not admin_df.empty:
-                    keywords = get_top_keywords(admin_df["title"] + " " + admin_df["content"])
+                    keywords = get_top_keywords(with_content(admin_df, ttl_hash=last_updated))
                     st.markdown("**Top Keywords:**")
                     st.write(", ".join([f"*{k[0]}*" for k in keywords]))
                     
@@ -457,7 +514,7 @@ else:
                 st.markdown("### 💻 Developer")
                 dev_df = topic_df[topic_df["author_role"] == "Developer"]
                 if not dev_df.empty:
-                    keywords = get_top_keywords(dev_df["title"] + " " + dev_df["content"])
+                    keywords = get_top_keywords(with_content(dev_df, ttl_hash=last_updated))
                     st.markdown("**Top Keywords:**")
                     st.write(", ".join([f"*{k[0]}*" for k in keywords]))
                     
@@ -472,7 +529,7 @@ else:
                 st.markdown("### 👤 End User")
                 user_df = topic_df[topic_df["author_role"] == "End User"]
                 if not user_df.empty:
-                    keywords = get_top_keywords(user_df["title"] + " " + user_df["content"])
+                    keywords = get_top_keywords(with_content(user_df, ttl_hash=last_updated))
                     st.markdown("**Top Keywords:**")
                     st.write(", ".join([f"*{k[0]}*" for k in keywords]))
                     
@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from customer_intent_scraper.classifier import DEFAULT_TAXONOMIES, KeywordClassifier
+from customer_intent_scraper.ratelimit import TokenBucket
+from customer_intent_scraper.shaping import estimate_tokens
+
+# Local stand-in for an Azure OpenAI chat deployment, for load-testing and
+# benchmarking analyze_intent.py without credentials or spend.
+#
+# Answers chat completions with deterministic JSON analyses (the same text
+# always gets the same answer), derived from the keyword taxonomies. Both
+# prompt formats of analyze_intent.py are understood: a single thread, and
+# packed <discussion id="..."> blocks answered as {"results": [...]}.
+# Latency, rate limits, 429 bursts, server errors and malformed or
+# incomplete answers are configurable. Point analyze_intent.py at it with:
+#
+#   python azure_openai_emulator.py --latency-ms 800 --rpm 300 --tpm 60000
+#   AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8081 AZURE_OPENAI_API_KEY=local \
+#       AZURE_OPENAI_DEPLOYMENT_NAME=emulated python analyze_intent.py --limit 0
+
+DISCUSSION_RE = re.compile(r'<discussion id="([^"]*)">(.*?)</discussion>', re.S)
+THREAD_RE = re.compile(r"Title:(.*?)\n\s*Content:(.*?)(?:\n\s*Most helpful replies:|\n\s*Provide the output|$)", re.S)
+SENTENCE_RE = re.compile(r"[^.!?]+[.!?]?")
+
+
+class EmulatorState:
+    def __init__(self, classifier, latency_ms=0.0, latency_dist="fixed", ms_per_token=0.0,
+                 rpm=0, tpm=0, rate_429=0.0, burst_every=0.0, burst_seconds=0.0,
+                 error_rate=0.0, malformed_rate=0.0, drop_rate=0.0, seed=0):
+        self.classifier = classifier
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.ms_per_token = ms_per_token
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.rate_429 = rate_429
+        self.burst_every = burst_every
+        self.burst_seconds = burst_seconds
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters = {}
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def roll(self, probability):
+        if probability <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < probability
+
+    def delay(self, completion_tokens):
+        ms = self.ms_per_token * completion_tokens
+        if self.latency_ms > 0:
+            with self.lock:
+                if self.latency_dist == "uniform":
+                    ms += self.rng.uniform(0, 2 * self.latency_ms)
+                elif self.latency_dist == "exponential":
+                    ms += self.rng.expovariate(1.0 / self.latency_ms)
+                elif self.latency_dist == "lognormal":
+                    # sigma=1 lognormal with the requested mean
+                    ms += self.rng.lognormvariate(math.log(self.latency_ms) - 0.5, 1.0)
+                else:
+                    ms += self.latency_ms
+        return ms / 1000.0
+
+    def in_burst(self):
+        # Every burst_every seconds the deployment throttles everything for burst_seconds
+        if self.burst_every <= 0:
+            return 0.0
+        into = (time.monotonic() - self.started) % self.burst_every
+        return max(0.0, self.burst_seconds - into)
+
+    def throttle(self, tokens):
+        """Seconds the caller should wait, or 0 when the request is within the limits."""
+        wait = self.in_burst()
+        if wait:
+            return wait
+        with self.lock:
+            if self.requests:
+                wait = self.requests.try_acquire(1)
+            if not wait and self.tokens:
+                wait = self.tokens.try_acquire(tokens)
+                if wait and self.requests:
+                    self.requests.adjust(1)
+        return wait
+
+    def remaining(self):
+        headers = {}
+        with self.lock:
+            if self.requests:
+                headers["x-ratelimit-remaining-requests"] = str(max(0, int(self.requests.available())))
+            if self.tokens:
+                headers["x-ratelimit-remaining-tokens"] = str(max(0, int(self.tokens.available())))
+        return headers
+
+
+def analyse(classifier, title, content):
+    """Deterministic analysis of one thread, in the shape analyze_intent.py asks for."""
+    text = f"{title} {content}".strip()
+    labels = classifier.classify(text)
+    sentences = [s.strip() for s in SENTENCE_RE.findall(content or title) if len(s.strip()) > 3]
+    # Sentences with a problem keyword stand in for pain points
+    pain_points = [
+        s[:160] for s in sentences
+        if classifier.scores(s)["sentiment"].get("Negative")
+    ][:3]
+    summary = (sentences[0] if sentences else title or "No content.")[:200]
+    return {
+        "category": labels["intent"],
+        "product_area": labels["product_area"],
+        "pain_points": pain_points,
+        "sentiment": labels["sentiment"],
+        "summary": summary,
+    }
+
+
+def parse_thread(block):
+    match = THREAD_RE.search(block)
+    if not match:
+        return "", block.strip()
+    return match.group(1).strip(), match.group(2).strip()
+
+
+class AzureOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "AzureOpenAIEmulator/1.0"
+    protocol_version = "HTTP/1.1"
+    state = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, code, message, headers=None):
+        return self._send(status, {"error": {"code": code, "message": message}}, headers)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/__stats":
+            with self.state.lock:
+                return self._send(200, dict(self.state.counters))
+        return self._error(404, "NotFound", "Resource not found")
+
+    def do_POST(self):
+        state = self.state
+        path = urlparse(self.path).path
+        # Azure: /openai/deployments/{deployment}/chat/completions; OpenAI: /v1/chat/completions
+        match = re.match(r"^(?:/openai/deployments/([^/]+)|/v1)?/chat/completions$", path)
+        if not match:
+            return self._error(404, "NotFound", "Resource not found")
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            return self._error(400, "BadRequest", "Invalid JSON body")
+        model = match.group(1) or payload.get("model") or "emulated"
+        messages = payload.get("messages") or []
+        prompt = "\n".join(str(m.get("content") or "") for m in messages)
+        prompt_tokens = estimate_tokens(prompt)
+
+        wait = state.throttle(prompt_tokens)
+        if wait or state.roll(state.rate_429):
+            wait = max(wait, 1.0)
+            state.count("throttled")
+            return self._error(
+                429, "429",
+                f"Requests to the ChatCompletions_Create Operation under Azure OpenAI API have exceeded the rate limit. "
+                f"Please retry after {math.ceil(wait)} seconds.",
+                headers={"retry-after": str(math.ceil(wait)), "retry-after-ms": str(int(wait * 1000))},
+            )
+        if state.roll(state.error_rate):
+            state.count("server_errors")
+            return self._error(500, "InternalServerError", "The server had an error while processing your request.")
+
+        user_prompt = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        blocks = DISCUSSION_RE.findall(user_prompt)
+        if blocks:
+            results = []
+            for discussion_id, block in blocks:
+                if state.roll(state.drop_rate):
+                    state.count("dropped_items")
+                    continue
+                results.append(dict(id=discussion_id, **analyse(state.classifier, *parse_thread(block))))
+            content = json.dumps({"results": results})
+            state.count("batched_requests")
+            state.count("batched_items", len(blocks))
+        else:
+            content = json.dumps(analyse(state.classifier, *parse_thread(user_prompt)))
+            state.count("single_requests")
+        if state.roll(state.malformed_rate):
+            # Cut short, as when the model runs out of tokens mid-answer
+            content = content[:max(1, len(content) * 2 // 3)]
+            state.count("malformed")
+
+        completion_tokens = estimate_tokens(content)
+        time.sleep(state.delay(completion_tokens))
+        state.count("prompt_tokens", prompt_tokens)
+        state.count("completion_tokens", completion_tokens)
+        return self._send(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "system_fingerprint": hashlib.sha1(model.encode("utf-8")).hexdigest()[:10],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }, headers=state.remaining())
+
+
+def make_server(host, port, state):
+    handler = type("BoundAzureOpenAIHandler", (AzureOpenAIHandler,), {"state": state})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Azure OpenAI chat completions stand-in for analyze_intent.py.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8081, help="Port to listen on")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean response latency in milliseconds")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "exponential", "lognormal"], default="fixed", help="Latency distribution")
+    parser.add_argument("--ms-per-token", type=float, default=0.0, help="Extra latency per completion token (generation speed)")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before answering 429 (0: no limit)")
+    parser.add_argument("--tpm", type=int, default=0, help="Prompt tokens per minute before answering 429 (0: no limit)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429 regardless of load")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="Seconds between throttling bursts (0: none)")
+    parser.add_argument("--burst-seconds", type=float, default=5.0, help="Length of each throttling burst")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of answers cut off mid-JSON")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of discussions left out of packed answers")
+    parser.add_argument("--taxonomies", default=DEFAULT_TAXONOMIES, help="Keyword taxonomies (JSON) the answers are derived from")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency and fault injection")
+    args = parser.parse_args()
+
+    state = EmulatorState(
+        KeywordClassifier.from_file(args.taxonomies),
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        ms_per_token=args.ms_per_token,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        rate_429=args.rate_429,
+        burst_every=args.burst_every,
+        burst_seconds=args.burst_seconds,
+        error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate,
+        drop_rate=args.drop_rate,
+        seed=args.seed,
+    )
+    server = make_server(args.host, args.port, state)
+    base_url = f"http://{args.host}:{args.port}"
+    print(f"Emulating Azure OpenAI chat completions at {base_url}")
+    print(f"Run: AZURE_OPENAI_ENDPOINT={base_url} AZURE_OPENAI_API_KEY=local "
+          f"AZURE_OPENAI_DEPLOYMENT_NAME=emulated python analyze_intent.py")
+    print(f"Request counters: {base_url}/__stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import os
+import sqlite3
+
+from customer_intent_scraper.db import ContentStore
+from customer_intent_scraper.schema import apply_migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Move long discussion/reply content into zstd-compressed blobs (see CONTENT_COMPRESSION)."
+    )
+    parser.add_argument("--db", default="discussions.db", help="Path to the SQLite database")
+    parser.add_argument("--min-bytes", type=int, default=512, help="Only compress content at least this long")
+    parser.add_argument("--level", type=int, default=10, help="zstd compression level")
+    parser.add_argument("--dict-samples", type=int, default=2000, help="Posts sampled to train the dictionary")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip VACUUM (the file only shrinks after it)")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    apply_migrations(conn)
+    store = ContentStore(
+        conn,
+        compression="zstd",
+        level=args.level,
+        min_bytes=args.min_bytes,
+        dict_samples=args.dict_samples,
+    )
+    if not store.compression:
+        print("Error: zstandard is not installed (pip install zstandard).")
+        return
+
+    size_before = os.path.getsize(args.db)
+    for table in ("discussions", "replies"):
+        moved = store.compact(table)
+        print(f"Compressed content of {moved} {table}.")
+
+    # Merge the FTS segments touched while re-indexing compressed rows
+    for table in ("discussions", "replies"):
+        fts = store.fts_table(table)
+        if fts:
+            conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('optimize')")
+    conn.commit()
+
+    if not args.no_vacuum:
+        print("Vacuuming...")
+        conn.execute("VACUUM")
+    conn.close()
+
+    size_after = os.path.getsize(args.db)
+    print(f"Database size: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import json
+
+# Results of the analysis scripts live in the analysis table (see schema.py),
+# one row per (discussion, analyzer, version), so analyze_local.py and
+# analyze_intent.py no longer overwrite each other. The discussion_analysis
+# view merges them for the app.
+
+LOCAL_ANALYZER = "local"
+LLM_ANALYZER = "llm"
+
+ANALYSIS_FIELDS = (
+    "category", "product_area", "sentiment", "intent",
+    "author_role", "cluster_id", "summary", "pain_points",
+)
+
+
+def _upsert_sql(fields):
+    columns = ("discussion_id", "analyzer", "version", "content_hash") + tuple(fields)
+    updates = [f"{col} = excluded.{col}" for col in ("content_hash",) + tuple(fields)]
+    updates.append("analysed_at = CURRENT_TIMESTAMP")
+    return f"""
+        INSERT INTO analysis ({", ".join(columns)})
+        VALUES ({", ".join("?" * len(columns))})
+        ON CONFLICT(discussion_id, analyzer, version) DO UPDATE SET {", ".join(updates)}
+    """
+
+
+def pending_filter(analyzer, version, table="discussions"):
+    """WHERE clause (and params) for discussions without a current result from this analyzer/version.
+
+    A result is current when it was made from the discussion's present
+    text_hash, so edited posts come back automatically (and posts whose only
+    change is a kudos or reply count do not).
+    """
+    return f"""NOT EXISTS (
+        SELECT 1 FROM analysis a
+        WHERE a.discussion_id = {table}.id AND a.analyzer = ? AND a.version = ?
+          AND a.content_hash IS {table}.text_hash
+    )""", (analyzer, version)
+
+
+def changed_since_filter(since):
+    """Discussions scraped or changed at or after ``since`` ("YYYY-MM-DD[ HH:MM:SS]", UTC)."""
+    return "COALESCE(discussions.updated_at, discussions.scraped_at) >= ?", (since,)
+
+
+def platform_filter(platform):
+    return "discussions.platform = ?", (platform,)
+
+
+def selection_filters(args):
+    """Filters for the --since/--platform options shared by the analysis scripts."""
+    filters = []
+    if args.since:
+        filters.append(changed_since_filter(args.since))
+    if args.platform:
+        filters.append(platform_filter(args.platform))
+    return filters
+
+
+class AnalysisStore:
+    """Bulk writer for one analyzer's results.
+
+    ``write`` takes ``(discussion_id, text_hash, analysis)`` tuples and
+    upserts them with a single executemany in one transaction. ``fields``
+    limits the write to some columns, leaving the others of an existing row
+    alone. With ``supersede`` the analyzer's rows from other versions are
+    dropped in the same transaction (see ``supersede``). The schema must
+    already be migrated (apply_migrations).
+    """
+
+    def __init__(self, conn, analyzer, version):
+        self.conn = conn
+        self.analyzer = analyzer
+        self.version = str(version)
+        self.statements = {}
+
+    def write(self, results, fields=ANALYSIS_FIELDS, supersede=False):
+        fields = tuple(fields)
+        rows = []
+        for discussion_id, content_hash, analysis in results:
+            values = []
+            for field in fields:
+                value = analysis.get(field)
+                if field == "pain_points" and value is not None and not isinstance(value, str):
+                    value = json.dumps(value)
+                values.append(value)
+            rows.append((discussion_id, self.analyzer, self.version, content_hash, *values))
+        if not rows:
+            return 0
+
+        if fields not in self.statements:
+            self.statements[fields] = _upsert_sql(fields)
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.executemany(self.statements[fields], rows)
+            if supersede:
+                self._delete_superseded(cursor)
+        return len(rows)
+
+    def supersede(self):
+        """Drop this analyzer's rows from other versions for discussions this version has labelled.
+
+        Each full refit of analyze_local gets a new version; without this the
+        old ones pile up. Discussions outside the refit (--since/--platform)
+        keep their older result.
+        """
+        with self.conn:
+            return self._delete_superseded(self.conn.cursor())
+
+    def _delete_superseded(self, cursor):
+        cursor.execute(
+            """DELETE FROM analysis
+               WHERE analyzer = ? AND version != ? AND discussion_id IN (
+                   SELECT discussion_id FROM analysis WHERE analyzer = ? AND version = ?
+               )""",
+            (self.analyzer, self.version, self.analyzer, self.version),
+        )
+        return cursor.rowcount
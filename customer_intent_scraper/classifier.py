@@ -0,0 +1,162 @@
+import json
+import os
+import re
+
+# Keyword labelling for the local analyzer. Every keyword of every taxonomy is
+# compiled into one regex (a trie of alternatives, longest first), so a
+# document is lowercased and scanned once no matter how many keywords there
+# are; the few keywords that start with punctuation ("?") get a second, tiny
+# regex. Keywords live in taxonomies.json:
+#
+#   "intent": {
+#       "decision": "priority",          # first label with a hit wins ("max": highest score)
+#       "default": "General Discussion", # no hit (or a tie under "max")
+#       "labels": {"Bug/Issue": ["error*", "not working", ...], ...}
+#   }
+#
+# Keywords match whole words; a trailing "*" makes one a prefix ("licens*"
+# matches "license" and "licensing"). A keyword's score is 1 however often it
+# occurs, so a label's score is the number of its distinct keywords found.
+
+DEFAULT_TAXONOMIES = os.path.join(os.path.dirname(__file__), "taxonomies.json")
+
+WORD_CHAR_RE = re.compile(r"\w")
+
+
+def _is_word_char(char):
+    return bool(WORD_CHAR_RE.match(char))
+
+
+class _Keyword:
+    def __init__(self, text):
+        self.prefix = text.endswith("*")
+        self.literal = text.rstrip("*").lower()
+        if not self.literal:
+            raise ValueError(f"Empty keyword: {text!r}")
+        self.entries = []  # (taxonomy, label) pairs it counts for
+
+    def matches_start_of(self, other):
+        # Would this keyword also match wherever ``other`` matched?
+        if not other.literal.startswith(self.literal):
+            return False
+        if len(other.literal) == len(self.literal):
+            # "pay*" is implied by "pay", but "pay*" may have matched "payment"
+            return self.prefix or not other.prefix
+        # Exact keywords need a word boundary where they end
+        return self.prefix or not (
+            _is_word_char(self.literal[-1]) and _is_word_char(other.literal[len(self.literal)])
+        )
+
+
+def _trie_regex(keywords, group_of):
+    # Nested alternation over the keywords' characters; an empty group marks
+    # where each keyword ends. Longer continuations are tried first, so the
+    # match at a position is always the longest keyword found there.
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword.literal:
+            node = node.setdefault(char, {})
+        node.setdefault("", []).append(keyword)
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        for keyword in sorted(node.get("", []), key=lambda k: k.prefix):
+            boundary = "" if keyword.prefix or not _is_word_char(keyword.literal[-1]) else r"(?!\w)"
+            branches.append(f"{boundary}()")
+            group_of.append(keyword)
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return build(trie)
+
+
+class KeywordClassifier:
+    """Scores documents against several keyword taxonomies in one pass."""
+
+    def __init__(self, taxonomies):
+        self.taxonomies = taxonomies
+        keywords = {}
+        for taxonomy, spec in taxonomies.items():
+            for label, words in spec["labels"].items():
+                for word in words:
+                    key = word.lower()
+                    keyword = keywords.get(key)
+                    if keyword is None:
+                        keyword = keywords[key] = _Keyword(key)
+                    keyword.entries.append((taxonomy, label))
+
+        # Keywords starting with a word character must start a word; others ("?") match anywhere
+        word_start = [k for k in keywords.values() if _is_word_char(k.literal[0])]
+        anywhere = [k for k in keywords.values() if not _is_word_char(k.literal[0])]
+        # (regex, group number -> keyword); the zero-width lookahead lets matches
+        # overlap ("exchange server" and "server")
+        self.patterns = []
+        for keywords_group, anchor in ((word_start, r"\b"), (anywhere, "")):
+            if keywords_group:
+                group_of = [None]
+                trie = _trie_regex(keywords_group, group_of)
+                self.patterns.append((re.compile(f"{anchor}(?={trie})"), group_of))
+
+        # The regex only reports the longest keyword at each position; shorter
+        # keywords matching there too are derived from it
+        self.implied = {}
+        for keyword in keywords.values():
+            self.implied[id(keyword)] = [
+                other for other in keywords.values()
+                if other is not keyword and other.matches_start_of(keyword)
+            ]
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_TAXONOMIES):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def keywords_in(self, text):
+        """Distinct keywords found in ``text``."""
+        found = {}
+        if not text:
+            return found.values()
+        text = text.lower()
+        for pattern, group_of in self.patterns:
+            for match in pattern.finditer(text):
+                keyword = group_of[match.lastindex]
+                found[id(keyword)] = keyword
+                for other in self.implied[id(keyword)]:
+                    found[id(other)] = other
+        return found.values()
+
+    def scores(self, text):
+        """``{taxonomy: {label: score}}`` with a score for every label (0 when absent)."""
+        result = {
+            taxonomy: {label: 0 for label in spec["labels"]}
+            for taxonomy, spec in self.taxonomies.items()
+        }
+        for keyword in self.keywords_in(text):
+            for taxonomy, label in keyword.entries:
+                result[taxonomy][label] += 1
+        return result
+
+    def decide(self, taxonomy, scores):
+        spec = self.taxonomies[taxonomy]
+        default = spec.get("default")
+        if spec.get("decision", "priority") == "max":
+            best = max(scores.values(), default=0)
+            winners = [label for label, score in scores.items() if score == best]
+            return winners[0] if best > 0 and len(winners) == 1 else default
+        for label, score in scores.items():
+            if score > 0:
+                return label
+        return default
+
+    def classify(self, text):
+        """``{taxonomy: label}`` for one document."""
+        return {
+            taxonomy: self.decide(taxonomy, label_scores)
+            for taxonomy, label_scores in self.scores(text).items()
+        }
+
+    def scores_many(self, texts):
+        return [self.scores(text) for text in texts]
+
+    def classify_many(self, texts):
+        return [self.classify(text) for text in texts]
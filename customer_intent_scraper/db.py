@@ -0,0 +1,574 @@
+import hashlib
+import json
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Column order of the row tuples built by the scrapers
+DISCUSSION_COLUMNS = (
+    "id", "source_id", "platform", "sub_source", "title", "author",
+    "publish_date", "content", "url", "reply_count", "thumbs_up_count", "canonical_id",
+)
+REPLY_COLUMNS = ("id", "parent_id", "author", "publish_date", "content", "thumbs_up_count")
+
+# Set by optional stages (e.g. deduplication); a NULL from a writer without
+# that stage must not wipe a value stored earlier
+KEEP_EXISTING_COLUMNS = ("canonical_id",)
+
+# The text the analysis scripts read. text_hash covers only these, so a new
+# kudos or reply count does not send a post back for (paid) re-analysis;
+# content_hash covers every scraped column and decides whether a row is rewritten.
+ANALYSED_COLUMNS = ("title", "content")
+
+
+def content_hash(values):
+    """Stable hash of a list of values."""
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _hash_indexes(columns):
+    # Everything scraped except the id and columns a writer may leave NULL
+    return [i for i, col in enumerate(columns) if col != "id" and col not in KEEP_EXISTING_COLUMNS]
+
+
+DISCUSSION_HASH_INDEXES = _hash_indexes(DISCUSSION_COLUMNS)
+REPLY_HASH_INDEXES = _hash_indexes(REPLY_COLUMNS)
+TEXT_HASH_INDEXES = [DISCUSSION_COLUMNS.index(col) for col in ANALYSED_COLUMNS]
+
+
+def row_hash(row, indexes):
+    return content_hash(row[i] for i in indexes)
+
+
+def text_hash(title, content):
+    """Hash of a discussion's analysed text; results made from another hash are stale."""
+    return content_hash((title, content))
+
+
+def _upsert_sql(table, columns):
+    insert_columns = list(columns) + ["content_hash", "updated_at"]
+    placeholders = ["?"] * (len(columns) + 1) + ["CURRENT_TIMESTAMP"]
+    if table == "discussions":
+        insert_columns.insert(-1, "text_hash")
+        placeholders.insert(-1, "?")
+    updates = [
+        f"{col} = COALESCE(excluded.{col}, {table}.{col})" if col in KEEP_EXISTING_COLUMNS
+        else f"{col} = excluded.{col}"
+        for col in insert_columns if col != "id"
+    ]
+    # The WHERE clause turns unchanged rows into no-ops: no row write, no index churn,
+    # and scraped_at plus any analysis_* columns survive a re-crawl
+    return f"""
+        INSERT INTO {table} ({", ".join(insert_columns)})
+        VALUES ({", ".join(placeholders)})
+        ON CONFLICT(id) DO UPDATE SET {", ".join(updates)}
+        WHERE {_changed_sql(table, columns)}
+    """
+
+
+def _changed_sql(table, columns):
+    # Changed scraped values, or a value for a column that is not hashed
+    # (a NULL from a writer without that stage is not a change)
+    changed = [f"{table}.content_hash IS NOT excluded.content_hash"]
+    changed += [
+        f"(excluded.{col} IS NOT NULL AND {table}.{col} IS NOT excluded.{col})"
+        for col in columns if col in KEEP_EXISTING_COLUMNS
+    ]
+    return " OR ".join(changed)
+
+
+UPSERT_DISCUSSION_SQL = _upsert_sql("discussions", DISCUSSION_COLUMNS)
+UPSERT_REPLY_SQL = _upsert_sql("replies", REPLY_COLUMNS)
+
+
+def _with_hashes(rows, indexes, text_indexes=None):
+    rows = [tuple(row) for row in rows]
+    if text_indexes is None:
+        return [row + (row_hash(row, indexes),) for row in rows]
+    return [row + (row_hash(row, indexes), row_hash(row, text_indexes)) for row in rows]
+
+
+def _existing(cursor, table, ids):
+    # id -> (content_hash, *KEEP_EXISTING columns of the table)
+    keep = [col for col in TABLE_COLUMNS[table] if col in KEEP_EXISTING_COLUMNS]
+    select = ", ".join(["id", "content_hash"] + keep)
+    existing = {}
+    for chunk in _chunks(ids):
+        marks = ", ".join("?" * len(chunk))
+        for row in cursor.execute(f"SELECT {select} FROM {table} WHERE id IN ({marks})", chunk):
+            existing[row[0]] = row[1:]
+    return existing
+
+
+def _is_changed(table, row, row_hash_value, old):
+    # Python side of _changed_sql
+    if old is MISSING or old[0] != row_hash_value:
+        return True
+    columns = TABLE_COLUMNS[table]
+    keep = [columns.index(col) for col in columns if col in KEEP_EXISTING_COLUMNS]
+    return any(row[i] is not None and row[i] != value for i, value in zip(keep, old[1:]))
+
+
+def _changed_rows(cursor, table, rows):
+    # The rows an upsert would write (last one wins per id), the stored hashes and the new ones
+    latest = {row[0]: tuple(row) for row in rows}
+    hashes = {row_id: row_hash(row, HASH_INDEXES[table]) for row_id, row in latest.items()}
+    existing = _existing(cursor, table, latest)
+    changed = [
+        row for row_id, row in latest.items()
+        if _is_changed(table, row, hashes[row_id], existing.get(row_id, MISSING))
+    ]
+    return changed, existing, hashes
+
+
+def upsert_discussions(cursor, rows, store=None, changed=None):
+    """Insert or update discussion rows, skipping unchanged ones.
+
+    ``rows`` follow DISCUSSION_COLUMNS. Returns the number of rows actually
+    inserted or updated. Pass a ContentStore to compress long content, and a
+    set as ``changed`` to collect the ids of the rows written (costs a read).
+    """
+    return _upsert(cursor, "discussions", rows, store, changed)
+
+
+def upsert_replies(cursor, rows, store=None, changed=None):
+    """Same as upsert_discussions for reply rows (REPLY_COLUMNS)."""
+    return _upsert(cursor, "replies", rows, store, changed)
+
+
+def _upsert(cursor, table, rows, store, changed):
+    if not rows:
+        return 0
+    store = store or ContentStore(cursor.connection)
+    if not store.plain_only():
+        return store.upsert(cursor, table, rows, changed)
+    if changed is not None:
+        changed.update(row[0] for row in _changed_rows(cursor, table, rows)[0])
+    if table == "discussions":
+        cursor.executemany(UPSERT_DISCUSSION_SQL, _with_hashes(rows, DISCUSSION_HASH_INDEXES, TEXT_HASH_INDEXES))
+    else:
+        cursor.executemany(UPSERT_REPLY_SQL, _with_hashes(rows, REPLY_HASH_INDEXES))
+    return cursor.rowcount
+
+
+
+# Compressed content. Long content can be moved out of discussions/replies into
+# content_blobs (zstd, optionally with a dictionary trained on our own posts);
+# the row keeps content = NULL and content_compressed = 1. List queries never
+# read the blobs; ContentStore.load() decompresses on demand. The FTS triggers
+# skip compressed rows, so their index entries are maintained here instead.
+
+FTS_COLUMNS = {
+    "discussions": ("title", "content"),
+    "replies": ("content",),
+}
+TABLE_COLUMNS = {
+    "discussions": DISCUSSION_COLUMNS,
+    "replies": REPLY_COLUMNS,
+}
+HASH_INDEXES = {
+    "discussions": DISCUSSION_HASH_INDEXES,
+    "replies": REPLY_HASH_INDEXES,
+}
+MISSING = object()
+
+
+def _store_upsert_sql(table):
+    columns = list(TABLE_COLUMNS[table]) + ["content_compressed", "content_hash"]
+    if table == "discussions":
+        columns.append("text_hash")
+    placeholders = ["?"] * len(columns)
+    updates = [
+        f"{col} = COALESCE(excluded.{col}, {table}.{col})" if col in KEEP_EXISTING_COLUMNS
+        else f"{col} = excluded.{col}"
+        for col in columns if col != "id"
+    ]
+    columns.append("updated_at")
+    placeholders.append("CURRENT_TIMESTAMP")
+    updates.append("updated_at = excluded.updated_at")
+    return f"""
+        INSERT INTO {table} ({", ".join(columns)})
+        VALUES ({", ".join(placeholders)})
+        ON CONFLICT(id) DO UPDATE SET {", ".join(updates)}
+    """
+
+
+STORE_UPSERT_SQL = {table: _store_upsert_sql(table) for table in TABLE_COLUMNS}
+
+
+def _chunks(values, size=500):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class ContentStore:
+    """Reads and writes the content of discussions and replies.
+
+    With ``compression="zstd"`` (needs zstandard), content of at least
+    ``min_bytes`` is stored compressed in content_blobs. Until a dictionary
+    exists, blobs are plain zstd frames; once ``dict_samples`` texts have been
+    seen a dictionary is trained from them and used for every later blob.
+    Without compression the store still reads compressed rows and converts
+    them back to plain content when they change.
+    """
+
+    def __init__(self, conn, compression=None, level=10, min_bytes=512, dict_size=112640, dict_samples=2000):
+        if compression not in (None, "", "none", "zstd"):
+            raise ValueError(f"Unknown content compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed; content will be stored uncompressed")
+            compression = None
+        self.conn = conn
+        self.compression = compression if compression == "zstd" else None
+        self.level = level
+        self.min_bytes = min_bytes
+        self.dict_size = dict_size
+        self.dict_samples = dict_samples
+        self.samples = {}
+        self.dictionaries = {}    # table -> (dict_id, ZstdCompressionDict) used for writing
+        self.decompressors = {}   # dict_id -> ZstdDecompressor
+        self.compressors = {}     # dict_id -> ZstdCompressor
+        self._plain_only = None
+        self._fts = {}
+
+    def plain_only(self):
+        # Fast path for the common case: nothing to compress, nothing compressed yet
+        if self.compression:
+            return False
+        if self._plain_only is None:
+            try:
+                row = self.conn.execute("SELECT 1 FROM content_blobs LIMIT 1").fetchone()
+            except Exception:
+                row = None  # schema predates content_blobs
+            self._plain_only = row is None
+        return self._plain_only
+
+    def fts_table(self, table):
+        if table not in self._fts:
+            name = f"{table}_fts"
+            row = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+            self._fts[table] = name if row else None
+        return self._fts[table]
+
+    # Reading
+
+    def decompressor(self, dict_id):
+        if dict_id not in self.decompressors:
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read compressed content")
+            if dict_id:
+                row = self.conn.execute(
+                    "SELECT data FROM content_dictionaries WHERE dict_id = ?", (dict_id,)
+                ).fetchone()
+                self.decompressors[dict_id] = zstandard.ZstdDecompressor(
+                    dict_data=zstandard.ZstdCompressionDict(row[0])
+                )
+            else:
+                self.decompressors[dict_id] = zstandard.ZstdDecompressor()
+        return self.decompressors[dict_id]
+
+    def load(self, table, ids):
+        """Content for the given ids as ``{id: text}``, decompressing where needed."""
+        contents = {}
+        for chunk in _chunks(ids):
+            marks = ", ".join("?" * len(chunk))
+            compressed = []
+            for row_id, content, is_compressed in self.conn.execute(
+                f"SELECT id, content, content_compressed FROM {table} WHERE id IN ({marks})", chunk
+            ):
+                if is_compressed:
+                    compressed.append(row_id)
+                else:
+                    contents[row_id] = content
+            if compressed:
+                marks = ", ".join("?" * len(compressed))
+                for row_id, dict_id, data in self.conn.execute(
+                    f"SELECT id, dict_id, data FROM content_blobs WHERE kind = ? AND id IN ({marks})",
+                    [table] + compressed
+                ):
+                    contents[row_id] = self.decompressor(dict_id).decompress(data).decode("utf-8")
+        return contents
+
+    def fill(self, table, records):
+        """Fill in ``content`` of dict records whose content is stored compressed."""
+        missing = [r["id"] for r in records if r.get("content") is None and r.get("content_compressed")]
+        if missing:
+            contents = self.load(table, missing)
+            for record in records:
+                if record["id"] in contents:
+                    record["content"] = contents[record["id"]]
+        return records
+
+    # Writing
+
+    def compress(self, table, text):
+        """Returns ``(dict_id, blob)``, or None when the text stays inline."""
+        if not self.compression or not text:
+            return None
+        raw = text.encode("utf-8")
+        if len(raw) < self.min_bytes:
+            return None
+
+        if table not in self.dictionaries:
+            row = self.conn.execute(
+                "SELECT dict_id, data FROM content_dictionaries WHERE kind = ? ORDER BY created_at DESC, rowid DESC LIMIT 1",
+                (table,)
+            ).fetchone()
+            if row:
+                self.dictionaries[table] = (row[0], zstandard.ZstdCompressionDict(row[1]))
+            else:
+                self.collect_sample(table, raw)
+
+        dict_id, dictionary = self.dictionaries.get(table, (0, None))
+        if dict_id not in self.compressors:
+            self.compressors[dict_id] = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+        return dict_id, self.compressors[dict_id].compress(raw)
+
+    def collect_sample(self, table, raw):
+        samples = self.samples.setdefault(table, [])
+        samples.append(raw)
+        if len(samples) >= self.dict_samples:
+            self.train_dictionary(table, samples)
+
+    def train_dictionary(self, table, samples):
+        # A dictionary much larger than a tenth of its training data only adds overhead
+        dict_size = min(self.dict_size, max(4096, sum(len(sample) for sample in samples) // 10))
+        try:
+            dictionary = zstandard.train_dictionary(dict_size, samples)
+        except zstandard.ZstdError as e:
+            # Too few / too uniform samples: keep collecting and try again later
+            logger.info(f"Could not train a zstd dictionary for {table} yet: {e}")
+            self.dict_samples *= 2
+            return
+        # The dictionary row is written together with the first blobs that use it
+        self.dictionaries[table] = (dictionary.dict_id(), dictionary)
+        self.samples.pop(table, None)
+        logger.info(f"Trained zstd dictionary {dictionary.dict_id()} for {table} from {len(samples)} samples")
+
+    def _previous(self, cursor, table, ids):
+        # Old values of rows about to change: rowid, FTS columns, compressed flag
+        previous = {}
+        fts_columns = ", ".join(FTS_COLUMNS[table])
+        for chunk in _chunks(ids):
+            marks = ", ".join("?" * len(chunk))
+            for row in cursor.execute(
+                f"SELECT id, rowid, content_compressed, {fts_columns} FROM {table} WHERE id IN ({marks})", chunk
+            ):
+                previous[row[0]] = row[1:]
+        compressed = [row_id for row_id, values in previous.items() if values[1]]
+        texts = self.load(table, compressed) if compressed else {}
+        for row_id in compressed:
+            values = list(previous[row_id])
+            values[-1] = texts.get(row_id)
+            previous[row_id] = tuple(values)
+        return previous
+
+    def upsert(self, cursor, table, rows, changed_ids=None):
+        """Change-detecting upsert that stores long content compressed."""
+        columns = TABLE_COLUMNS[table]
+        content_index = columns.index("content")
+        fts_indexes = [columns.index(col) for col in FTS_COLUMNS[table]]
+
+        changed, existing, hashes = _changed_rows(cursor, table, rows)
+        if changed_ids is not None:
+            changed_ids.update(row[0] for row in changed)
+        if not changed:
+            return 0
+
+        previous = self._previous(cursor, table, [row[0] for row in changed if row[0] in existing])
+        fts = self.fts_table(table)
+        fts_names = ", ".join(FTS_COLUMNS[table])
+        fts_marks = ", ".join("?" * len(fts_indexes))
+
+        params, blobs, dictionaries, stale_blobs, fts_deletes, fts_inserts = [], [], {}, [], [], {}
+        for row in changed:
+            row_id = row[0]
+            old = previous.get(row_id)
+            if old and old[1]:
+                # Was compressed: its FTS entry and blob are ours to remove
+                stale_blobs.append((table, row_id))
+                if fts:
+                    fts_deletes.append((old[0],) + tuple(old[2:]))
+
+            packed = self.compress(table, row[content_index])
+            stored = list(row)
+            if packed:
+                dict_id, blob = packed
+                blobs.append((table, row_id, dict_id, blob))
+                if dict_id:
+                    dictionaries[dict_id] = self.dictionaries[table][1]
+                stored[content_index] = None
+                if fts:
+                    fts_inserts[row_id] = tuple(row[i] for i in fts_indexes)
+            param = tuple(stored) + (1 if packed else 0, hashes[row_id])
+            if table == "discussions":
+                param += (row_hash(row, TEXT_HASH_INDEXES),)
+            params.append(param)
+
+        if fts_deletes:
+            cursor.executemany(
+                f"INSERT INTO {fts}({fts}, rowid, {fts_names}) VALUES ('delete', ?, {fts_marks})", fts_deletes
+            )
+        if stale_blobs:
+            cursor.executemany("DELETE FROM content_blobs WHERE kind = ? AND id = ?", stale_blobs)
+        if dictionaries:
+            cursor.executemany(
+                "INSERT OR IGNORE INTO content_dictionaries (dict_id, kind, data) VALUES (?, ?, ?)",
+                [(dict_id, table, dictionary.as_bytes()) for dict_id, dictionary in dictionaries.items()]
+            )
+        if blobs:
+            cursor.executemany(
+                "INSERT OR REPLACE INTO content_blobs (kind, id, dict_id, data) VALUES (?, ?, ?, ?)", blobs
+            )
+
+        cursor.executemany(STORE_UPSERT_SQL[table], params)
+        written = cursor.rowcount
+
+        if fts_inserts:
+            rowids = {}
+            for chunk in _chunks(fts_inserts):
+                marks = ", ".join("?" * len(chunk))
+                rowids.update(cursor.execute(f"SELECT id, rowid FROM {table} WHERE id IN ({marks})", chunk).fetchall())
+            cursor.executemany(
+                f"INSERT INTO {fts}(rowid, {fts_names}) VALUES (?, {fts_marks})",
+                [(rowids[row_id],) + values for row_id, values in fts_inserts.items()]
+            )
+        if blobs:
+            self._plain_only = False
+        return written
+
+    def compact(self, table, batch_size=500):
+        """Move existing inline content of ``min_bytes`` or more into content_blobs."""
+        if not self.compression:
+            raise ValueError("compact() needs compression='zstd'")
+
+        if table not in self.dictionaries and not self.conn.execute(
+            "SELECT 1 FROM content_dictionaries WHERE kind = ?", (table,)
+        ).fetchone():
+            # Train on a random sample of what is already stored
+            samples = [
+                row[0].encode("utf-8") for row in self.conn.execute(
+                    f"SELECT content FROM {table} WHERE content_compressed = 0 AND length(content) >= ? ORDER BY RANDOM() LIMIT ?",
+                    (self.min_bytes, self.dict_samples)
+                )
+            ]
+            if samples:
+                self.train_dictionary(table, samples)
+
+        fts = self.fts_table(table)
+        fts_columns = FTS_COLUMNS[table]
+        moved = 0
+        while True:
+            rows = self.conn.execute(
+                f"SELECT id, rowid, {', '.join(fts_columns)} FROM {table} "
+                f"WHERE content_compressed = 0 AND length(content) >= ? LIMIT ?",
+                (self.min_bytes, batch_size)
+            ).fetchall()
+            if not rows:
+                return moved
+            with self.conn:
+                for row_id, rowid, *values in rows:
+                    dict_id, blob = self.compress(table, values[-1])
+                    if dict_id:
+                        self.conn.execute(
+                            "INSERT OR IGNORE INTO content_dictionaries (dict_id, kind, data) VALUES (?, ?, ?)",
+                            (dict_id, table, self.dictionaries[table][1].as_bytes())
+                        )
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO content_blobs (kind, id, dict_id, data) VALUES (?, ?, ?, ?)",
+                        (table, row_id, dict_id, blob)
+                    )
+                    # The FTS update trigger removes the inline entry...
+                    self.conn.execute(
+                        f"UPDATE {table} SET content = NULL, content_compressed = 1 WHERE id = ?", (row_id,)
+                    )
+                    # ...and the compressed row is indexed here
+                    if fts:
+                        self.conn.execute(
+                            f"INSERT INTO {fts}(rowid, {', '.join(fts_columns)}) VALUES (?, {', '.join('?' * len(values))})",
+                            [rowid] + values
+                        )
+            moved += len(rows)
+            self._plain_only = False
+
+
+def load_content(conn, table, ids):
+    """Convenience wrapper: ``{id: content}`` for discussions or replies."""
+    return ContentStore(conn).load(table, ids)
+
+
+def iter_discussions(conn, columns, filters=(), chunk_size=1000, canonical_only=True):
+    """Yield lists of up to ``chunk_size`` dict records with only ``columns``.
+
+    ``filters`` are ``(where, params)`` pairs, ANDed together (see
+    analysis.pending_filter). Pages are read by rowid (keyset pagination), so
+    no read statement stays open while the caller writes results between
+    chunks. ``content`` is filled in from compressed storage when requested.
+    """
+    select = [col for col in columns if col != "content_compressed"]
+    wants_content = "content" in select
+    if wants_content:
+        select.append("content_compressed")
+    where = ["discussions.rowid > ?"]
+    params = []
+    if canonical_only:
+        # Near-duplicates (cross-posts) are represented by their canonical discussion
+        where.append("(discussions.canonical_id IS NULL OR discussions.canonical_id = discussions.id)")
+    for clause, clause_params in filters:
+        where.append(f"({clause})")
+        params.extend(clause_params)
+    query = f"""
+        SELECT discussions.rowid, {", ".join(f"discussions.{col}" for col in select)} FROM discussions
+        WHERE {" AND ".join(where)}
+        ORDER BY discussions.rowid
+        LIMIT ?
+    """
+
+    store = ContentStore(conn)
+    last_rowid = 0
+    while True:
+        rows = conn.execute(query, [last_rowid, *params, chunk_size]).fetchall()
+        if not rows:
+            return
+        last_rowid = rows[-1][0]
+        records = [dict(zip(select, row[1:])) for row in rows]
+        if wants_content:
+            store.fill("discussions", records)
+            for record in records:
+                record.pop("content_compressed")
+        yield records
+
+
+def top_replies(conn, discussion_ids, k):
+    """``{discussion_id: [reply, ...]}`` with the ``k`` most-kudoed replies of each, best first."""
+    if not discussion_ids or k <= 0:
+        return {}
+    placeholders = ", ".join("?" * len(discussion_ids))
+    rows = conn.execute(f"""
+        SELECT id, parent_id, author, content, content_compressed, thumbs_up_count FROM (
+            SELECT id, parent_id, author, content, content_compressed, thumbs_up_count,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY parent_id ORDER BY COALESCE(thumbs_up_count, 0) DESC, publish_date
+                   ) AS rank
+            FROM replies WHERE parent_id IN ({placeholders})
+        ) WHERE rank <= ?
+        ORDER BY parent_id, rank
+    """, [*discussion_ids, k]).fetchall()
+    records = [
+        {"id": r[0], "parent_id": r[1], "author": r[2], "content": r[3], "content_compressed": r[4],
+         "thumbs_up_count": r[5]}
+        for r in rows
+    ]
+    ContentStore(conn).fill("replies", records)
+    replies = {}
+    for record in records:
+        record.pop("content_compressed")
+        replies.setdefault(record["parent_id"], []).append(record)
+    return replies
@@ -0,0 +1,147 @@
+import hashlib
+import random
+import re
+from array import array
+
+# Near-duplicate detection for cross-posted discussions: MinHash signatures of
+# title + content, bucketed with LSH bands that live in SQLite (minhash_* tables,
+# see schema.py) so later crawls and other scrapers see earlier posts.
+
+WORD_RE = re.compile(r"\w+")
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 64) - 1
+SHINGLE_SIZE = 3
+
+
+def stable_hash(text):
+    # Python's hash() is salted per process; signatures must be comparable across runs
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingles(text):
+    words = WORD_RE.findall((text or "").lower())
+    if len(words) < SHINGLE_SIZE:
+        return set(words)
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+class MinHasher:
+    """Fixed family of hash permutations; the same seed gives the same signatures."""
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.permutations = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, text):
+        hashes = [stable_hash(s) for s in shingles(text)]
+        if not hashes:
+            return None
+        return array("Q", [
+            min((a * h + b) % MERSENNE_PRIME for h in hashes)
+            for a, b in self.permutations
+        ])
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+class NearDuplicateIndex:
+    """LSH index over MinHash signatures, persisted in the discussions database.
+
+    ``assign`` returns the canonical id for a discussion: the id of the first
+    stored discussion it nearly duplicates (similarity >= ``threshold``), or its
+    own id. New signatures are buffered and written with ``flush``; buffered
+    entries are searched too, so duplicates within one batch are caught.
+    """
+
+    def __init__(self, conn, num_perm=128, bands=16, threshold=0.8, batch_size=500):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.conn = conn
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.batch_size = batch_size
+        # Not yet flushed: discussion_id -> (signature, canonical_id), (band, bucket) -> ids
+        self.pending = {}
+        self.pending_buckets = {}
+
+    def buckets(self, signature):
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(chunk.tobytes(), digest_size=8).digest()
+            # SQLite integers are signed 64-bit
+            yield band, int.from_bytes(digest, "little", signed=True)
+
+    def stored(self, discussion_id):
+        if discussion_id in self.pending:
+            return self.pending[discussion_id]
+        row = self.conn.execute(
+            "SELECT signature, canonical_id FROM minhash_signatures WHERE discussion_id = ?",
+            (discussion_id,)
+        ).fetchone()
+        if not row:
+            return None
+        return array("Q", row[0]), row[1]
+
+    def candidates(self, signature):
+        found = set()
+        for band, bucket in self.buckets(signature):
+            found.update(self.pending_buckets.get((band, bucket), ()))
+            found.update(row[0] for row in self.conn.execute(
+                "SELECT discussion_id FROM minhash_bands WHERE band = ? AND bucket = ?",
+                (band, bucket)
+            ))
+        return found
+
+    def assign(self, discussion_id, text):
+        """Returns ``(canonical_id, similarity)`` for a discussion."""
+        known = self.stored(discussion_id)
+        if known:
+            # Re-crawled: keep the decision made when it was first seen
+            return known[1], 1.0
+
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return discussion_id, 0.0
+
+        canonical_id, best = discussion_id, 0.0
+        for candidate_id in self.candidates(signature):
+            candidate = self.stored(candidate_id)
+            if not candidate:
+                continue
+            score = similarity(signature, candidate[0])
+            if score >= self.threshold and score > best:
+                canonical_id, best = candidate[1], score
+
+        self.add(discussion_id, signature, canonical_id)
+        return canonical_id, best
+
+    def add(self, discussion_id, signature, canonical_id):
+        self.pending[discussion_id] = (signature, canonical_id)
+        for key in self.buckets(signature):
+            self.pending_buckets.setdefault(key, []).append(discussion_id)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO minhash_signatures (discussion_id, signature, canonical_id) VALUES (?, ?, ?)",
+                [(i, sig.tobytes(), canonical) for i, (sig, canonical) in self.pending.items()]
+            )
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO minhash_bands (band, bucket, discussion_id) VALUES (?, ?, ?)",
+                [(band, bucket, i) for (band, bucket), ids in self.pending_buckets.items() for i in ids]
+            )
+        self.pending.clear()
+        self.pending_buckets.clear()
@@ -1,27 +1,70 @@
+import json
 import logging
-from customer_intent_scraper.stores import replies_cache
+from urllib.parse import urlparse, parse_qs
+
+from customer_intent_scraper.stores import graphql_capture, graphql_key, replies_cache
 
 logger = logging.getLogger(__name__)
 
+
+def parse_graphql_request(request):
+    """Return (operation_name, variables) for a Playwright GraphQL request."""
+    operation_name = None
+    variables = {}
+
+    post_data = request.post_data
+    if post_data:
+        try:
+            payload = json.loads(post_data)
+        except (TypeError, ValueError):
+            payload = None
+        if isinstance(payload, dict):
+            operation_name = payload.get("operationName")
+            variables = payload.get("variables") or {}
+    else:
+        # Persisted queries may also be sent as GET with the payload in the query string
+        query = parse_qs(urlparse(request.url).query)
+        operation_name = (query.get("operationName") or [None])[0]
+        if query.get("variables"):
+            try:
+                variables = json.loads(query["variables"][0])
+            except ValueError:
+                variables = {}
+
+    if not operation_name:
+        operation_name = (parse_qs(urlparse(request.url).query).get("opname") or [None])[0]
+    return operation_name, variables
+
+
 async def handle_graphql_response(response):
     try:
-        # Check if this is the GraphQL request we are interested in
+        # Only GraphQL calls are interesting
         url = response.url
-        if "graphql" in url:
-            # Check request body for operationName
-            try:
-                request = response.request
-                post_data = request.post_data
-                if post_data and "MessageReplies" in str(post_data):
-                    json_data = await response.json()
-                    # We need to associate this with the main page URL.
-                    page = response.frame.page
-                    if page:
-                        main_url = page.url
-                        replies_cache[main_url] = json_data
-                        logger.info(f"Captured GraphQL replies for {main_url}")
-            except Exception as e:
-                # It might not be a POST request or have post_data
-                pass
+        if "graphql" not in url or not response.ok:
+            return
+
+        operation_name, variables = parse_graphql_request(response.request)
+        if not operation_name:
+            return
+
+        json_data = await response.json()
+        if not isinstance(json_data, dict) or json_data.get("errors"):
+            return
+
+        # Record every operation the browser paid for so the spider can reuse it
+        graphql_capture[graphql_key(operation_name, variables)] = {
+            "operation_name": operation_name,
+            "variables": variables,
+            "data": json_data,
+        }
+        logger.debug(f"Captured GraphQL {operation_name} response from {url}")
+
+        if operation_name == "MessageReplies":
+            # We need to associate this with the main page URL.
+            page = response.frame.page
+            if page:
+                main_url = page.url
+                replies_cache[main_url] = json_data
+                logger.info(f"Captured GraphQL replies for {main_url}")
     except Exception as e:
         logger.error(f"Error in handle_graphql_response: {e}")
@@ -27,3 +27,5 @@ class DiscussionItem(scrapy.Item):
     content = scrapy.Field()
     publish_date = scrapy.Field()
     replies = scrapy.Field()
+    canonical_id = scrapy.Field()  # set by NearDuplicatePipeline
+    written = scrapy.Field()  # set by SQLitePipeline when asked to report changes
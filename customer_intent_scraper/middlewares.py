@@ -3,11 +3,26 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import asyncio
+import random
+
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 
+from customer_intent_scraper.stores import CassetteStore, request_fingerprint
+
+# Session credentials never go into a cassette; replay does not need them
+SENSITIVE_HEADERS = ("cookie", "set-cookie", "authorization", "x-csrf")
+
+
+def strip_sensitive_headers(headers):
+    return {k: v for k, v in headers.items() if not k.lower().startswith(SENSITIVE_HEADERS)}
+
 
 class CustomerIntentScraperSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -54,47 +69,109 @@ class CustomerIntentScraperSpiderMiddleware:
 
 
 class CustomerIntentScraperDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """Record-and-replay middleware for offline crawls.
+
+    With ``CASSETTE_MODE = "record"`` every request/response pair that makes
+    it back from the downloader is written to the cassette at ``CASSETTE_PATH``.
+    With ``CASSETTE_MODE = "replay"`` requests are answered from the cassette
+    and never reach the network (or Playwright). ``CASSETTE_REPLAY_LATENCY``
+    and ``CASSETTE_REPLAY_JITTER`` (seconds) add an artificial delay to each
+    replayed response so throttling behaves like a live crawl.
+    """
+
+    def __init__(self, mode, path, latency=0.0, jitter=0.0, stats=None):
+        self.mode = mode
+        self.latency = latency
+        self.jitter = jitter
+        self.stats = stats
+        self.store = CassetteStore(path)
+        self.pending_commits = 0
 
     @classmethod
     def from_crawler(cls, crawler):
         # This method is used by Scrapy to create your spiders.
-        s = cls()
+        settings = crawler.settings
+        mode = (settings.get("CASSETTE_MODE") or "").lower()
+        if not mode:
+            raise NotConfigured("CASSETTE_MODE is not set")
+        if mode not in ("record", "replay"):
+            raise NotConfigured(f"Unknown CASSETTE_MODE: {mode}")
+
+        s = cls(
+            mode=mode,
+            path=settings.get("CASSETTE_PATH", "cassette.db"),
+            latency=settings.getfloat("CASSETTE_REPLAY_LATENCY", 0.0),
+            jitter=settings.getfloat("CASSETTE_REPLAY_JITTER", 0.0),
+            stats=crawler.stats,
+        )
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
-    def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
-        return None
+    async def process_request(self, request, spider):
+        if self.mode != "replay":
+            return None
+
+        key = request_fingerprint(request.method, request.url, request.body)
+        recorded = self.store.get(key)
+        if recorded is None:
+            self.stats.inc_value("cassette/miss", spider=spider)
+            raise IgnoreRequest(f"No recorded response for {request.method} {request.url}")
+
+        delay = self.latency
+        if self.jitter:
+            delay += random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        # The bootstrap page only yields API headers through a Playwright
+        # event handler, which never fires on replay, so restore them here.
+        api_headers = recorded["extra"].get("api_headers")
+        if api_headers and not getattr(spider, "api_headers", None):
+            spider.api_headers = api_headers
+
+        headers = Headers(recorded["headers"])
+        respcls = responsetypes.from_args(headers=headers, url=request.url, body=recorded["body"])
+        self.stats.inc_value("cassette/replayed", spider=spider)
+        return respcls(
+            url=request.url,
+            status=recorded["status"],
+            headers=headers,
+            body=recorded["body"],
+            request=request,
+            flags=["cassette"],
+        )
 
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
-
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+        if self.mode != "record" or "cassette" in response.flags:
+            return response
+
+        extra = {}
+        api_headers = getattr(spider, "api_headers", None)
+        if request.meta.get("playwright") and api_headers:
+            extra["api_headers"] = strip_sensitive_headers(api_headers)
+
+        headers = strip_sensitive_headers({
+            k.decode("latin-1"): [v.decode("latin-1") for v in values]
+            for k, values in response.headers.items()
+        })
+        self.store.put(
+            request_fingerprint(request.method, request.url, request.body),
+            response.status,
+            headers,
+            response.body,
+            extra=extra,
+        )
+        self.stats.inc_value("cassette/recorded", spider=spider)
+
+        self.pending_commits += 1
+        if self.pending_commits >= 100:
+            self.store.commit()
+            self.pending_commits = 0
         return response
 
-    def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
-
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
-
     def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        spider.logger.info(f"Cassette {self.mode} mode using {self.store.path} ({len(self.store)} recorded interactions)")
+
+    def spider_closed(self, spider):
+        self.store.close()
@@ -7,6 +7,7 @@ import logging
 import attrs
 
 from customer_intent_scraper.items import DiscussionItem, ReplyItem
+from customer_intent_scraper.serialization import decode_json, encode_json, resolve_codec
 from web_poet import Returns, WebPage, field, handle_urls, HttpResponse
 from web_poet.serialization import register_serialization
 
@@ -18,12 +19,32 @@ class TechcommunityReplies:
     data: dict
 
 
+# Codec used when saving TechcommunityReplies (fixtures): "pretty" keeps the
+# readable indented JSON, "json"/"gzip"/"zstd" write compact payloads.
+# Set from the REPLIES_SERIALIZATION setting by TechcommunityRepliesProvider.
+REPLIES_SERIALIZATION = "pretty"
+
+_REPLIES_SUFFIXES = {"json": "payload.json", "gzip": "payload.json.gz", "zstd": "payload.json.zst"}
+
+
+def set_replies_serialization(codec: str) -> None:
+    global REPLIES_SERIALIZATION
+    REPLIES_SERIALIZATION = "pretty" if codec == "pretty" else resolve_codec(codec)
+
+
 def _serialize_replies(o: TechcommunityReplies) -> dict:
-    return {"json": json.dumps(o.data, sort_keys=True, indent=4).encode()}
+    if REPLIES_SERIALIZATION == "pretty":
+        return {"json": json.dumps(o.data, sort_keys=True, indent=4).encode()}
+    return {_REPLIES_SUFFIXES[REPLIES_SERIALIZATION]: encode_json(o.data, REPLIES_SERIALIZATION)}
 
 
 def _deserialize_replies(cls, data: dict) -> TechcommunityReplies:
-    return cls(data=json.loads(data["json"]))
+    if "json" in data:
+        return cls(data=json.loads(data["json"]))
+    for suffix in _REPLIES_SUFFIXES.values():
+        if suffix in data:
+            return cls(data=decode_json(data[suffix]))
+    raise ValueError(f"No serialized TechcommunityReplies payload found in {sorted(data)}")
 
 
 register_serialization(_serialize_replies, _deserialize_replies)
@@ -8,192 +8,700 @@ import sqlite3
 import json
 import os
 import re
+import time
+import queue
+import threading
+from collections import deque
 from itemadapter import ItemAdapter
 import logging
 import scrapy
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer, reactor, threads
+from twisted.python.threadpool import ThreadPool
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from customer_intent_scraper.db import ContentStore, upsert_discussions, upsert_replies
+from customer_intent_scraper.dedup import NearDuplicateIndex
+from customer_intent_scraper.schema import apply_migrations
+
+
+def get_platform(item, spider):
+    # Determine platform and sub_source
+    if spider.name == "reddit":
+        platform = "Reddit"
+        sub_source = item.get("sub_source", "reddit")
+    else:
+        platform = "Tech Community" 
+        sub_source = "microsoft365copilot" # Default
+
+        # Extract sub_source from URL if possible
+        if "techcommunity.microsoft.com" in item.get("discussion_url", ""):
+            parts = item["discussion_url"].split("/")
+            # Check for /t5/slug/ or /category/slug/
+            slug = None
+            if "t5" in parts:
+                try:
+                    idx = parts.index("t5")
+                    slug = parts[idx+1]
+                except:
+                    pass
+            elif "category" in parts:
+                try:
+                    idx = parts.index("category")
+                    slug = parts[idx+1]
+                except:
+                    pass
+            elif "discussions" in parts:
+                try:
+                    idx = parts.index("discussions")
+                    slug = parts[idx+1]
+                except:
+                    pass
+
+            if slug:
+                # Use the raw slug as the sub_source
+                sub_source = slug.lower()
+    return platform, sub_source
+
+
+def discussion_row(item, spider):
+    # One row in DISCUSSION_COLUMNS order (see customer_intent_scraper.db)
+    platform, sub_source = get_platform(item, spider)
+    return (
+        item.get("message_id"),
+        item.get("message_id"), # source_id same as message_id for now
+        platform,
+        sub_source,
+        item.get("title"),
+        item.get("author"),
+        item.get("publish_date"),
+        item.get("content"),
+        item.get("discussion_url"),
+        item.get("reply_count", 0),
+        item.get("thumbs_up_count", 0),
+        item.get("canonical_id")
+    )
+
+
+def reply_rows(item):
+    rows = []
+    if "replies" in item and item["replies"]:
+        for reply in item["replies"]:
+            rows.append((
+                reply.get("id"),
+                item.get("message_id"),
+                reply.get("author"),
+                reply.get("publish_date"),
+                reply.get("content"),
+                reply.get("thumbs_up_count", 0)
+            ))
+    return rows
+
+
+# Sentinel telling the writer thread to flush and exit
+_STOP = object()
+
 
 class SQLitePipeline:
-    def __init__(self, db_name="discussions.db"):
+    """Stores discussions and replies in SQLite from a dedicated writer thread.
+
+    ``process_item`` only turns the item into rows, hands them to the writer
+    through a bounded queue and returns a Deferred that fires once the rows are
+    committed (or errbacks with the error for that item). The writer
+    batches rows with ``executemany`` in a single transaction every
+    ``SQLITE_BATCH_SIZE`` rows or ``SQLITE_FLUSH_INTERVAL`` seconds, and always
+    flushes when the spider closes.
+
+    When the queue is full, items wait on the reactor side without being
+    acknowledged; Scrapy counts them as in progress, so the engine slows down
+    scheduling instead of the backlog growing.
+
+    With ``report_changes`` (on when ParquetPipeline is enabled) each stored
+    item gets ``written = {"discussion": bool, "replies": [ids]}``: what the
+    upsert actually inserted or changed, so later pipelines can skip the rest.
+    """
+
+    def __init__(self, db_name="discussions.db", batch_size=500, flush_interval=5.0, queue_size=1000, stats=None,
+                 content_options=None, report_changes=False):
         self.db_name = db_name
+        self.report_changes = report_changes
+        # ContentStore options (CONTENT_COMPRESSION_* settings)
+        self.content_options = content_options or {}
+        self.store = None
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.stats = stats
         self.conn = None
         self.cursor = None
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        # Only touched on the reactor thread
+        self.waiting = deque()
+        self.writer = None
+        self.writer_error = None
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
-            db_name=crawler.settings.get("SQLITE_DB_NAME", "discussions.db")
+            db_name=crawler.settings.get("SQLITE_DB_NAME", "discussions.db"),
+            batch_size=crawler.settings.getint("SQLITE_BATCH_SIZE", 500),
+            flush_interval=crawler.settings.getfloat("SQLITE_FLUSH_INTERVAL", 5.0),
+            queue_size=crawler.settings.getint("SQLITE_WRITER_QUEUE_SIZE", 1000),
+            stats=crawler.stats,
+            report_changes=bool(crawler.settings.get("PARQUET_EXPORT_DIR")),
+            content_options={
+                "compression": crawler.settings.get("CONTENT_COMPRESSION"),
+                "level": crawler.settings.getint("CONTENT_COMPRESSION_LEVEL", 10),
+                "min_bytes": crawler.settings.getint("CONTENT_COMPRESSION_MIN_BYTES", 512),
+                "dict_size": crawler.settings.getint("CONTENT_DICT_SIZE", 112640),
+                "dict_samples": crawler.settings.getint("CONTENT_DICT_SAMPLES", 2000),
+            },
         )
 
     def open_spider(self, spider):
+        # Create the schema up front so configuration errors fail the crawl early
         self.conn = sqlite3.connect(self.db_name)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
+        apply_migrations(self.conn)
+        self.conn.close()
+
+        self.writer = threading.Thread(target=self.writer_loop, args=(spider,), name="sqlite-writer", daemon=True)
+        self.writer.start()
 
     def close_spider(self, spider):
-        if self.conn:
-            self.conn.commit()
-            self.conn.close()
-
-    def create_tables(self):
-        # Main discussions table
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS discussions (
-                id TEXT PRIMARY KEY,
-                source_id TEXT,
-                platform TEXT,
-                sub_source TEXT,
-                title TEXT,
-                author TEXT,
-                publish_date TEXT,
-                content TEXT,
-                url TEXT,
-                reply_count INTEGER,
-                thumbs_up_count INTEGER,
-                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Replies table
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS replies (
-                id TEXT PRIMARY KEY,
-                parent_id TEXT,
-                author TEXT,
-                publish_date TEXT,
-                content TEXT,
-                thumbs_up_count INTEGER,
-                FOREIGN KEY(parent_id) REFERENCES discussions(id)
-            )
-        """)
-        self.conn.commit()
+        if not self.writer:
+            return None
+        # Every item has been acknowledged by now, so only the sentinel is left to send
+        while self.waiting:
+            if not self.put(self.waiting[0]):
+                break
+            self.waiting.popleft()
+        if not self.put(_STOP):
+            spider.logger.error("SQLite writer thread died; failing the items it did not write")
+            self.fail_pending(RuntimeError("SQLite writer thread is not running"))
+            return None
+        return threads.deferToThread(self.writer.join)
+
+    def put(self, job):
+        # Blocking put that gives up if the writer is gone (nothing would ever make room)
+        while True:
+            if not self.writer.is_alive():
+                return False
+            try:
+                self.queue.put(job, timeout=1.0)
+                return True
+            except queue.Full:
+                pass
+
+    def fail_pending(self, error, jobs=()):
+        # Errback every job the writer never picked up
+        jobs = list(jobs) + list(self.waiting)
+        self.waiting.clear()
+        while True:
+            try:
+                jobs.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for job in jobs:
+            if job is not _STOP:
+                job[3].errback(error)
 
     def process_item(self, item, spider):
-        # Determine platform and sub_source
-        if spider.name == "reddit":
-            platform = "Reddit"
-            sub_source = item.get("sub_source", "reddit")
-        else:
-            platform = "Tech Community" 
-            sub_source = "microsoft365copilot" # Default
-        
-            # Extract sub_source from URL if possible
-            if "techcommunity.microsoft.com" in item.get("discussion_url", ""):
-                parts = item["discussion_url"].split("/")
-                # Check for /t5/slug/ or /category/slug/
-                slug = None
-                if "t5" in parts:
-                    try:
-                        idx = parts.index("t5")
-                        slug = parts[idx+1]
-                    except:
-                        pass
-                elif "category" in parts:
-                    try:
-                        idx = parts.index("category")
-                        slug = parts[idx+1]
-                    except:
-                        pass
-                elif "discussions" in parts:
-                    try:
-                        idx = parts.index("discussions")
-                        slug = parts[idx+1]
-                    except:
-                        pass
-                
-                if slug:
-                    # Use the raw slug as the sub_source
-                    sub_source = slug.lower()
-
-        # Insert Discussion
+        if self.writer_error is not None or not self.writer.is_alive():
+            return defer.fail(RuntimeError("SQLite writer thread is not running"))
+        d = defer.Deferred()
+        job = (item, discussion_row(item, spider), reply_rows(item), d)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            # Backpressure: hold the item (unacknowledged) until the writer catches up
+            self.waiting.append(job)
+            if self.stats:
+                self.stats.inc_value("sqlite/backpressure_waits", spider=spider)
+        return d
+
+    def drain_waiting(self):
+        # Runs on the reactor thread whenever the writer has made room
+        while self.waiting:
+            try:
+                self.queue.put_nowait(self.waiting[0])
+            except queue.Full:
+                return
+            self.waiting.popleft()
+
+    def writer_loop(self, spider):
+        jobs = []
         try:
-            self.cursor.execute("""
-                INSERT OR REPLACE INTO discussions 
-                (id, source_id, platform, sub_source, title, author, publish_date, content, url, reply_count, thumbs_up_count)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            self.write_loop(spider, jobs)
+        except Exception as e:
+            # Unexpected (flush handles write errors). Scrapy only closes the spider once
+            # every item is acknowledged, so fail the batch in hand, the queue and the
+            # waiting items now instead of leaving the crawl hanging
+            spider.logger.exception("SQLite writer thread failed")
+            self.writer_error = e
+            queued = []
+            while True:
+                try:
+                    job = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not _STOP:
+                    queued.append(job)
+            reactor.callFromThread(self.finish_batch, [(job, e) for job in jobs], 0, [0, 0], 0.0, spider)
+            reactor.callFromThread(self.fail_pending, e, queued)
+        finally:
+            if self.conn:
+                self.conn.close()
+
+    def write_loop(self, spider, jobs):
+        self.conn = sqlite3.connect(self.db_name)
+        self.cursor = self.conn.cursor()
+        self.store = ContentStore(self.conn, **self.content_options)
+        rows = 0
+        batch_started = None
+        stopping = False
+
+        while not stopping:
+            timeout = None
+            if jobs:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - batch_started))
+            try:
+                job = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                job = None
+
+            if job is _STOP:
+                stopping = True
+            elif job is not None:
+                if not jobs:
+                    batch_started = time.monotonic()
+                jobs.append(job)
+                rows += 1 + len(job[2])
+                # There is room in the queue now; waiting belongs to the reactor thread
+                reactor.callFromThread(self.drain_waiting)
+
+            due = jobs and time.monotonic() - batch_started >= self.flush_interval
+            if jobs and (stopping or rows >= self.batch_size or due):
+                self.flush(jobs, spider)
+                jobs.clear()
+                rows = 0
+
+        self.conn.commit()
+
+    def write_rows(self, discussions, replies, changed=None):
+        # One transaction per call: committed on success, rolled back on error.
+        # Unchanged rows are skipped, so re-crawls only write the delta.
+        # ``changed`` is a (discussion ids, reply ids) pair of sets to fill.
+        discussions_changed, replies_changed = changed or (None, None)
+        with self.conn:
+            return (
+                upsert_discussions(self.cursor, discussions, self.store, discussions_changed),
+                upsert_replies(self.cursor, replies, self.store, replies_changed),
+            )
+
+    def new_changes(self):
+        return (set(), set()) if self.report_changes else None
+
+    def flush(self, jobs, spider):
+        discussions = [job[1] for job in jobs]
+        replies = [row for job in jobs for row in job[2]]
+        started = time.perf_counter()
+        changed = self.new_changes()
+        try:
+            written = self.write_rows(discussions, replies, changed)
+            results = [(job, None) for job in jobs]
+        except Exception as e:
+            spider.logger.error(f"Error writing batch of {len(discussions)} discussions / {len(replies)} replies, retrying per item: {e}")
+            # Retry item by item so only the offending items report the error
+            results = []
+            written = [0, 0]
+            changed = self.new_changes()
+            for job in jobs:
+                item_changed = self.new_changes()
+                try:
+                    d_written, r_written = self.write_rows([job[1]], job[2], item_changed)
+                    written[0] += d_written
+                    written[1] += r_written
+                    results.append((job, None))
+                    if changed is not None:
+                        changed[0].update(item_changed[0])
+                        changed[1].update(item_changed[1])
+                except Exception as item_error:
+                    results.append((job, item_error))
+
+        latency_ms = (time.perf_counter() - started) * 1000
+        reactor.callFromThread(self.finish_batch, results, len(replies), written, latency_ms, spider, changed)
+
+    def finish_batch(self, results, replies, written, latency_ms, spider, changed=None):
+        # Back on the reactor thread: record stats and acknowledge each item
+        failed = 0
+        for (item, discussion, reply_rows, d), error in results:
+            if error is None:
+                if changed is not None:
+                    ItemAdapter(item)["written"] = {
+                        "discussion": discussion[0] in changed[0],
+                        "replies": [row[0] for row in reply_rows if row[0] in changed[1]],
+                    }
+                d.callback(item)
+            else:
+                failed += 1
+                d.errback(error)
+
+        if self.stats:
+            discussions_written, replies_written = written
+            self.stats.inc_value("sqlite/flushes", spider=spider)
+            self.stats.inc_value("sqlite/discussions_written", discussions_written, spider=spider)
+            self.stats.inc_value("sqlite/discussions_unchanged", len(results) - failed - discussions_written, spider=spider)
+            self.stats.inc_value("sqlite/replies_written", replies_written, spider=spider)
+            self.stats.inc_value("sqlite/replies_unchanged", max(0, replies - replies_written), spider=spider)
+            self.stats.inc_value("sqlite/failed_items", failed, spider=spider)
+            self.stats.inc_value("sqlite/flush_latency_total_ms", latency_ms, spider=spider)
+            self.stats.max_value("sqlite/flush_latency_max_ms", latency_ms, spider=spider)
+            self.stats.set_value("sqlite/flush_latency_last_ms", latency_ms, spider=spider)
+
+        # Covers items held back while the writer was emptying the queue
+        self.drain_waiting()
+
+MONTH_RE = re.compile(r"^(\d{4})-(\d{2})")
+
+
+def partition_month(publish_date):
+    match = MONTH_RE.match(publish_date or "")
+    return f"{match.group(1)}-{match.group(2)}" if match else "unknown"
+
+
+def partition_value(value):
+    # Hive-style directory names: keep them readable but path-safe
+    return re.sub(r"[/\\=]", "_", value or "unknown")
+
+
+class ParquetPipeline:
+    """Writes discussions and replies to Parquet datasets next to SQLite.
+
+    Enabled by setting PARQUET_EXPORT_DIR (requires pyarrow). Rows land in
+    hive-partitioned datasets::
+
+        <dir>/discussions/platform=<platform>/month=<YYYY-MM>/part-<run>.parquet
+        <dir>/replies/platform=<platform>/month=<YYYY-MM>/part-<run>.parquet
+
+    Each partition keeps one open ParquetWriter per run and buffers rows until
+    PARQUET_ROW_GROUP_SIZE are pending, so files get a few large row groups.
+
+    After SQLitePipeline, only rows the crawl inserted or changed are
+    exported (see ``written``): a re-crawl adds just the delta. An edited post
+    appears again in a later part, so readers that want one row per id keep
+    the one from the newest part (part names sort by run time); without
+    SQLitePipeline every crawled row is written.
+    Low-cardinality string columns are dictionary encoded. Read a slice with
+    e.g. ``pyarrow.dataset.dataset(path, partitioning="hive")`` or
+    ``pandas.read_parquet(path, filters=[("month", "=", "2024-05")])``.
+    """
+
+    if pa is not None:
+        DISCUSSION_SCHEMA = pa.schema([
+            ("id", pa.string()),
+            ("source_id", pa.string()),
+            ("sub_source", pa.dictionary(pa.int32(), pa.string())),
+            ("title", pa.string()),
+            ("author", pa.dictionary(pa.int32(), pa.string())),
+            ("publish_date", pa.string()),
+            ("content", pa.string()),
+            ("url", pa.string()),
+            ("reply_count", pa.int64()),
+            ("thumbs_up_count", pa.int64()),
+            ("canonical_id", pa.string()),
+        ])
+        REPLY_SCHEMA = pa.schema([
+            ("id", pa.string()),
+            ("parent_id", pa.string()),
+            ("author", pa.dictionary(pa.int32(), pa.string())),
+            ("publish_date", pa.string()),
+            ("content", pa.string()),
+            ("thumbs_up_count", pa.int64()),
+        ])
+
+    def __init__(self, export_dir, row_group_size=10000, compression="zstd", stats=None):
+        self.export_dir = export_dir
+        self.row_group_size = max(1, row_group_size)
+        self.compression = compression
+        self.stats = stats
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        # (dataset, platform, month) -> buffered rows / open writer
+        self.buffers = {}
+        self.writers = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        export_dir = crawler.settings.get("PARQUET_EXPORT_DIR")
+        if not export_dir:
+            raise NotConfigured("PARQUET_EXPORT_DIR is not set")
+        if pa is None:
+            raise NotConfigured("pyarrow is not installed; Parquet export is disabled")
+        return cls(
+            export_dir,
+            row_group_size=crawler.settings.getint("PARQUET_ROW_GROUP_SIZE", 10000),
+            compression=crawler.settings.get("PARQUET_COMPRESSION", "zstd"),
+            stats=crawler.stats,
+        )
+
+    def process_item(self, item, spider):
+        platform, sub_source = get_platform(item, spider)
+        platform = partition_value(platform)
+        written = item.get("written")
+        replies = item.get("replies") or ()
+        if written is not None:
+            if self.stats:
+                skipped = (0 if written["discussion"] else 1) + len(replies) - len(written["replies"])
+                self.stats.inc_value("parquet/unchanged_skipped", skipped, spider=spider)
+            reply_ids = set(written["replies"])
+            replies = [reply for reply in replies if reply.get("id") in reply_ids]
+            if not written["discussion"]:
+                self.add_replies(item, replies, platform, spider)
+                return item
+
+        self.add_row("discussions", platform, partition_month(item.get("publish_date")), (
+            item.get("message_id"),
+            item.get("message_id"),
+            sub_source,
+            item.get("title"),
+            item.get("author"),
+            item.get("publish_date"),
+            item.get("content"),
+            item.get("discussion_url"),
+            item.get("reply_count", 0),
+            item.get("thumbs_up_count", 0),
+            item.get("canonical_id"),
+        ), spider)
+        self.add_replies(item, replies, platform, spider)
+        return item
+
+    def add_replies(self, item, replies, platform, spider):
+        for reply in replies:
+            self.add_row("replies", platform, partition_month(reply.get("publish_date")), (
+                reply.get("id"),
                 item.get("message_id"),
-                item.get("message_id"), # source_id same as message_id for now
-                platform,
-                sub_source,
-                item.get("title"),
-                item.get("author"),
-                item.get("publish_date"),
-                item.get("content"),
-                item.get("discussion_url"),
-                item.get("reply_count", 0),
-                item.get("thumbs_up_count", 0)
-            ))
-            
-            # Insert Replies
-            if "replies" in item and item["replies"]:
-                for reply in item["replies"]:
-                    self.cursor.execute("""
-                        INSERT OR REPLACE INTO replies
-                        (id, parent_id, author, publish_date, content, thumbs_up_count)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (
-                        reply.get("id"),
-                        item.get("message_id"),
-                        reply.get("author"),
-                        reply.get("publish_date"),
-                        reply.get("content"),
-                        reply.get("thumbs_up_count", 0)
-                    ))
-            
-            self.conn.commit()
-            
-        except sqlite3.Error as e:
-            spider.logger.error(f"Database error: {e}")
-            
+                reply.get("author"),
+                reply.get("publish_date"),
+                reply.get("content"),
+                reply.get("thumbs_up_count", 0),
+            ), spider)
+
+    def add_row(self, dataset, platform, month, row, spider):
+        key = (dataset, platform, month)
+        rows = self.buffers.setdefault(key, [])
+        rows.append(row)
+        if len(rows) >= self.row_group_size:
+            self.write_row_group(key, spider)
+
+    def write_row_group(self, key, spider):
+        rows = self.buffers.pop(key, None)
+        if not rows:
+            return
+        dataset, platform, month = key
+        schema = self.DISCUSSION_SCHEMA if dataset == "discussions" else self.REPLY_SCHEMA
+        columns = list(zip(*rows))
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema,
+        )
+
+        writer = self.writers.get(key)
+        if writer is None:
+            directory = os.path.join(self.export_dir, dataset, f"platform={platform}", f"month={month}")
+            os.makedirs(directory, exist_ok=True)
+            writer = pq.ParquetWriter(
+                os.path.join(directory, f"part-{self.run_id}.parquet"),
+                schema,
+                compression=self.compression,
+                use_dictionary=[field.name for field in schema if pa.types.is_dictionary(field.type)],
+            )
+            self.writers[key] = writer
+            if self.stats:
+                self.stats.inc_value("parquet/files", spider=spider)
+
+        writer.write_table(table)
+        if self.stats:
+            self.stats.inc_value("parquet/row_groups", spider=spider)
+            self.stats.inc_value(f"parquet/{dataset}_written", len(rows), spider=spider)
+
+    def close_spider(self, spider):
+        for key in list(self.buffers):
+            self.write_row_group(key, spider)
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+
+class NearDuplicatePipeline:
+    """Tags cross-posted discussions with the id of their first-seen copy.
+
+    Sets ``canonical_id`` on every item: its own ``message_id`` for new
+    content, or the representative's id when the title and content nearly
+    duplicate (MinHash similarity >= DEDUP_THRESHOLD) a discussion already in
+    the LSH index. The index lives in the same SQLite database, so it carries
+    over between crawls and scrapers. Lookups are indexed reads; new
+    signatures are written in batches of DEDUP_BATCH_SIZE.
+
+    Signatures, lookups and writes run on a single dedicated thread (the index
+    is not thread-safe, and one thread keeps within-crawl duplicates in
+    order), never on the reactor: the item's Deferred fires once it is tagged.
+    """
+
+    def __init__(self, db_name="discussions.db", num_perm=128, bands=16, threshold=0.8, batch_size=500, stats=None):
+        self.db_name = db_name
+        self.num_perm = num_perm
+        self.bands = bands
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.stats = stats
+        self.conn = None
+        self.index = None
+        self.pool = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            db_name=crawler.settings.get("SQLITE_DB_NAME", "discussions.db"),
+            num_perm=crawler.settings.getint("DEDUP_NUM_PERM", 128),
+            bands=crawler.settings.getint("DEDUP_BANDS", 16),
+            threshold=crawler.settings.getfloat("DEDUP_THRESHOLD", 0.8),
+            batch_size=crawler.settings.getint("DEDUP_BATCH_SIZE", 500),
+            stats=crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        # Only the dedup thread uses the connection after this. The timeout covers
+        # the SQLite writer thread's commits (WAL keeps reads from waiting on them)
+        self.conn = sqlite3.connect(self.db_name, timeout=30, check_same_thread=False)
+        apply_migrations(self.conn)
+        self.index = NearDuplicateIndex(
+            self.conn,
+            num_perm=self.num_perm,
+            bands=self.bands,
+            threshold=self.threshold,
+            batch_size=self.batch_size,
+        )
+        self.pool = ThreadPool(minthreads=1, maxthreads=1, name="dedup")
+        self.pool.start()
+
+    def close_spider(self, spider):
+        if not self.pool:
+            return None
+        d = threads.deferToThreadPool(reactor, self.pool, self.close_index)
+        d.addBoth(self.stop_pool)
+        return d
+
+    def close_index(self):
+        self.index.flush()
+        self.conn.close()
+
+    def stop_pool(self, result):
+        self.pool.stop()
+        return result
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        discussion_id = adapter.get("message_id")
+        if not discussion_id:
+            return item
+
+        text = f"{adapter.get('title') or ''}\n{adapter.get('content') or ''}"
+        d = threads.deferToThreadPool(reactor, self.pool, self.index.assign, discussion_id, text)
+        d.addCallback(self.tag, item, discussion_id, spider)
+        return d
+
+    def tag(self, assigned, item, discussion_id, spider):
+        # Back on the reactor thread
+        canonical_id, score = assigned
+        ItemAdapter(item)["canonical_id"] = canonical_id
+
+        if self.stats:
+            if canonical_id == discussion_id:
+                self.stats.inc_value("dedup/unique", spider=spider)
+            else:
+                self.stats.inc_value("dedup/near_duplicates", spider=spider)
+        if canonical_id != discussion_id:
+            spider.logger.debug(f"{discussion_id} is a near-duplicate of {canonical_id} (similarity {score:.2f})")
         return item
 
+
+# Any whitespace other than a single plain space: the only case that needs a regex pass
+MESSY_WHITESPACE_RE = re.compile(r"[^\S ]| {2,}")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
 class CustomerIntentScraperPipeline:
+    """Normalises whitespace and drops empty replies, in place.
+
+    Counts go to the crawl stats (cleaning/*); dropped replies are only logged
+    at DEBUG level, one in every CLEANING_LOG_SAMPLE_RATE.
+    """
+
+    def __init__(self, stats=None, log_sample_rate=100):
+        self.stats = stats
+        self.log_sample_rate = max(1, log_sample_rate)
+        self.dropped = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            stats=crawler.stats,
+            log_sample_rate=crawler.settings.getint("CLEANING_LOG_SAMPLE_RATE", 100),
+        )
+
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
         
         # 1. Clean top-level string fields
-        for field_name in adapter.field_names():
-            value = adapter.get(field_name)
-            if isinstance(value, str):
-                adapter[field_name] = self.clean_text(value)
+        self.clean_fields(adapter)
         
-        # 2. Clean nested 'replies' list
+        # 2. Clean nested 'replies' list, keeping the original reply objects
         replies = adapter.get('replies')
         if replies and isinstance(replies, list):
-            logging.info(f"Pipeline received {len(replies)} replies")
-            cleaned_replies = []
+            kept = []
+            dropped = 0
+            skipped = 0
             for reply in replies:
-                if isinstance(reply, (dict, scrapy.Item)):
-                    # Clean each string value in the reply dictionary
-                    # For scrapy.Item, we need to be careful about modification
-                    if isinstance(reply, scrapy.Item):
-                        reply_dict = dict(reply)
-                    else:
-                        reply_dict = reply
-                        
-                    clean_reply = {
-                        k: self.clean_text(v) if isinstance(v, str) else v 
-                        for k, v in reply_dict.items()
-                    }
-                    
-                    # Filter out empty or useless replies if needed
-                    if self.is_valid_reply(clean_reply):
-                        cleaned_replies.append(clean_reply)
-                    else:
-                        logging.info(f"DEBUG: Dropped invalid reply: {clean_reply}")
+                if not isinstance(reply, (dict, scrapy.Item)):
+                    skipped += 1
+                    continue
+                self.clean_fields(reply)
+                if self.is_valid_reply(reply):
+                    kept.append(reply)
                 else:
-                     logging.warning(f"Skipping reply of type {type(reply)}")
-            
-            logging.info(f"Pipeline keeping {len(cleaned_replies)} replies")
-            adapter['replies'] = cleaned_replies
+                    dropped += 1
+                    self.dropped += 1
+                    if self.dropped % self.log_sample_rate == 1 or self.log_sample_rate == 1:
+                        spider.logger.debug(f"Dropped invalid reply {reply.get('id')} ({self.dropped} dropped so far)")
 
+            replies[:] = kept
+            if self.stats:
+                self.stats.inc_value("cleaning/replies_kept", len(kept), spider=spider)
+                self.stats.inc_value("cleaning/replies_dropped", dropped, spider=spider)
+                self.stats.inc_value("cleaning/replies_skipped", skipped, spider=spider)
+
+        if self.stats:
+            self.stats.inc_value("cleaning/items", spider=spider)
         return item
 
+    def clean_fields(self, fields):
+        # Works on dicts, Items and ItemAdapters alike; only touches changed values
+        for key in list(fields.keys()):
+            value = fields[key]
+            if isinstance(value, str):
+                cleaned = self.clean_text(value)
+                if cleaned is not value:
+                    fields[key] = cleaned
+
     def clean_text(self, text):
         if not text:
             return text
         # Replace multiple whitespace/newlines with single space
-        text = re.sub(r'\s+', ' ', text)
+        if MESSY_WHITESPACE_RE.search(text):
+            text = WHITESPACE_RE.sub(' ', text)
         # Strip leading/trailing whitespace
         return text.strip()
 
@@ -1,15 +1,27 @@
 import attrs
-from scrapy import Request
+from scrapy import Request, signals
 from scrapy.http import Response
 from scrapy_poet import PageObjectInputProvider
 from web_poet import Injectable
 
-from customer_intent_scraper.pages.techcommunity_microsoft_com import TechcommunityReplies
-from customer_intent_scraper.stores import replies_cache
+from customer_intent_scraper.pages.techcommunity_microsoft_com import TechcommunityReplies, set_replies_serialization
+from customer_intent_scraper.stores import configure_replies_cache, replies_cache
 
 class TechcommunityRepliesProvider(PageObjectInputProvider):
     provided_classes = {TechcommunityReplies}
 
+    def __init__(self, injector):
+        super().__init__(injector)
+        crawler = injector.crawler
+        configure_replies_cache(crawler.settings)
+        set_replies_serialization(crawler.settings.get("REPLIES_SERIALIZATION", "pretty"))
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        self.stats = crawler.stats
+
+    def spider_closed(self, spider):
+        for key, value in replies_cache.snapshot().items():
+            self.stats.set_value(f"replies_cache/{key}", value, spider=spider)
+
     def __call__(self, to_provide, response: Response):
         # Check if we have cached data for this URL
         url = response.url
@@ -0,0 +1,104 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+# Client-side rate limiting for the Azure OpenAI analysis. Deployments have a
+# requests-per-minute and a tokens-per-minute quota, enforced over short
+# windows, so both are token buckets refilled continuously that allow a burst
+# of ``burst_seconds`` worth of quota.
+
+
+class TokenBucket:
+    def __init__(self, per_minute, burst_seconds=10):
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, amount=1):
+        """Take ``amount`` tokens if available; returns 0, or the seconds to wait for them."""
+        self._refill()
+        # A request bigger than the bucket would never fit: let it drain the bucket instead
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= amount
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def available(self):
+        self._refill()
+        return self.tokens
+
+    def adjust(self, amount):
+        """Give back (or take more of) tokens once the real cost is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Requests/min and tokens/min buckets shared by all in-flight requests.
+
+    ``acquire`` waits until both have room, in arrival order; ``pause`` stops
+    every caller for a while (after a 429, the server knows better).
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, burst_seconds=10):
+        self.requests = TokenBucket(requests_per_minute, burst_seconds) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens):
+        async with self.lock:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.requests:
+                    wait = self.requests.try_acquire(1)
+                if wait <= 0 and self.tokens:
+                    wait = self.tokens.try_acquire(tokens)
+                    if wait > 0 and self.requests:
+                        self.requests.adjust(1)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def record_usage(self, estimated, actual):
+        if self.tokens and actual is not None:
+            self.tokens.adjust(estimated - actual)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def retry_after(headers):
+    """Seconds the server asked us to wait (retry-after-ms / retry-after), or None."""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return None
+
+
+def backoff(attempt, base=1.0, cap=60.0):
+    """Exponential backoff with jitter, so retrying callers spread out."""
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
@@ -0,0 +1,417 @@
+# Single source of truth for the discussions.db schema.
+#
+# Migrations are numbered and applied in order; applied versions are recorded
+# in schema_version. Every script that opens the database calls
+# apply_migrations() right after connecting, so an old database is brought up
+# to date by whichever tool touches it first. To change the schema, append a
+# new migration to MIGRATIONS - never edit one that has already shipped.
+
+
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def add_column(conn, table, column, decl):
+    # Databases created before the migrations existed may already have the column
+    if column not in table_columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def create_base_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS discussions (
+            id TEXT PRIMARY KEY,
+            source_id TEXT,
+            platform TEXT,
+            sub_source TEXT,
+            title TEXT,
+            author TEXT,
+            publish_date TEXT,
+            content TEXT,
+            url TEXT,
+            reply_count INTEGER,
+            thumbs_up_count INTEGER,
+            scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS replies (
+            id TEXT PRIMARY KEY,
+            parent_id TEXT,
+            author TEXT,
+            publish_date TEXT,
+            content TEXT,
+            thumbs_up_count INTEGER,
+            FOREIGN KEY(parent_id) REFERENCES discussions(id)
+        )
+    """)
+
+
+def add_analysis_columns(conn):
+    # Written by analyze_local.py and analyze_intent.py
+    for column, decl in (
+        ("analysis_category", "TEXT"),
+        ("analysis_product_area", "TEXT"),
+        ("analysis_sentiment", "TEXT"),
+        ("analysis_intent", "TEXT"),
+        ("analysis_author_role", "TEXT"),
+        ("analysis_cluster_id", "INTEGER"),
+        ("analysis_summary", "TEXT"),
+        ("analysis_pain_points", "TEXT"),
+    ):
+        add_column(conn, "discussions", column, decl)
+
+
+def add_change_tracking(conn):
+    # See customer_intent_scraper.db for how these are maintained
+    add_column(conn, "discussions", "content_hash", "TEXT")
+    add_column(conn, "discussions", "updated_at", "TIMESTAMP")
+    # analysis_dirty is no longer maintained; only the move to the analysis table reads it
+    add_column(conn, "discussions", "analysis_dirty", "INTEGER DEFAULT 0")
+    add_column(conn, "replies", "content_hash", "TEXT")
+    add_column(conn, "replies", "updated_at", "TIMESTAMP")
+
+
+def add_indexes(conn):
+    # Thread detail view: replies of one discussion
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_replies_parent_id ON replies(parent_id)")
+    # Dashboard filters and date ordering
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_discussions_publish_date ON discussions(publish_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_discussions_platform_sub_source ON discussions(platform, sub_source)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_discussions_sub_source ON discussions(sub_source)")
+    # Analysis filters, topic explorer and "what still needs analysing"
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_discussions_analysis_category ON discussions(analysis_category)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_discussions_analysis_intent ON discussions(analysis_intent)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_discussions_analysis_cluster_id ON discussions(analysis_cluster_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_discussions_analysis_dirty ON discussions(analysis_dirty) WHERE analysis_dirty = 1")
+
+
+def fts5_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def add_full_text_search(conn):
+    # External-content FTS5 indexes: the text lives only in discussions/replies,
+    # the triggers keep the index in step with every insert, update and delete
+    if not fts5_available(conn):
+        logger.warning("SQLite was built without FTS5; full-text search is disabled")
+        return
+
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS discussions_fts USING fts5(
+            title, content,
+            content='discussions', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS replies_fts USING fts5(
+            content,
+            content='replies', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+    """)
+
+    # (executescript would commit the migration transaction, so one by one)
+    for trigger in (
+        """CREATE TRIGGER IF NOT EXISTS discussions_fts_insert AFTER INSERT ON discussions BEGIN
+            INSERT INTO discussions_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS discussions_fts_delete AFTER DELETE ON discussions BEGIN
+            INSERT INTO discussions_fts(discussions_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS discussions_fts_update AFTER UPDATE OF title, content ON discussions BEGIN
+            INSERT INTO discussions_fts(discussions_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+            INSERT INTO discussions_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS replies_fts_insert AFTER INSERT ON replies BEGIN
+            INSERT INTO replies_fts(rowid, content) VALUES (new.rowid, new.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS replies_fts_delete AFTER DELETE ON replies BEGIN
+            INSERT INTO replies_fts(replies_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS replies_fts_update AFTER UPDATE OF content ON replies BEGIN
+            INSERT INTO replies_fts(replies_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            INSERT INTO replies_fts(rowid, content) VALUES (new.rowid, new.content);
+        END""",
+    ):
+        conn.execute(trigger)
+
+    # Index whatever was scraped before this migration
+    conn.execute("INSERT INTO discussions_fts(discussions_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO replies_fts(replies_fts) VALUES ('rebuild')")
+
+
+def add_near_duplicate_index(conn):
+    # Written by customer_intent_scraper.dedup.NearDuplicateIndex
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS minhash_signatures (
+            discussion_id TEXT PRIMARY KEY,
+            signature BLOB,
+            canonical_id TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS minhash_bands (
+            band INTEGER,
+            bucket INTEGER,
+            discussion_id TEXT,
+            PRIMARY KEY (band, bucket, discussion_id)
+        ) WITHOUT ROWID
+    """)
+    # canonical_id = id for representatives, the representative's id for near-duplicates,
+    # NULL for rows stored before deduplication existed
+    add_column(conn, "discussions", "canonical_id", "TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_discussions_canonical_id ON discussions(canonical_id)")
+
+
+def add_content_storage(conn):
+    # Compressed content lives in content_blobs (see customer_intent_scraper.db.ContentStore)
+    add_column(conn, "discussions", "content_compressed", "INTEGER DEFAULT 0")
+    add_column(conn, "replies", "content_compressed", "INTEGER DEFAULT 0")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS content_blobs (
+            kind TEXT,
+            id TEXT,
+            dict_id INTEGER,
+            data BLOB,
+            PRIMARY KEY (kind, id)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS content_dictionaries (
+            dict_id INTEGER PRIMARY KEY,
+            kind TEXT,
+            data BLOB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # The FTS triggers only see inline content: rows whose content is compressed
+    # are indexed by ContentStore, so the triggers must leave them alone
+    for table, columns in (("discussions", ("title", "content")), ("replies", ("content",))):
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f"{table}_fts",)).fetchone():
+            continue
+        fts = f"{table}_fts"
+        names = ", ".join(columns)
+        new_values = ", ".join(f"new.{col}" for col in columns)
+        old_values = ", ".join(f"old.{col}" for col in columns)
+        for trigger in ("insert", "delete", "update"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {fts}_{trigger}")
+        conn.execute(f"""
+            CREATE TRIGGER {fts}_insert AFTER INSERT ON {table}
+            WHEN COALESCE(new.content_compressed, 0) = 0 BEGIN
+                INSERT INTO {fts}(rowid, {names}) VALUES (new.rowid, {new_values});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {fts}_delete AFTER DELETE ON {table}
+            WHEN COALESCE(old.content_compressed, 0) = 0 BEGIN
+                INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.rowid, {old_values});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER {fts}_update AFTER UPDATE OF {names}, content_compressed ON {table} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {names})
+                    SELECT 'delete', old.rowid, {old_values} WHERE COALESCE(old.content_compressed, 0) = 0;
+                INSERT INTO {fts}(rowid, {names})
+                    SELECT new.rowid, {new_values} WHERE COALESCE(new.content_compressed, 0) = 0;
+            END
+        """)
+
+
+def add_analysis_model_version(conn):
+    # Which persisted analyze_local model labelled the row (NULL: none / another analyzer)
+    add_column(conn, "discussions", "analysis_model_version", "TEXT")
+
+
+def add_analysis_table(conn):
+    # One row per (discussion, analyzer, version), written by
+    # customer_intent_scraper.analysis.AnalysisStore. content_hash is the
+    # discussion's hash when it was analysed: a different current hash means
+    # the result is stale for that analyzer.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS analysis (
+            discussion_id TEXT,
+            analyzer TEXT,
+            version TEXT,
+            content_hash TEXT,
+            category TEXT,
+            product_area TEXT,
+            sentiment TEXT,
+            intent TEXT,
+            author_role TEXT,
+            cluster_id INTEGER,
+            summary TEXT,
+            pain_points TEXT,
+            analysed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (discussion_id, analyzer, version)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_analyzer_version ON analysis(analyzer, version)")
+
+    # What the app shows: the latest result of each analyzer, field by field
+    # preferring the LLM's over the local keyword/cluster labels
+    conn.execute("DROP VIEW IF EXISTS discussion_analysis")
+    conn.execute("""
+        CREATE VIEW discussion_analysis AS
+        SELECT
+            d.id AS discussion_id,
+            COALESCE(llm.category, loc.category) AS category,
+            COALESCE(llm.product_area, loc.product_area) AS product_area,
+            COALESCE(llm.sentiment, loc.sentiment) AS sentiment,
+            COALESCE(llm.intent, loc.intent) AS intent,
+            COALESCE(llm.author_role, loc.author_role) AS author_role,
+            loc.cluster_id AS cluster_id,
+            llm.summary AS summary,
+            llm.pain_points AS pain_points
+        FROM discussions d
+        LEFT JOIN analysis llm ON llm.rowid = (
+            SELECT rowid FROM analysis
+            WHERE discussion_id = d.id AND analyzer = 'llm'
+            ORDER BY analysed_at DESC, rowid DESC LIMIT 1
+        )
+        LEFT JOIN analysis loc ON loc.rowid = (
+            SELECT rowid FROM analysis
+            WHERE discussion_id = d.id AND analyzer = 'local'
+            ORDER BY analysed_at DESC, rowid DESC LIMIT 1
+        )
+    """)
+
+    # Move results out of the shared analysis_* columns. Only the LLM script
+    # wrote analysis_summary; "Topic: ..." categories are local cluster names.
+    # Results for content that changed since get no hash, so they count as stale.
+    local_category = "(analysis_category LIKE 'Topic:%' OR analysis_category = 'General / Short Content')"
+    stored_hash = "CASE WHEN analysis_dirty = 1 THEN NULL ELSE content_hash END"
+    conn.execute(f"""
+        INSERT OR IGNORE INTO analysis
+            (discussion_id, analyzer, version, content_hash, category, product_area, sentiment, intent, summary, pain_points)
+        SELECT id, 'llm', 'legacy', {stored_hash},
+               CASE WHEN {local_category} THEN NULL ELSE analysis_category END,
+               analysis_product_area, analysis_sentiment, analysis_intent, analysis_summary, analysis_pain_points
+        FROM discussions
+        WHERE analysis_summary IS NOT NULL
+    """)
+    conn.execute(f"""
+        INSERT OR IGNORE INTO analysis
+            (discussion_id, analyzer, version, content_hash, category, product_area, sentiment, intent, author_role, cluster_id)
+        SELECT id, 'local', COALESCE(analysis_model_version, 'legacy'), {stored_hash},
+               CASE WHEN {local_category} THEN analysis_category END,
+               analysis_product_area, analysis_sentiment, analysis_intent, analysis_author_role, analysis_cluster_id
+        FROM discussions
+        WHERE analysis_cluster_id IS NOT NULL OR analysis_author_role IS NOT NULL
+    """)
+
+
+def add_text_hash(conn):
+    # Analysis results go stale when a discussion's text changes, not when its
+    # kudos or reply count does: text_hash covers title and content only (see
+    # customer_intent_scraper.db). content_hash stops covering canonical_id,
+    # which writers without deduplication leave NULL. Existing rows get both
+    # hashes, and results that were current keep being current.
+    from customer_intent_scraper.db import (
+        DISCUSSION_COLUMNS, DISCUSSION_HASH_INDEXES, TEXT_HASH_INDEXES, ContentStore, row_hash,
+    )
+
+    add_column(conn, "discussions", "text_hash", "TEXT")
+    store = ContentStore(conn)
+    content_index = DISCUSSION_COLUMNS.index("content")
+    last_rowid = 0
+    while True:
+        rows = conn.execute(f"""
+            SELECT rowid, content_compressed, content_hash, {", ".join(DISCUSSION_COLUMNS)}
+            FROM discussions WHERE rowid > ? ORDER BY rowid LIMIT 1000
+        """, (last_rowid,)).fetchall()
+        if not rows:
+            break
+        last_rowid = rows[-1][0]
+        texts = store.load("discussions", [row[3] for row in rows if row[1]])
+        discussions, results = [], []
+        for _, compressed, old_hash, *values in rows:
+            if compressed:
+                values[content_index] = texts.get(values[0])
+            new_text_hash = row_hash(values, TEXT_HASH_INDEXES)
+            discussions.append((row_hash(values, DISCUSSION_HASH_INDEXES), new_text_hash, values[0]))
+            results.append((new_text_hash, values[0], old_hash))
+        conn.executemany(
+            "UPDATE analysis SET content_hash = ? WHERE discussion_id = ? AND content_hash = ?", results
+        )
+        conn.executemany("UPDATE discussions SET content_hash = ?, text_hash = ? WHERE id = ?", discussions)
+
+
+def drop_retired_indexes(conn):
+    # Analysis results moved to the analysis table in migration 9, so nothing filters on
+    # these columns any more and the indexes only slow down every discussions write
+    conn.execute("DROP INDEX IF EXISTS idx_discussions_analysis_category")
+    conn.execute("DROP INDEX IF EXISTS idx_discussions_analysis_intent")
+    conn.execute("DROP INDEX IF EXISTS idx_discussions_analysis_cluster_id")
+    conn.execute("DROP INDEX IF EXISTS idx_discussions_analysis_dirty")
+
+
+# (version, description, callable) — append only
+MIGRATIONS = [
+    (1, "discussions and replies tables", create_base_tables),
+    (2, "analysis columns", add_analysis_columns),
+    (3, "content hashes and re-analysis flag", add_change_tracking),
+    (4, "indexes for app filters, thread lookups and analysis", add_indexes),
+    (5, "FTS5 full-text index over discussions and replies", add_full_text_search),
+    (6, "MinHash LSH tables and canonical_id for near-duplicates", add_near_duplicate_index),
+    (7, "compressed content side tables", add_content_storage),
+    (8, "model version of local analysis results", add_analysis_model_version),
+    (9, "analysis results table and discussion_analysis view", add_analysis_table),
+    (10, "text_hash: analysis staleness from title and content only", add_text_hash),
+    (11, "drop indexes on the retired analysis_* columns", drop_retired_indexes),
+]
+
+
+def current_version(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    """Bring the database up to the latest schema version and return it."""
+    # WAL lets readers (the dedup lookups, the app, analysis scripts) go on while
+    # the pipeline's writer thread commits. The mode is stored in the file.
+    conn.execute("PRAGMA journal_mode=WAL")
+    latest = MIGRATIONS[-1][0]
+    if current_version(conn) >= latest:
+        conn.commit()
+        return latest
+
+    # Take the write lock before re-reading the version so concurrent
+    # processes (crawler + analysis script) don't apply the same step twice
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = current_version(conn)
+        for number, description, migration in MIGRATIONS:
+            if number <= version:
+                continue
+            migration(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (number, description)
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return latest
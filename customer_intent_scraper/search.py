@@ -0,0 +1,88 @@
+import re
+import sqlite3
+
+# "quoted phrase" | word | word* (prefix)
+TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+WORD_RE = re.compile(r"\w+")
+
+# bm25 column weights: a hit in the title counts for more than one in the body
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+
+def build_fts_query(text):
+    """Turn sidebar input into a safe FTS5 MATCH expression.
+
+    ``"copilot license"`` searches the phrase, ``teams`` the word and
+    ``lic*`` any word starting with "lic". All terms must match. Everything is
+    quoted, so FTS5 operators and punctuation typed by users can't cause a
+    syntax error. Returns None when nothing searchable is left.
+    """
+    terms = []
+    for phrase, word in TOKEN_RE.findall(text or ""):
+        if phrase:
+            words = WORD_RE.findall(phrase)
+            if words:
+                terms.append('"' + " ".join(words) + '"')
+            continue
+        prefix = word.endswith("*")
+        for part in WORD_RE.findall(word):
+            terms.append(f'"{part}"')
+        if prefix and terms and WORD_RE.search(word):
+            terms[-1] += "*"
+    return " ".join(terms) or None
+
+
+def fts_available(conn):
+    row = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name IN ('discussions_fts', 'replies_fts')"
+    ).fetchone()
+    return row[0] == 2
+
+
+def search_discussions(conn, text, limit=1000, include_replies=True):
+    """Rank discussions matching ``text`` by bm25 (best first).
+
+    A discussion matches through its own title/content or, with
+    ``include_replies``, through any of its replies. Returns a list of
+    ``(discussion_id, score)``; lower scores are better, as in FTS5.
+    """
+    query = build_fts_query(text)
+    if not query:
+        return []
+
+    parts = [f"""
+        SELECT d.id AS id, bm25(discussions_fts, {TITLE_WEIGHT}, {CONTENT_WEIGHT}) AS score
+        FROM discussions_fts
+        JOIN discussions d ON d.rowid = discussions_fts.rowid
+        WHERE discussions_fts MATCH :query
+    """]
+    if include_replies:
+        parts.append("""
+            SELECT r.parent_id AS id, bm25(replies_fts) AS score
+            FROM replies_fts
+            JOIN replies r ON r.rowid = replies_fts.rowid
+            WHERE replies_fts MATCH :query
+        """)
+
+    sql = f"""
+        SELECT id, MIN(score) AS score
+        FROM ({" UNION ALL ".join(parts)})
+        GROUP BY id
+        ORDER BY score
+        LIMIT :limit
+    """
+    return conn.execute(sql, {"query": query, "limit": limit}).fetchall()
+
+
+def search_discussion_ids(db_path, text, limit=1000):
+    # Convenience wrapper for the app; None means "FTS not usable, fall back"
+    conn = sqlite3.connect(db_path)
+    try:
+        if not fts_available(conn):
+            return None
+        return search_discussions(conn, text, limit=limit)
+    except sqlite3.OperationalError:
+        return None
+    finally:
+        conn.close()
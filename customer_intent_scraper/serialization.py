@@ -0,0 +1,65 @@
+import gzip
+import json
+import logging
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Compact encodings for JSON payloads (reply fixtures, cache entries, archives).
+# "json" is plain compact JSON, "gzip" and "zstd" compress it. Decoding sniffs
+# the magic bytes, so readers never need to know which codec wrote a blob.
+CODECS = ("json", "gzip", "zstd")
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def resolve_codec(codec):
+    codec = (codec or "json").lower()
+    if codec not in CODECS:
+        raise ValueError(f"Unknown serialization codec: {codec} (expected one of {', '.join(CODECS)})")
+    if codec == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed; falling back to gzip")
+        return "gzip"
+    return codec
+
+
+def compress(raw, codec):
+    codec = resolve_codec(codec)
+    if codec == "gzip":
+        # mtime=0 keeps the output byte-identical across runs (stable fixtures)
+        return gzip.compress(raw, compresslevel=6, mtime=0)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(raw)
+    return raw
+
+
+def decompress(blob):
+    blob = bytes(blob)
+    if blob.startswith(GZIP_MAGIC):
+        return gzip.decompress(blob)
+    if blob.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed payloads")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    if blob[:1] == b"\x78":
+        # Plain zlib streams (older cache and cassette entries)
+        try:
+            return zlib.decompress(blob)
+        except zlib.error:
+            pass
+    return blob
+
+
+def encode_json(data, codec="json"):
+    raw = json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return compress(raw, codec)
+
+
+def decode_json(blob):
+    return json.loads(decompress(blob))
@@ -37,6 +37,31 @@ PLAYWRIGHT_LAUNCH_OPTIONS = {
 # Increase default navigation timeout to 60 seconds
 PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT = 60 * 1000
 
+# Captured GraphQL replies are kept in a bounded LRU cache (see stores.BoundedCache).
+# Set REPLIES_CACHE_DB to a file path to add a shared SQLite tier that survives restarts.
+REPLIES_CACHE_MAX_ENTRIES = 1000
+REPLIES_CACHE_MAX_BYTES = 64 * 1024 * 1024
+REPLIES_CACHE_TTL = 3600  # seconds, 0 to keep entries until evicted
+REPLIES_CACHE_DB = None
+# Rows kept in the SQLite tier (newest first, 0 for no limit); expired rows are deleted too
+REPLIES_CACHE_MAX_DISK_ENTRIES = 100000
+# Codec for entries in the SQLite tier: "json", "gzip" or "zstd" (needs the zstandard package)
+REPLIES_CACHE_CODEC = "gzip"
+
+# How TechcommunityReplies inputs are saved in fixtures: "pretty" (indented JSON),
+# or compact "json", "gzip", "zstd". All formats remain readable.
+REPLIES_SERIALIZATION = "pretty"
+
+# Every GraphQL response a Playwright page downloads is kept here so the spider
+# can answer identical API calls without fetching them again.
+GRAPHQL_CAPTURE_MAX_ENTRIES = 1000
+GRAPHQL_CAPTURE_MAX_BYTES = 64 * 1024 * 1024
+GRAPHQL_CAPTURE_TTL = 3600
+
+# Root URL the techcommunity spider crawls and sends GraphQL calls to.
+# Point it at techcommunity_emulator.py (e.g. http://127.0.0.1:8080) for scale tests.
+TECHCOMMUNITY_BASE_URL = "https://techcommunity.microsoft.com"
+
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 #USER_AGENT = "customer_intent_scraper (+http://www.yourdomain.com)"
@@ -69,9 +94,23 @@ DOWNLOAD_DELAY = 1
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "customer_intent_scraper.middlewares.CustomerIntentScraperDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    "customer_intent_scraper.middlewares.CustomerIntentScraperDownloaderMiddleware": 543,
+}
+
+# Record/replay traffic for offline benchmarking (disabled unless a mode is set)
+# "record" stores every request/response in CASSETTE_PATH, "replay" serves them back
+CASSETTE_MODE = None
+CASSETTE_PATH = "cassette.db"
+# Artificial delay (seconds) added to each replayed response, +/- jitter
+CASSETTE_REPLAY_LATENCY = 0.0
+CASSETTE_REPLAY_JITTER = 0.0
+
+# Archive every raw list, detail and replies payload the spider parses (disabled when None),
+# compressed with PAYLOAD_ARCHIVE_CODEC ("json", "gzip" or "zstd").
+# reextract.py replays the archive through the parsers after a parsing fix.
+PAYLOAD_ARCHIVE_PATH = None
+PAYLOAD_ARCHIVE_CODEC = "zstd"
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
@@ -83,9 +122,47 @@ DOWNLOAD_DELAY = 1
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
    "customer_intent_scraper.pipelines.CustomerIntentScraperPipeline": 300,
+   "customer_intent_scraper.pipelines.NearDuplicatePipeline": 350,
    "customer_intent_scraper.pipelines.SQLitePipeline": 400,
+   "customer_intent_scraper.pipelines.ParquetPipeline": 410,
 }
 
+# CustomerIntentScraperPipeline logs one in this many dropped replies (DEBUG level);
+# the full counts are in the cleaning/* crawl stats
+CLEANING_LOG_SAMPLE_RATE = 100
+
+# NearDuplicatePipeline: MinHash signatures (DEDUP_NUM_PERM permutations) bucketed into
+# DEDUP_BANDS LSH bands; candidates at or above DEDUP_THRESHOLD estimated Jaccard
+# similarity get the first-seen copy's id as canonical_id
+DEDUP_NUM_PERM = 128
+DEDUP_BANDS = 16
+DEDUP_THRESHOLD = 0.8
+DEDUP_BATCH_SIZE = 500
+
+# ParquetPipeline: set PARQUET_EXPORT_DIR to also write partitioned Parquet datasets
+# (needs pyarrow). Rows are buffered per platform/month partition and written as
+# row groups of PARQUET_ROW_GROUP_SIZE rows.
+PARQUET_EXPORT_DIR = None
+PARQUET_ROW_GROUP_SIZE = 10000
+PARQUET_COMPRESSION = "zstd"
+
+# SQLitePipeline writes from a background thread, one transaction per batch:
+# every SQLITE_BATCH_SIZE rows (discussions + replies) or SQLITE_FLUSH_INTERVAL seconds
+SQLITE_BATCH_SIZE = 500
+SQLITE_FLUSH_INTERVAL = 5.0
+# Items queued for the SQLite writer thread before the pipeline applies backpressure
+SQLITE_WRITER_QUEUE_SIZE = 1000
+
+# Optional compression of long discussion/reply content (needs zstandard): content of at
+# least CONTENT_COMPRESSION_MIN_BYTES is stored zstd-compressed in a side table, using a
+# dictionary trained on the first CONTENT_DICT_SAMPLES posts. Existing rows can be
+# converted with compress_content.py.
+CONTENT_COMPRESSION = None  # or "zstd"
+CONTENT_COMPRESSION_LEVEL = 10
+CONTENT_COMPRESSION_MIN_BYTES = 512
+CONTENT_DICT_SIZE = 112640
+CONTENT_DICT_SAMPLES = 2000
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 #AUTOTHROTTLE_ENABLED = True
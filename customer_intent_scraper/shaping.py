@@ -0,0 +1,130 @@
+import math
+import re
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Keeps what analyze_intent sends to the model within a predictable size:
+# a token estimate that needs no network, stripping of text that carries no
+# signal (greetings, sign-offs, "mark as answer" footers, long URLs) and
+# head/tail truncation to a token budget. Posts are stored with whitespace
+# collapsed, so the patterns work on single-line text.
+
+# Used when tiktoken is not installed: ASCII letters cost about one token per
+# 4 characters, digits per 3, other scripts (CJK) and symbols one per character
+PIECE_RE = re.compile(r"[^\W\d_]+|\d+|[^\w\s]|_")
+WORD_RE = re.compile(r"\S+\s*")
+
+BOILERPLATE_PATTERNS = [
+    # Greetings opening a post
+    r"^(?:hi|hello|hey|dear|greetings)(?: (?:all|everyone|team|there|folks|guys|community))?\s*[,!.:]\s*",
+    # Forum footers
+    r"\bplease (?:mark|accept)\b[^.!?]*\b(?:answer|response|resolved|solution)\b[^.!?]*[.!?]?",
+    r"\b(?:did|was) (?:this|my) (?:reply|answer|post) (?:help|helpful)[^.!?]*[.!?]?",
+    r"\bsent from my \w+(?: \w+)?",
+    r"\bget outlook for \w+",
+    r"\(\s*linkedin\s*\)",
+    # Sign-offs closing a post (after its last sentence), with up to three words of name
+    r"(?:(?<=[.!?,:;)])|^)\s*(?:(?:best|kind|warm|many) regards|regards|cheers|br|hope this helps|thanks(?: in advance| a lot)?"
+    r"|thank you(?: in advance| very much)?|many thanks)\s*[,!.]?(?:\s+[\w.'-]+){0,3}\s*[.!]?\s*$",
+    # Decoration: one symbol repeated (=====, ****, ~~~) or a run of emoji and
+    # box-drawing characters. Mixed symbols are left alone, they are usually
+    # code or formulas ("x => { ... }", "a <= b*c")
+    r"([^\w\s.!?])\1{2,}",
+    r"(?:[\u2500-\u259f\u2600-\u27bf\U0001f300-\U0001faff]\s*){3,}",
+]
+BOILERPLATE_RE = [re.compile(pattern, re.IGNORECASE) for pattern in BOILERPLATE_PATTERNS]
+URL_RE = re.compile(r"https?://([^/\s]+)\S*")
+SPACES_RE = re.compile(r"\s{2,}")
+
+TRUNCATION_MARKER = " [...] "
+
+_encoding = None
+
+
+def _tiktoken_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("o200k_base")
+    return _encoding
+
+
+def estimate_tokens(text):
+    """Tokens ``text`` will cost: exact with tiktoken installed, a close estimate otherwise."""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_tiktoken_encoding().encode(text, disallowed_special=()))
+    tokens = 0
+    for piece in PIECE_RE.findall(text):
+        if piece[0].isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif piece.isascii():
+            tokens += math.ceil(len(piece) / 4)
+        else:
+            tokens += len(piece)
+    return tokens
+
+
+def strip_boilerplate(text):
+    """Drop greetings, sign-offs, forum footers and decoration; shorten URLs to their host."""
+    if not text:
+        return text
+    for pattern in BOILERPLATE_RE:
+        text = pattern.sub(" ", text)
+    text = URL_RE.sub(r"[link: \1]", text)
+    return SPACES_RE.sub(" ", text).strip()
+
+
+def truncate(text, max_tokens, head_ratio=0.7):
+    """Keep the start and the end of ``text`` within ``max_tokens``, cutting at word boundaries.
+
+    The opening usually states the problem and the end the latest detail or
+    question, so the middle is what goes. ``max_tokens`` of 0 means no limit.
+    """
+    if not text or not max_tokens or estimate_tokens(text) <= max_tokens:
+        return text
+    words = WORD_RE.findall(text)
+    budget = max_tokens - estimate_tokens(TRUNCATION_MARKER)
+    head_budget = int(budget * head_ratio)
+    tail_budget = budget - head_budget
+
+    head, used = 0, 0
+    while head < len(words):
+        cost = estimate_tokens(words[head])
+        if used + cost > head_budget:
+            break
+        used += cost
+        head += 1
+    tail, used = len(words), 0
+    while tail > head:
+        cost = estimate_tokens(words[tail - 1])
+        if used + cost > tail_budget:
+            break
+        used += cost
+        tail -= 1
+    if head == 0 and tail == len(words):
+        # Words longer than the budget (a pasted log line, base64): cut by characters
+        return _cut(text, head_budget).rstrip() + TRUNCATION_MARKER + _cut(text, tail_budget, from_end=True).lstrip()
+    return "".join(words[:head]).rstrip() + TRUNCATION_MARKER + "".join(words[tail:]).lstrip()
+
+
+def _cut(text, max_tokens, from_end=False):
+    """The longest start (or end) of ``text`` that fits in ``max_tokens``."""
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        piece = text[len(text) - middle:] if from_end else text[:middle]
+        if estimate_tokens(piece) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[len(text) - low:] if from_end else text[:low]
+
+
+def shape_text(text, max_tokens, head_ratio=0.7, strip=True):
+    if strip:
+        text = strip_boilerplate(text)
+    return truncate(text, max_tokens, head_ratio)
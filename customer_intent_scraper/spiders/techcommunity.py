@@ -5,22 +5,29 @@ import asyncio
 import sys
 import re
 import html
+import time
 from datetime import datetime
+from urllib.parse import urlparse
 
 # Fix for Windows Event Loop Policy
 if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
+from scrapy.http import TextResponse
 from scrapy_playwright.page import PageMethod
 from customer_intent_scraper.pages.techcommunity_microsoft_com import TechcommunityMicrosoftComDiscussionItemPage
 from customer_intent_scraper.handlers import handle_graphql_response
+from customer_intent_scraper.stores import PayloadArchive, configure_graphql_capture, graphql_capture, graphql_key
 
 class TechcommunitySpider(scrapy.Spider):
     name = "techcommunity"
     allowed_domains = ["techcommunity.microsoft.com"]
     
-    # Default URL if none provided
-    default_url = "https://techcommunity.microsoft.com/category/microsoft365copilot/discussions/microsoft365copilot"
+    # Site root; overridden by the TECHCOMMUNITY_BASE_URL setting (e.g. to target a local emulator)
+    base_url = "https://techcommunity.microsoft.com"
+
+    # Default board path if no URLs provided
+    default_path = "/category/microsoft365copilot/discussions/microsoft365copilot"
 
     def __init__(self, urls=None, max_pages=None, *args, **kwargs):
         super(TechcommunitySpider, self).__init__(*args, **kwargs)
@@ -34,7 +41,7 @@ class TechcommunitySpider(scrapy.Spider):
             elif isinstance(urls, list):
                 self.start_urls = urls
         else:
-            self.start_urls = [self.default_url]
+            self.start_urls = [self.base_url + self.default_path]
             
         self.max_pages = int(max_pages) if max_pages else None
         self.seen_links = set()
@@ -42,6 +49,7 @@ class TechcommunitySpider(scrapy.Spider):
         self.api_headers = None
         self.api_cookies = None
         self.board_id = None
+        self.archive = None
         
         # Load previously scraped links to avoid re-crawling
         # Commented out to ensure we pick up new replies on existing threads
@@ -59,6 +67,92 @@ class TechcommunitySpider(scrapy.Spider):
         #     except Exception as e:
         #         self.logger.warning(f"Could not load previous links: {e}")
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(TechcommunitySpider, cls).from_crawler(crawler, *args, **kwargs)
+        configure_graphql_capture(crawler.settings)
+
+        base_url = crawler.settings.get("TECHCOMMUNITY_BASE_URL")
+        if base_url:
+            base_url = base_url.rstrip("/")
+            if spider.start_urls == [spider.base_url + spider.default_path]:
+                spider.start_urls = [base_url + spider.default_path]
+            spider.base_url = base_url
+            spider.allowed_domains = [urlparse(base_url).hostname]
+
+        archive_path = crawler.settings.get("PAYLOAD_ARCHIVE_PATH")
+        if archive_path:
+            spider.archive = PayloadArchive(archive_path, codec=crawler.settings.get("PAYLOAD_ARCHIVE_CODEC", "zstd"))
+            crawler.signals.connect(spider.close_archive, signal=scrapy.signals.spider_closed)
+        return spider
+
+    def close_archive(self, spider):
+        self.logger.info(f"Archived payloads in {self.archive.path}: {self.archive.counts()}")
+        self.archive.close()
+
+    def archive_payload(self, kind, message_id, body, url=None, root_id=None, fetched_at=None):
+        # Raw input of the parsers, for reextract.py; a no-op unless PAYLOAD_ARCHIVE_PATH is set
+        if self.archive is None:
+            return
+        self.archive.put(kind, message_id, body, url=url, root_id=root_id, fetched_at=fetched_at)
+        self.crawler.stats.inc_value(f"payload_archive/{kind}", spider=self)
+
+    def graphql_url(self, operation_name):
+        return f"{self.base_url}/t5/s/api/2.1/graphql?opname={operation_name}"
+
+    def graphql_request(self, payload, callback, meta, dont_filter=False):
+        """Yield a GraphQL API request, unless the browser already downloaded the same call."""
+        operation_name = payload["operationName"]
+        captured = graphql_capture.get(graphql_key(operation_name, payload["variables"]))
+        if captured is not None:
+            yield from self.replay_captured(payload, captured["data"], callback, meta)
+            return
+
+        yield scrapy.Request(
+            url=self.graphql_url(operation_name),
+            method="POST",
+            body=json.dumps(payload),
+            headers=self.api_headers,
+            cookies=self.api_cookies,
+            callback=callback,
+            meta=meta,
+            dont_filter=dont_filter
+        )
+
+    def replay_captured(self, payload, data, callback, meta):
+        # Feed a captured response straight into the callback instead of downloading it again
+        operation_name = payload["operationName"]
+        self.logger.info(f"Reusing {operation_name} response captured by the browser")
+        self.crawler.stats.inc_value(f"graphql_capture/reused/{operation_name}", spider=self)
+
+        url = self.graphql_url(operation_name)
+        request = scrapy.Request(url, method="POST", body=json.dumps(payload), meta=meta, dont_filter=True)
+        response = TextResponse(url=url, body=json.dumps(data).encode("utf-8"), encoding="utf-8", request=request)
+        yield from callback(response)
+
+    def captured_list_page(self, board_id):
+        """First listing page for a board, if the bootstrap page's own widget already fetched it.
+
+        The widget asks for different fields than build_payload, but parse_api_list
+        only needs ids, links and pageInfo, so a first page with the same board,
+        depth, sort order and page size can seed the pagination. A capture with a
+        different page size is not reused: its endCursor and the page count would
+        not line up with the pages fetched after it.
+        """
+        wanted = self.build_payload(board_id)["variables"]
+        for _, entry in graphql_capture.items("MessageViewsForWidget:"):
+            variables = entry["variables"]
+            constraints = variables.get("constraints") or {}
+            if (
+                variables.get("after") is None
+                and variables.get("first") == wanted["first"]
+                and constraints.get("boardId") == wanted["constraints"]["boardId"]
+                and constraints.get("depth") == wanted["constraints"]["depth"]
+                and variables.get("sorts") == wanted["sorts"]
+            ):
+                return entry["data"]
+        return None
+
     def capture_api_request(self, request):
         # print(f"DEBUG: Request seen: {request.url}")
         if "graphql" in request.url and request.method == "POST":
@@ -76,6 +170,7 @@ class TechcommunitySpider(scrapy.Spider):
                     "playwright_include_page": True,
                     "playwright_page_event_handlers": {
                         "request": self.capture_api_request,
+                        "response": handle_graphql_response,
                     },
                     "playwright_page_methods": [
                         PageMethod("wait_for_timeout", 10000), # Wait for initial requests
@@ -173,19 +268,20 @@ class TechcommunitySpider(scrapy.Spider):
         self.logger.info(f"Captured API headers and cookies. Switching to API mode for board {board_id}.")
         
         # Start API loop
-        yield scrapy.Request(
-            url="https://techcommunity.microsoft.com/t5/s/api/2.1/graphql?opname=MessageViewsForWidget",
-            method="POST",
-            body=json.dumps(self.build_payload(board_id, cursor=None)),
-            headers=self.api_headers,
-            cookies=self.api_cookies,
-            callback=self.parse_api_list,
-            meta={"board_id": board_id, "page_count": 1}
-        )
+        payload = self.build_payload(board_id, cursor=None)
+        meta = {"board_id": board_id, "page_count": 1}
+        captured = self.captured_list_page(board_id)
+        if captured is not None:
+            results = self.replay_captured(payload, captured, self.parse_api_list, meta)
+        else:
+            results = self.graphql_request(payload, self.parse_api_list, meta)
+        for result in results:
+            yield result
 
     def parse_api_list(self, response):
         board_id = response.meta.get("board_id")
         page_count = response.meta.get("page_count", 1)
+        self.archive_payload("list", f"{board_id}:{page_count}", response.body, url=response.url)
         try:
             data = json.loads(response.body)
             
@@ -206,7 +302,7 @@ class TechcommunitySpider(scrapy.Spider):
                     # Construct URL from ID
                     msg_id = node.get("id", "").replace("message:", "")
                     if msg_id:
-                        url = f"https://techcommunity.microsoft.com/t5/microsoft-365-copilot/discussion/m-p/{msg_id}"
+                        url = f"{self.base_url}/t5/microsoft-365-copilot/discussion/m-p/{msg_id}"
                 
                 if url:
                     # We no longer skip previous links to ensure we catch new replies/updates
@@ -242,14 +338,10 @@ class TechcommunitySpider(scrapy.Spider):
                 end_cursor = page_info.get("endCursor")
                 if end_cursor:
                     self.logger.info(f"Fetching next page ({page_count + 1}) with cursor: {end_cursor} for board {board_id}")
-                    yield scrapy.Request(
-                        url="https://techcommunity.microsoft.com/t5/s/api/2.1/graphql?opname=MessageViewsForWidget",
-                        method="POST",
-                        body=json.dumps(self.build_payload(board_id, cursor=end_cursor)),
-                        headers=self.api_headers,
-                        cookies=self.api_cookies,
-                        callback=self.parse_api_list,
-                        meta={"board_id": board_id, "page_count": page_count + 1}
+                    yield from self.graphql_request(
+                        self.build_payload(board_id, cursor=end_cursor),
+                        self.parse_api_list,
+                        {"board_id": board_id, "page_count": page_count + 1}
                     )
             else:
                 self.logger.info(f"No more pages in API for board {board_id}.")
@@ -260,6 +352,15 @@ class TechcommunitySpider(scrapy.Spider):
 
     async def parse_discussion(self, response, page: TechcommunityMicrosoftComDiscussionItemPage):
         item = await page.to_item()
+
+        if self.archive is not None:
+            message_id = item.get('message_id') or response.url
+            fetched_at = time.time()
+            self.archive_payload("detail", message_id, response.body, url=response.url, root_id=message_id, fetched_at=fetched_at)
+            if page.replies_input and page.replies_input.data:
+                # Replies the browser captured for this page are part of the page object's input
+                self.archive_payload("captured_replies", message_id, json.dumps(page.replies_input.data),
+                                     url=response.url, root_id=message_id, fetched_at=fetched_at)
         
         # Check if we need to fetch more replies
         reply_count = item.get('reply_count') or 0
@@ -270,14 +371,10 @@ class TechcommunitySpider(scrapy.Spider):
         if reply_count > extracted_count and self.api_headers and message_id:
             self.logger.info(f"Fetching more replies for {message_id} ({extracted_count}/{reply_count})")
             
-            yield scrapy.Request(
-                url="https://techcommunity.microsoft.com/t5/s/api/2.1/graphql?opname=MessageReplies",
-                method="POST",
-                body=json.dumps(self.build_replies_payload(message_id, cursor=None)),
-                headers=self.api_headers,
-                cookies=self.api_cookies,
-                callback=self.parse_replies_api,
-                meta={
+            requests = self.graphql_request(
+                self.build_replies_payload(message_id, cursor=None),
+                self.parse_replies_api,
+                {
                     "item": item, 
                     "message_id": message_id,
                     "root_message_id": message_id,
@@ -286,6 +383,8 @@ class TechcommunitySpider(scrapy.Spider):
                 },
                 dont_filter=True
             )
+            for request in requests:
+                yield request
         else:
             yield item
 
@@ -398,6 +497,36 @@ class TechcommunitySpider(scrapy.Spider):
                 missing_ids.extend(nested_missing)
         return replies, missing_ids
 
+    def merge_replies(self, item, new_replies):
+        # Merge with existing replies
+        existing_replies = item.get('replies') or []
+        
+        # Create a set of IDs for existing replies
+        seen_ids = set()
+        for r in existing_replies:
+            rid = r.get('id')
+            if rid:
+                seen_ids.add(rid)
+            else:
+                author = r.get('author')
+                date = r.get('publish_date')
+                sig = f"{author}_{date}"
+                seen_ids.add(sig)
+        
+        for r in new_replies:
+            rid = r.get('id')
+            if rid:
+                if rid not in seen_ids:
+                    existing_replies.append(r)
+                    seen_ids.add(rid)
+            else:
+                sig = f"{r.get('author')}_{r.get('publish_date')}"
+                if sig not in seen_ids:
+                    existing_replies.append(r)
+                    seen_ids.add(sig)
+        
+        item['replies'] = existing_replies
+
     def parse_replies_api(self, response):
         item = response.meta["item"]
         message_id = response.meta["message_id"]
@@ -410,6 +539,7 @@ class TechcommunitySpider(scrapy.Spider):
             visited_ids = set(visited_ids)
             
         visited_ids.add(message_id)
+        self.archive_payload("replies", message_id, response.body, url=response.url, root_id=root_message_id)
         
         try:
             data = json.loads(response.body)
@@ -427,34 +557,7 @@ class TechcommunitySpider(scrapy.Spider):
                 new_replies, missing_ids = self._extract_replies_recursive(edges)
                 self.logger.info(f"Extracted {len(new_replies)} total replies from this batch for {message_id}. Found {len(missing_ids)} incomplete nodes.")
                 
-                # Merge with existing replies
-                existing_replies = item.get('replies') or []
-                
-                # Create a set of IDs for existing replies
-                seen_ids = set()
-                for r in existing_replies:
-                    rid = r.get('id')
-                    if rid:
-                        seen_ids.add(rid)
-                    else:
-                        author = r.get('author')
-                        date = r.get('publish_date')
-                        sig = f"{author}_{date}"
-                        seen_ids.add(sig)
-                
-                for r in new_replies:
-                    rid = r.get('id')
-                    if rid:
-                        if rid not in seen_ids:
-                            existing_replies.append(r)
-                            seen_ids.add(rid)
-                    else:
-                        sig = f"{r.get('author')}_{r.get('publish_date')}"
-                        if sig not in seen_ids:
-                            existing_replies.append(r)
-                            seen_ids.add(sig)
-                
-                item['replies'] = existing_replies
+                self.merge_replies(item, new_replies)
                 
                 # Add missing IDs to queue if not visited
                 for mid in missing_ids:
@@ -465,14 +568,10 @@ class TechcommunitySpider(scrapy.Spider):
             if reply_queue:
                 next_id = reply_queue.pop(0)
                 self.logger.info(f"Fetching missing nested replies for {next_id}. Queue size: {len(reply_queue)}")
-                yield scrapy.Request(
-                    url="https://techcommunity.microsoft.com/t5/s/api/2.1/graphql?opname=MessageReplies",
-                    method="POST",
-                    body=json.dumps(self.build_replies_payload(next_id, cursor=None)),
-                    headers=self.api_headers,
-                    cookies=self.api_cookies,
-                    callback=self.parse_replies_api,
-                    meta={
+                yield from self.graphql_request(
+                    self.build_replies_payload(next_id, cursor=None),
+                    self.parse_replies_api,
+                    {
                         "item": item, 
                         "message_id": next_id, 
                         "root_message_id": root_message_id,
@@ -491,14 +590,10 @@ class TechcommunitySpider(scrapy.Spider):
                         end_cursor = page_info.get("endCursor")
                         if end_cursor:
                             self.logger.info(f"Fetching next page for {message_id}")
-                            yield scrapy.Request(
-                                url="https://techcommunity.microsoft.com/t5/s/api/2.1/graphql?opname=MessageReplies",
-                                method="POST",
-                                body=json.dumps(self.build_replies_payload(message_id, cursor=end_cursor)),
-                                headers=self.api_headers,
-                                cookies=self.api_cookies,
-                                callback=self.parse_replies_api,
-                                meta={
+                            yield from self.graphql_request(
+                                self.build_replies_payload(message_id, cursor=end_cursor),
+                                self.parse_replies_api,
+                                {
                                     "item": item, 
                                     "message_id": message_id, 
                                     "root_message_id": root_message_id,
@@ -517,14 +612,10 @@ class TechcommunitySpider(scrapy.Spider):
             # Try to continue with queue if possible
             if reply_queue:
                  next_id = reply_queue.pop(0)
-                 yield scrapy.Request(
-                    url="https://techcommunity.microsoft.com/t5/s/api/2.1/graphql?opname=MessageReplies",
-                    method="POST",
-                    body=json.dumps(self.build_replies_payload(next_id, cursor=None)),
-                    headers=self.api_headers,
-                    cookies=self.api_cookies,
-                    callback=self.parse_replies_api,
-                    meta={
+                 yield from self.graphql_request(
+                    self.build_replies_payload(next_id, cursor=None),
+                    self.parse_replies_api,
+                    {
                         "item": item, 
                         "message_id": next_id, 
                         "root_message_id": root_message_id,
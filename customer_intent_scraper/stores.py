@@ -1,4 +1,383 @@
-# Simple in-memory store for captured GraphQL responses
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from customer_intent_scraper.serialization import compress, decompress, resolve_codec
+
+
+class BoundedCache:
+    """In-memory LRU cache with TTL and byte-size limits, plus an optional SQLite tier.
+
+    Values must be JSON serialisable; their encoded size is what counts
+    against ``max_bytes``. When ``db_path`` is set every entry is also written
+    to disk, so other processes (and later runs) can read it back after the
+    in-memory copy has been evicted. The disk tier drops expired rows and keeps
+    at most ``max_disk_entries`` (0 for no limit), newest first; it is pruned
+    when configured and every ``PRUNE_EVERY`` writes.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024, ttl=3600, db_path=None, codec="gzip",
+                 max_disk_entries=100000):
+        self.lock = threading.RLock()
+        self.codec = codec
+        self.entries = OrderedDict()  # key -> (value, size, stored_at)
+        self.size = 0
+        self.conn = None
+        self.writes = 0
+        self.stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "expirations": 0, "disk_pruned": 0}
+        self.configure(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl, db_path=db_path,
+                       max_disk_entries=max_disk_entries)
+
+    def configure(self, max_entries=None, max_bytes=None, ttl=None, db_path=None, codec=None, max_disk_entries=None):
+        with self.lock:
+            if codec is not None:
+                self.codec = resolve_codec(codec)
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            if ttl is not None:
+                self.ttl = ttl
+            if max_disk_entries is not None:
+                self.max_disk_entries = max_disk_entries
+            if db_path and (self.conn is None or self.db_path != db_path):
+                if self.conn is not None:
+                    self.conn.close()
+                self.db_path = db_path
+                self.conn = sqlite3.connect(db_path, check_same_thread=False)
+                self.conn.execute("""
+                    CREATE TABLE IF NOT EXISTS cache_entries (
+                        key TEXT PRIMARY KEY,
+                        value BLOB,
+                        stored_at REAL
+                    )
+                """)
+                self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_stored_at ON cache_entries(stored_at)")
+                self.conn.commit()
+            self._evict()
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Delete expired rows and the oldest ones beyond ``max_disk_entries`` from the SQLite tier."""
+        with self.lock:
+            if self.conn is None:
+                return 0
+            pruned = 0
+            if self.ttl:
+                pruned += self.conn.execute(
+                    "DELETE FROM cache_entries WHERE stored_at < ?", (time.time() - self.ttl,)
+                ).rowcount
+            if self.max_disk_entries:
+                pruned += self.conn.execute("""
+                    DELETE FROM cache_entries WHERE key IN (
+                        SELECT key FROM cache_entries ORDER BY stored_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_disk_entries,)).rowcount
+            self.conn.commit()
+            self.writes = 0
+            self.stats["disk_pruned"] += pruned
+            return pruned
+
+    def _expired(self, stored_at, now):
+        return self.ttl and now - stored_at > self.ttl
+
+    def _evict(self):
+        now = time.time()
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            _, (_, size, _) = self.entries.popitem(last=False)
+            self.size -= size
+            self.stats["evictions"] += 1
+        # Expired entries are dropped lazily from the cold end
+        while self.entries:
+            key, (_, size, stored_at) = next(iter(self.entries.items()))
+            if not self._expired(stored_at, now):
+                break
+            del self.entries[key]
+            self.size -= size
+            self.stats["expirations"] += 1
+
+    def _remember(self, key, value, size, stored_at):
+        old = self.entries.pop(key, None)
+        if old:
+            self.size -= old[1]
+        self.entries[key] = (value, size, stored_at)
+        self.size += size
+        self._evict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            now = time.time()
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, size, stored_at = entry
+                if not self._expired(stored_at, now):
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self.entries[key]
+                self.size -= size
+                self.stats["expirations"] += 1
+
+            if self.conn is not None:
+                row = self.conn.execute(
+                    "SELECT value, stored_at FROM cache_entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[1], now):
+                    raw = decompress(row[0])
+                    value = json.loads(raw)
+                    self._remember(key, value, len(raw), row[1])
+                    self.stats["disk_hits"] += 1
+                    return value
+
+            self.stats["misses"] += 1
+            return default
+
+    def set(self, key, value):
+        raw = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        now = time.time()
+        with self.lock:
+            self._remember(key, value, len(raw), now)
+            if self.conn is not None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (key, value, stored_at) VALUES (?, ?, ?)",
+                    (key, compress(raw, self.codec), now)
+                )
+                self.conn.commit()
+                self.writes += 1
+                if self.writes >= self.PRUNE_EVERY:
+                    self.prune_disk()
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __contains__(self, key):
+        # Same answer as get() would give, without touching the stats or the LRU order
+        with self.lock:
+            now = time.time()
+            entry = self.entries.get(key)
+            if entry is not None and not self._expired(entry[2], now):
+                return True
+            if self.conn is not None:
+                row = self.conn.execute("SELECT stored_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+                return bool(row) and not self._expired(row[0], now)
+            return False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def items(self, prefix=""):
+        """Snapshot of live in-memory entries whose key starts with ``prefix``."""
+        now = time.time()
+        with self.lock:
+            return [
+                (key, value) for key, (value, _, stored_at) in self.entries.items()
+                if key.startswith(prefix) and not self._expired(stored_at, now)
+            ]
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.size)
+
+
+# In-memory store for captured GraphQL responses
 # Key: Page URL (str)
 # Value: GraphQL JSON data (dict)
-replies_cache = {}
+replies_cache = BoundedCache()
+
+
+def configure_replies_cache(settings):
+    replies_cache.configure(
+        max_entries=settings.getint("REPLIES_CACHE_MAX_ENTRIES", 1000),
+        max_bytes=settings.getint("REPLIES_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+        ttl=settings.getint("REPLIES_CACHE_TTL", 3600),
+        db_path=settings.get("REPLIES_CACHE_DB"),
+        codec=settings.get("REPLIES_CACHE_CODEC", "gzip"),
+        max_disk_entries=settings.getint("REPLIES_CACHE_MAX_DISK_ENTRIES", 100000),
+    )
+
+
+# GraphQL responses downloaded by Playwright pages, keyed by graphql_key()
+# Value: {"operation_name": str, "variables": dict, "data": dict}
+graphql_capture = BoundedCache()
+
+
+def graphql_key(operation_name, variables):
+    canonical = json.dumps(variables or {}, sort_keys=True, separators=(",", ":"))
+    return f"{operation_name}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+def configure_graphql_capture(settings):
+    graphql_capture.configure(
+        max_entries=settings.getint("GRAPHQL_CAPTURE_MAX_ENTRIES", 1000),
+        max_bytes=settings.getint("GRAPHQL_CAPTURE_MAX_BYTES", 64 * 1024 * 1024),
+        ttl=settings.getint("GRAPHQL_CAPTURE_TTL", 3600),
+    )
+
+
+def request_fingerprint(method, url, body=b""):
+    """Key used to match a recorded interaction: method, URL and a hash of the body.
+
+    GraphQL calls all hit the same endpoint, so the body hash is what tells
+    a MessageReplies page for one thread apart from another.
+    """
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    body_hash = hashlib.sha256(body or b"").hexdigest()
+    return method.upper(), url, body_hash
+
+
+class CassetteStore:
+    """Compact on-disk store of recorded request/response pairs.
+
+    Everything lives in a single SQLite file; response bodies are zlib
+    compressed so a full board crawl stays small enough to keep around.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS interactions (
+                method TEXT,
+                url TEXT,
+                body_hash TEXT,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                extra TEXT,
+                recorded_at REAL,
+                PRIMARY KEY (method, url, body_hash)
+            )
+        """)
+        self.conn.commit()
+
+    def put(self, key, status, headers, body, extra=None):
+        method, url, body_hash = key
+        self.conn.execute("""
+            INSERT OR REPLACE INTO interactions
+            (method, url, body_hash, status, headers, body, extra, recorded_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            method,
+            url,
+            body_hash,
+            status,
+            json.dumps(headers),
+            zlib.compress(body),
+            json.dumps(extra) if extra else None,
+            time.time()
+        ))
+
+    def get(self, key):
+        row = self.conn.execute("""
+            SELECT status, headers, body, extra FROM interactions
+            WHERE method = ? AND url = ? AND body_hash = ?
+        """, key).fetchone()
+        if not row:
+            return None
+        status, headers, body, extra = row
+        return {
+            "status": status,
+            "headers": json.loads(headers),
+            "body": zlib.decompress(body),
+            "extra": json.loads(extra) if extra else {},
+        }
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM interactions").fetchone()[0]
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+class PayloadArchive:
+    """Raw payloads the spider parsed, kept so parser fixes can be backfilled offline.
+
+    Every list page, discussion detail page and MessageReplies response is
+    stored compressed under ``(kind, message_id, fetched_at)``. ``root_id`` is
+    the discussion a payload belongs to, so reextract.py can replay one
+    discussion's detail page plus the replies fetched after it through the
+    spider's own parsing code.
+    """
+
+    def __init__(self, path, codec="zstd", readonly=False):
+        self.path = path
+        self.codec = resolve_codec(codec)
+        self.pending_commits = 0
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            return
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS payloads (
+                kind TEXT,
+                message_id TEXT,
+                fetched_at REAL,
+                root_id TEXT,
+                url TEXT,
+                body BLOB,
+                PRIMARY KEY (kind, message_id, fetched_at)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_payloads_root ON payloads(root_id, fetched_at)")
+        self.conn.commit()
+
+    def put(self, kind, message_id, body, url=None, root_id=None, fetched_at=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO payloads (kind, message_id, fetched_at, root_id, url, body) VALUES (?, ?, ?, ?, ?, ?)",
+            (kind, message_id, fetched_at or time.time(), root_id, url, compress(body, self.codec))
+        )
+        self.pending_commits += 1
+        if self.pending_commits >= 100:
+            self.commit()
+
+    def discussions(self, latest_only=True):
+        """``(root_id, fetched_at, next_fetched_at)`` of archived detail fetches, oldest first.
+
+        ``next_fetched_at`` is when the same discussion was fetched again
+        (None for the latest fetch); replies archived in between belong to
+        this fetch.
+        """
+        return self.conn.execute(f"""
+            SELECT root_id, fetched_at, next_fetched_at FROM (
+                SELECT root_id, fetched_at,
+                       LEAD(fetched_at) OVER (PARTITION BY root_id ORDER BY fetched_at) AS next_fetched_at
+                FROM payloads
+                WHERE kind = 'detail'
+            )
+            {"WHERE next_fetched_at IS NULL" if latest_only else ""}
+            ORDER BY fetched_at
+        """)
+
+    def fetch(self, root_id, since, until=None):
+        """Payloads of one discussion fetch, in the order they were archived."""
+        rows = self.conn.execute("""
+            SELECT kind, message_id, fetched_at, url, body FROM payloads
+            WHERE root_id = ? AND fetched_at >= ? AND (? IS NULL OR fetched_at < ?)
+            ORDER BY fetched_at
+        """, (root_id, since, until, until))
+        for kind, message_id, fetched_at, url, body in rows:
+            yield kind, message_id, fetched_at, url, decompress(body)
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT kind, COUNT(*) FROM payloads GROUP BY kind"))
+
+    def commit(self):
+        self.conn.commit()
+        self.pending_commits = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
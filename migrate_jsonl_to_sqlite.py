@@ -3,6 +3,9 @@ import sqlite3
 import re
 from datetime import datetime
 
+from customer_intent_scraper.db import upsert_discussions, upsert_replies
+from customer_intent_scraper.schema import apply_migrations
+
 DB_PATH = "discussions.db"
 JSONL_PATH = "all_discussions_backup.jsonl"
 
@@ -12,44 +15,37 @@ def get_id_from_url(url):
         return match.group(1)
     return None
 
+BATCH_SIZE = 500
+
+def existing_ids(cursor, table, ids):
+    found = set()
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[start:start + BATCH_SIZE]
+        marks = ", ".join("?" * len(chunk))
+        found.update(row[0] for row in cursor.execute(f"SELECT id FROM {table} WHERE id IN ({marks})", chunk))
+    return found
+
+def write_batch(cursor, discussions, replies):
+    # Like the old INSERT OR IGNORE, rows already in the database are left alone;
+    # new ones go through the crawler's upsert so they get their hashes
+    known = existing_ids(cursor, "discussions", {row[0] for row in discussions})
+    discussions = [row for row in discussions if row[0] not in known]
+    known = existing_ids(cursor, "replies", {row[0] for row in replies})
+    replies = [row for row in replies if row[0] not in known]
+    return upsert_discussions(cursor, discussions), upsert_replies(cursor, replies)
+
 def migrate():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
     # Ensure tables exist (just in case)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS discussions (
-            id TEXT PRIMARY KEY,
-            source_id TEXT,
-            platform TEXT,
-            sub_source TEXT,
-            title TEXT,
-            author TEXT,
-            publish_date TEXT,
-            content TEXT,
-            url TEXT,
-            reply_count INTEGER,
-            thumbs_up_count INTEGER,
-            scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            analysis_category TEXT,
-            analysis_product_area TEXT,
-            analysis_sentiment TEXT
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS replies (
-            id TEXT PRIMARY KEY,
-            parent_id TEXT,
-            author TEXT,
-            publish_date TEXT,
-            content TEXT,
-            thumbs_up_count INTEGER,
-            FOREIGN KEY(parent_id) REFERENCES discussions(id)
-        )
-    """)
+    apply_migrations(conn)
     
     count_discussions = 0
     count_replies = 0
+    discussions = []
+    replies = []
     
     with open(JSONL_PATH, 'r', encoding='utf-8') as f:
         for line in f:
@@ -65,12 +61,8 @@ def migrate():
                 
                 discussion_id = f"message:{source_id}"
                 
-                # Insert Discussion
-                cursor.execute("""
-                    INSERT OR IGNORE INTO discussions 
-                    (id, source_id, platform, sub_source, title, author, publish_date, content, url, reply_count, thumbs_up_count)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
+                # Discussion row in DISCUSSION_COLUMNS order
+                discussions.append((
                     discussion_id,
                     source_id,
                     "Tech Community",
@@ -81,41 +73,40 @@ def migrate():
                     item.get('content'),
                     url,
                     item.get('reply_count', 0),
-                    item.get('thumbs_up_count', 0)
+                    item.get('thumbs_up_count', 0),
+                    None, # canonical_id: set by the crawler's deduplication
                 ))
                 
-                if cursor.rowcount > 0:
-                    count_discussions += 1
-                
-                # Insert Replies
-                replies = item.get('replies', [])
-                if replies:
-                    for reply in replies:
-                        reply_id = reply.get('id')
-                        if not reply_id:
-                            # Generate a reply ID if missing
-                            reply_id = f"{discussion_id}_reply_{hash(reply.get('content', ''))}"
-                        
-                        cursor.execute("""
-                            INSERT OR IGNORE INTO replies
-                            (id, parent_id, author, publish_date, content, thumbs_up_count)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        """, (
-                            reply_id,
-                            discussion_id,
-                            reply.get('author'),
-                            reply.get('publish_date'),
-                            reply.get('content'),
-                            reply.get('thumbs_up_count', 0)
-                        ))
-                        if cursor.rowcount > 0:
-                            count_replies += 1
+                # Reply rows in REPLY_COLUMNS order
+                for reply in item.get('replies') or []:
+                    reply_id = reply.get('id')
+                    if not reply_id:
+                        # Generate a reply ID if missing
+                        reply_id = f"{discussion_id}_reply_{hash(reply.get('content', ''))}"
+                    replies.append((
+                        reply_id,
+                        discussion_id,
+                        reply.get('author'),
+                        reply.get('publish_date'),
+                        reply.get('content'),
+                        reply.get('thumbs_up_count', 0)
+                    ))
                             
             except json.JSONDecodeError:
                 print(f"Skipping invalid JSON line")
             except Exception as e:
                 print(f"Error processing line: {e}")
 
+            if len(discussions) >= BATCH_SIZE:
+                d_written, r_written = write_batch(cursor, discussions, replies)
+                count_discussions += d_written
+                count_replies += r_written
+                discussions, replies = [], []
+
+    d_written, r_written = write_batch(cursor, discussions, replies)
+    count_discussions += d_written
+    count_replies += r_written
+
     conn.commit()
     conn.close()
     print(f"Migration complete.")
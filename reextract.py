@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from web_poet import HttpResponse
+
+from customer_intent_scraper.db import DISCUSSION_COLUMNS, ContentStore, upsert_discussions, upsert_replies
+from customer_intent_scraper.dedup import NearDuplicateIndex
+from customer_intent_scraper.pages.techcommunity_microsoft_com import (
+    TechcommunityMicrosoftComDiscussionItemPage,
+    TechcommunityReplies,
+)
+from customer_intent_scraper.pipelines import CustomerIntentScraperPipeline, discussion_row, reply_rows
+from customer_intent_scraper.schema import apply_migrations
+from customer_intent_scraper.spiders.techcommunity import TechcommunitySpider
+from customer_intent_scraper.stores import PayloadArchive
+
+# Re-runs the spider's parsing on payloads archived with PAYLOAD_ARCHIVE_PATH:
+# detail pages go through the page object, MessageReplies payloads through
+# TechcommunitySpider._extract_replies_recursive/merge_replies, then the
+# cleaning pipeline, exactly as in a crawl. Workers only read the archive;
+# the main process owns the database connection and upserts in batches,
+# so unchanged rows are skipped and analysis results survive.
+
+TITLE = DISCUSSION_COLUMNS.index("title")
+CONTENT = DISCUSSION_COLUMNS.index("content")
+CANONICAL_ID = DISCUSSION_COLUMNS.index("canonical_id")
+
+# Per-process parsing state, set up by init_worker
+worker = {}
+
+
+def init_worker(archive_path):
+    # The page object prints debug lines for every item
+    sys.stdout = open(os.devnull, "w")
+    worker["archive"] = PayloadArchive(archive_path, readonly=True)
+    worker["spider"] = TechcommunitySpider()
+    worker["cleaner"] = CustomerIntentScraperPipeline()
+    worker["loop"] = asyncio.new_event_loop()
+
+
+def extract(root_id, since, until):
+    """Rebuild one discussion fetch; returns (discussion_row, reply_rows) or None."""
+    spider = worker["spider"]
+    detail = None
+    captured = {}
+    replies = []
+    for kind, _, _, url, body in worker["archive"].fetch(root_id, since, until):
+        if kind == "detail":
+            detail = (url, body)
+        elif kind == "captured_replies":
+            captured = json.loads(body)
+        elif kind == "replies":
+            replies.append(body)
+    if detail is None:
+        return None
+
+    url, body = detail
+    page = TechcommunityMicrosoftComDiscussionItemPage(
+        HttpResponse(url, body, headers={"Content-Type": "text/html; charset=utf-8"}),
+        TechcommunityReplies(data=captured),
+    )
+    item = worker["loop"].run_until_complete(page.to_item())
+
+    # Same merge as parse_replies_api, in the order the pages were fetched
+    for body in replies:
+        data = json.loads(body)
+        if "errors" in data:
+            continue
+        edges = data.get("data", {}).get("message", {}).get("replies", {}).get("edges", [])
+        new_replies, _ = spider._extract_replies_recursive(edges)
+        spider.merge_replies(item, new_replies)
+
+    worker["cleaner"].process_item(item, spider)
+    return discussion_row(item, spider), reply_rows(item)
+
+
+def extract_chunk(fetches):
+    results = []
+    for fetch in fetches:
+        try:
+            results.append(extract(*fetch))
+        except Exception as e:
+            print(f"Error re-extracting {fetch[0]}: {e}", file=sys.stderr)
+            results.append(None)
+    return results
+
+
+def chunked(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(tuple(row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-parse archived payloads (PAYLOAD_ARCHIVE_PATH) and upsert the results."
+    )
+    parser.add_argument("--archive", default="payloads.db", help="Payload archive written by the spider")
+    parser.add_argument("--db", default="discussions.db", help="Path to the SQLite database")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parser processes")
+    parser.add_argument("--chunk-size", type=int, default=50, help="Discussions per worker task")
+    parser.add_argument("--batch-size", type=int, default=500, help="Discussions per database transaction")
+    parser.add_argument("--all-fetches", action="store_true",
+                        help="Replay every archived fetch in order instead of only the latest per discussion")
+    parser.add_argument("--compression", choices=["zstd"], default=None,
+                        help="Store long content compressed (see CONTENT_COMPRESSION)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.archive):
+        print(f"Error: {args.archive} not found.")
+        return
+
+    archive = PayloadArchive(args.archive, readonly=True)
+    print(f"Archive: {archive.counts()}")
+
+    conn = sqlite3.connect(args.db, timeout=30)
+    apply_migrations(conn)
+    cursor = conn.cursor()
+    store = ContentStore(conn, compression=args.compression)
+    dedup = NearDuplicateIndex(conn)
+
+    totals = {"extracted": 0, "failed": 0, "discussions_written": 0, "replies": 0, "replies_written": 0}
+    discussions, replies = [], []
+
+    def write():
+        with conn:
+            totals["discussions_written"] += upsert_discussions(cursor, discussions, store)
+            totals["replies_written"] += upsert_replies(cursor, replies, store)
+        discussions.clear()
+        replies.clear()
+
+    def collect(results):
+        for result in results:
+            if result is None or not result[0][0]:
+                totals["failed"] += 1
+                continue
+            row, rows = result
+            # Keep the canonical_id decided at crawl time (new discussions get one here)
+            row = list(row)
+            row[CANONICAL_ID], _ = dedup.assign(row[0], f"{row[TITLE] or ''}\n{row[CONTENT] or ''}")
+            discussions.append(tuple(row))
+            replies.extend(rows)
+            totals["extracted"] += 1
+            totals["replies"] += len(rows)
+        if len(discussions) >= args.batch_size:
+            write()
+
+    started = time.perf_counter()
+    fetches = archive.discussions(latest_only=not args.all_fetches)
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.archive,)) as pool:
+        # Stream the archive: only a few chunks in flight at a time, results written in order
+        in_flight = deque()
+        for chunk in chunked(fetches, args.chunk_size):
+            in_flight.append(pool.submit(extract_chunk, chunk))
+            if len(in_flight) >= args.workers * 2:
+                collect(in_flight.popleft().result())
+        while in_flight:
+            collect(in_flight.popleft().result())
+    write()
+    dedup.flush()
+    conn.close()
+    archive.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Re-extracted {totals['extracted']} discussions and {totals['replies']} replies "
+          f"in {elapsed:.1f}s ({totals['extracted'] / max(elapsed, 1e-9):.0f} discussions/s), "
+          f"{totals['failed']} failed.")
+    print(f"Updated {totals['discussions_written']} discussions and {totals['replies_written']} replies; "
+          f"the rest were unchanged.")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,10 @@ import argparse
 from datetime import datetime
 from dotenv import load_dotenv
 
+from customer_intent_scraper.db import upsert_discussions, upsert_replies
+from customer_intent_scraper.dedup import NearDuplicateIndex
+from customer_intent_scraper.schema import apply_migrations
+
 # Load environment variables
 load_dotenv()
 
@@ -18,38 +22,9 @@ class RedditScraper:
         self.db_name = db_name
         self.conn = sqlite3.connect(self.db_name)
         self.cursor = self.conn.cursor()
-        self.ensure_tables()
-
-    def ensure_tables(self):
-        # Same schema as the Scrapy pipeline
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS discussions (
-                id TEXT PRIMARY KEY,
-                source_id TEXT,
-                platform TEXT,
-                sub_source TEXT,
-                title TEXT,
-                author TEXT,
-                publish_date TEXT,
-                content TEXT,
-                url TEXT,
-                reply_count INTEGER,
-                thumbs_up_count INTEGER,
-                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS replies (
-                id TEXT PRIMARY KEY,
-                parent_id TEXT,
-                author TEXT,
-                publish_date TEXT,
-                content TEXT,
-                thumbs_up_count INTEGER,
-                FOREIGN KEY(parent_id) REFERENCES discussions(id)
-            )
-        """)
-        self.conn.commit()
+        apply_migrations(self.conn)
+        # Shared with the Scrapy pipeline, so cross-posts between platforms are caught too
+        self.dedup = NearDuplicateIndex(self.conn)
 
     def scrape_subreddit(self, subreddit_name, limit=100, search_query=None):
         print(f"Scraping r/{subreddit_name}...")
@@ -67,18 +42,19 @@ class RedditScraper:
             if count % 10 == 0:
                 print(f"Processed {count} posts...")
         
+        self.dedup.flush()
         print(f"Finished scraping {count} posts from r/{subreddit_name}.")
 
     def process_submission(self, submission, subreddit_name):
         # Insert Discussion
         try:
             publish_date = datetime.fromtimestamp(submission.created_utc).isoformat()
+            canonical_id, _ = self.dedup.assign(
+                f"reddit_{submission.id}", f"{submission.title}\n{submission.selftext}"
+            )
             
-            self.cursor.execute("""
-                INSERT OR REPLACE INTO discussions 
-                (id, source_id, platform, sub_source, title, author, publish_date, content, url, reply_count, thumbs_up_count)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            # Upsert: unchanged posts/comments are skipped and analysis columns are kept
+            upsert_discussions(self.cursor, [(
                 f"reddit_{submission.id}",
                 submission.id,
                 "Reddit",
@@ -89,19 +65,17 @@ class RedditScraper:
                 submission.selftext,
                 submission.url,
                 submission.num_comments,
-                submission.score
-            ))
+                submission.score,
+                canonical_id
+            )])
 
             # Process Comments (Replies)
             submission.comments.replace_more(limit=0) # Flatten comment tree, skip 'load more'
+            replies = []
             for comment in submission.comments.list():
                 comment_date = datetime.fromtimestamp(comment.created_utc).isoformat()
                 
-                self.cursor.execute("""
-                    INSERT OR REPLACE INTO replies
-                    (id, parent_id, author, publish_date, content, thumbs_up_count)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
+                replies.append((
                     f"reddit_{comment.id}",
                     f"reddit_{submission.id}",
                     str(comment.author),
@@ -109,6 +83,7 @@ class RedditScraper:
                     comment.body,
                     comment.score
                 ))
+            upsert_replies(self.cursor, replies)
             
             self.conn.commit()
         except Exception as e:
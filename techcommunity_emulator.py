@@ -0,0 +1,500 @@
+import argparse
+import base64
+import html
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Local stand-in for techcommunity.microsoft.com.
+#
+# Serves board pages, discussion pages and the two persisted GraphQL
+# operations the techcommunity spider uses (MessageViewsForWidget and
+# MessageReplies) from synthetic, deterministic data. Point the spider at it with:
+#
+#   python techcommunity_emulator.py --threads 100000
+#   scrapy crawl techcommunity -s TECHCOMMUNITY_BASE_URL=http://127.0.0.1:8080
+
+TOPIC_ID_STRIDE = 1_000_000   # topic id = (board + 1) * stride + thread index
+REPLY_ID_FACTOR = 100_000     # reply id = topic id * factor + node index
+BASE_TIME = datetime(2025, 12, 1, 12, 0, 0)
+
+WORDS = (
+    "copilot teams outlook excel sharepoint license tenant admin error agent prompt "
+    "policy users meeting summary file access permission rollout feature request "
+    "issue slow missing works great thanks help please update settings data report"
+).split()
+
+
+def encode_cursor(offset):
+    return base64.b64encode(f"offset:{offset}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        return int(base64.b64decode(cursor).decode().split(":", 1)[1])
+    except Exception:
+        return 0
+
+
+class SyntheticBoard:
+    """Deterministic synthetic forum data.
+
+    Nothing is held in memory up front: every thread (and its reply tree) is
+    derived from the seed and its id, so 100k-thread boards cost nothing
+    until they are requested.
+    """
+
+    def __init__(self, boards=1, threads=1000, mean_replies=5.0, reply_dist="exponential",
+                 reply_shape="random", seed=0):
+        self.boards = boards
+        self.threads = threads
+        self.mean_replies = mean_replies
+        self.reply_dist = reply_dist
+        self.reply_shape = reply_shape
+        self.seed = seed
+
+    def board_id(self, board):
+        return f"EmulatedBoard{board}"
+
+    def board_slug(self, board):
+        return f"board{board}"
+
+    def topic_id(self, board, index):
+        return (board + 1) * TOPIC_ID_STRIDE + index
+
+    def locate(self, message_id):
+        """Return (topic_id, node_index) for a topic or reply id, or None."""
+        num = int(str(message_id).replace("message:", ""))
+        if num >= TOPIC_ID_STRIDE * REPLY_ID_FACTOR:
+            topic, node = divmod(num, REPLY_ID_FACTOR)
+        else:
+            topic, node = num, 0
+        board, index = divmod(topic, TOPIC_ID_STRIDE)
+        if not (1 <= board <= self.boards and 0 <= index < self.threads):
+            return None
+        return topic, node
+
+    def _words(self, rng, n):
+        return " ".join(rng.choice(WORDS) for _ in range(n))
+
+    def _reply_count(self, rng):
+        if self.reply_dist == "fixed":
+            n = self.mean_replies
+        elif self.reply_dist == "pareto":
+            # Heavy tail: most threads are quiet, a few are huge
+            n = (self.mean_replies / 3.0) * rng.paretovariate(1.5)
+        else:
+            n = rng.expovariate(1.0 / self.mean_replies) if self.mean_replies > 0 else 0
+        return min(int(n), REPLY_ID_FACTOR - 1)
+
+    def _parent(self, rng, node):
+        if self.reply_shape == "flat":
+            return 0
+        if self.reply_shape == "chain":
+            return node - 1
+        if self.reply_shape == "bushy":
+            # Replies cluster under the first few top-level answers
+            return rng.randrange(0, min(node, 4))
+        return rng.randrange(0, node)
+
+    @lru_cache(maxsize=4096)
+    def thread(self, topic):
+        """Build a thread: node 0 is the topic, nodes 1..n are replies."""
+        rng = random.Random(f"{self.seed}:{topic}")
+        count = self._reply_count(rng)
+        start = BASE_TIME - timedelta(minutes=topic % TOPIC_ID_STRIDE)
+
+        nodes = [{
+            "subject": self._words(rng, 6).capitalize(),
+            "body": self._words(rng, rng.randint(20, 120)),
+            "author": f"user{rng.randint(1, 5000)}",
+            "kudos": rng.randint(0, 50),
+            "time": start,
+            "parent": None,
+        }]
+        children = [[]]
+        for node in range(1, count + 1):
+            parent = self._parent(rng, node)
+            nodes.append({
+                "body": self._words(rng, rng.randint(5, 80)),
+                "author": f"user{rng.randint(1, 5000)}",
+                "kudos": rng.randint(0, 10),
+                "time": start + timedelta(minutes=node),
+                "parent": parent,
+            })
+            children.append([])
+            children[parent].append(node)
+        return nodes, children
+
+    def message_id(self, topic, node):
+        num = topic if node == 0 else topic * REPLY_ID_FACTOR + node
+        return f"message:{num}"
+
+    def discussion_url(self, base_url, topic):
+        board = topic // TOPIC_ID_STRIDE - 1
+        return f"{base_url}/discussions/{self.board_slug(board)}/thread-{topic}/{topic}"
+
+
+class EmulatorState:
+    def __init__(self, board, page_size=50, latency_ms=0.0, latency_dist="fixed",
+                 rate_429=0.0, error_rate=0.0, inline_replies=0, seed=0):
+        self.board = board
+        self.page_size = page_size
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.rate_429 = rate_429
+        self.error_rate = error_rate
+        self.inline_replies = inline_replies
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    def roll(self, probability):
+        if probability <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < probability
+
+    def delay(self):
+        if self.latency_ms <= 0:
+            return 0.0
+        with self.lock:
+            if self.latency_dist == "uniform":
+                ms = self.rng.uniform(0, 2 * self.latency_ms)
+            elif self.latency_dist == "exponential":
+                ms = self.rng.expovariate(1.0 / self.latency_ms)
+            elif self.latency_dist == "lognormal":
+                # sigma=1 lognormal with the requested mean
+                ms = self.rng.lognormvariate(math.log(self.latency_ms) - 0.5, 1.0)
+            else:
+                ms = self.latency_ms
+        return ms / 1000.0
+
+
+class EmulatorHandler(BaseHTTPRequestHandler):
+    server_version = "TechcommunityEmulator/1.0"
+    protocol_version = "HTTP/1.1"
+    state = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def base_url(self):
+        return f"http://{self.headers.get('Host') or '%s:%s' % self.server.server_address}"
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.state
+        path = urlparse(self.path).path
+        time.sleep(state.delay())
+
+        if path == "/robots.txt":
+            state.count("robots")
+            return self._send(200, "User-agent: *\nAllow: /\n", "text/plain")
+        if path == "/__stats":
+            with state.lock:
+                return self._send(200, dict(state.counters))
+
+        match = re.search(r"/(\d+)/?$", path)
+        if match:
+            located = state.board.locate(match.group(1))
+            if not located:
+                state.count("not_found")
+                return self._send(404, "Not found", "text/plain")
+            state.count("discussion_page")
+            return self._send(200, self.render_discussion(located[0]), "text/html; charset=utf-8")
+
+        state.count("board_page")
+        return self._send(200, self.render_board(path), "text/html; charset=utf-8")
+
+    def do_POST(self):
+        state = self.state
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            return self._send(400, {"errors": [{"message": "Invalid JSON"}]})
+
+        operation = payload.get("operationName")
+        variables = payload.get("variables") or {}
+        time.sleep(state.delay())
+
+        if state.roll(state.rate_429):
+            state.count("throttled")
+            return self._send(429, {"errors": [{"message": "Too Many Requests"}]}, headers={"Retry-After": "1"})
+        if state.roll(state.error_rate):
+            state.count("graphql_errors")
+            return self._send(200, {"data": None, "errors": [{"message": "Injected GraphQL error", "path": [operation]}]})
+
+        state.count(operation or "unknown")
+        if operation == "MessageViewsForWidget":
+            return self._send(200, self.message_views(variables))
+        if operation == "MessageReplies":
+            return self._send(200, self.message_replies(variables))
+        return self._send(200, {"data": None, "errors": [{"message": f"Unknown operation {operation}"}]})
+
+    # --- GraphQL operations ---
+
+    def message_views(self, variables):
+        board = self.state.board
+        board_ref = ((variables.get("constraints") or {}).get("boardId") or {}).get("eq", "")
+        match = re.search(r"EmulatedBoard(\d+)$", board_ref)
+        board_index = int(match.group(1)) if match else 0
+        if board_index >= board.boards:
+            return {"data": {"messages": {"totalCount": 0, "pageInfo": {"hasNextPage": False, "endCursor": None}, "edges": []}}}
+
+        first = min(int(variables.get("first") or self.state.page_size), self.state.page_size)
+        offset = decode_cursor(variables.get("after"))
+        end = min(offset + first, board.threads)
+
+        edges = []
+        for index in range(offset, end):
+            topic = board.topic_id(board_index, index)
+            nodes, children = board.thread(topic)
+            root = nodes[0]
+            edges.append({
+                "cursor": encode_cursor(index + 1),
+                "node": {
+                    "__typename": "ForumTopicMessage",
+                    "id": board.message_id(topic, 0),
+                    "subject": root["subject"],
+                    "view_href": board.discussion_url(self.base_url, topic),
+                    "author": {"login": root["author"]},
+                    "body": f"<p>{root['body']}</p>",
+                    "postTime": root["time"].isoformat() + ".000-08:00",
+                    "kudosSumWeight": root["kudos"],
+                    "repliesCount": len(nodes) - 1,
+                },
+            })
+
+        return {
+            "data": {
+                "messages": {
+                    "totalCount": board.threads,
+                    "pageInfo": {
+                        "hasNextPage": end < board.threads,
+                        "endCursor": encode_cursor(end) if edges else None,
+                    },
+                    "edges": edges,
+                }
+            }
+        }
+
+    def _reply_node(self, topic, nodes, children, node, depth, variables):
+        board = self.state.board
+        data = nodes[node]
+        result = {
+            "__typename": "ForumReplyMessage",
+            "id": board.message_id(topic, node),
+            "author": {"login": data["author"]},
+            "body": f"<p>{data['body']}</p>",
+            "postTime": data["time"].isoformat() + ".000-08:00",
+            "kudosCount": data["kudos"],
+            "kudosSumWeight": data["kudos"],
+            "repliesCount": len(children[node]),
+        }
+        # Nested levels mirror the real query: repliesFirst at depth 2,
+        # repliesFirstDepthThree at depth 3, nothing below that.
+        limits = {1: variables.get("repliesFirst", 50), 2: variables.get("repliesFirstDepthThree", 100)}
+        limit = limits.get(depth)
+        if limit and children[node]:
+            kids = children[node][:int(limit)]
+            result["replies"] = {
+                "edges": [
+                    {"cursor": encode_cursor(i + 1), "node": self._reply_node(topic, nodes, children, kid, depth + 1, variables)}
+                    for i, kid in enumerate(kids)
+                ]
+            }
+        return result
+
+    def message_replies(self, variables):
+        board = self.state.board
+        located = board.locate(variables.get("id", ""))
+        if not located:
+            return {"data": {"message": None}, "errors": [{"message": "Message not found"}]}
+
+        topic, node = located
+        nodes, children = board.thread(topic)
+        if node >= len(nodes):
+            return {"data": {"message": None}, "errors": [{"message": "Message not found"}]}
+
+        first = min(int(variables.get("first") or self.state.page_size), self.state.page_size)
+        offset = decode_cursor(variables.get("repliesAfter"))
+        kids = children[node]
+        page = kids[offset:offset + first]
+        end = offset + len(page)
+
+        return {
+            "data": {
+                "message": {
+                    "id": board.message_id(topic, node),
+                    "repliesCount": len(kids),
+                    "replies": {
+                        "pageInfo": {"hasNextPage": end < len(kids), "endCursor": encode_cursor(end) if page else None},
+                        "edges": [
+                            {"cursor": encode_cursor(offset + i + 1), "node": self._reply_node(topic, nodes, children, kid, 1, variables)}
+                            for i, kid in enumerate(page)
+                        ],
+                    },
+                }
+            }
+        }
+
+    # --- HTML pages ---
+
+    def render_board(self, path):
+        board = self.state.board
+        slug = path.rstrip("/").rsplit("/", 1)[-1]
+        match = re.match(r"board(\d+)$", slug)
+        board_index = int(match.group(1)) if match and int(match.group(1)) < board.boards else 0
+        board_id = board.board_id(board_index)
+        # The spider captures its API headers from the first GraphQL POST the
+        # browser makes, so the page issues one on load just like the real site.
+        bootstrap = json.dumps({
+            "operationName": "MessageViewsForWidget",
+            "variables": {
+                "first": 10,
+                "constraints": {"boardId": {"eq": f"board:{board_id}"}, "depth": {"eq": 0}, "conversationStyle": {"eq": "FORUM"}},
+                "sorts": {"conversationLastPostingActivityTime": {"direction": "DESC"}},
+                "after": None,
+            },
+        })
+        return f"""<!DOCTYPE html>
+<html><head><title>{board_id}</title></head>
+<body data-cache-key="ForumBoardPage:board:{board_id}">
+<h1>{board_id}</h1>
+<script>
+fetch("/t5/s/api/2.1/graphql?opname=MessageViewsForWidget", {{
+  method: "POST",
+  headers: {{"Content-Type": "application/json"}},
+  body: {json.dumps(bootstrap)}
+}});
+</script>
+</body></html>"""
+
+    def render_discussion(self, topic):
+        board = self.state.board
+        nodes, children = board.thread(topic)
+        root = nodes[0]
+        message_key = f"ForumTopicMessage:message:{topic}"
+        apollo = {
+            message_key: {
+                "__typename": "ForumTopicMessage",
+                "id": board.message_id(topic, 0),
+                "entityType": "FORUM_TOPIC",
+                "depth": 0,
+                "subject": root["subject"],
+                "repliesCount": len(nodes) - 1,
+                "kudosSumWeight": root["kudos"],
+            }
+        }
+        # Optionally embed the first few replies like the server-rendered page does
+        for node in range(1, min(len(nodes), self.state.inline_replies + 1)):
+            data = nodes[node]
+            apollo[f"ForumReplyMessage:message:{topic * REPLY_ID_FACTOR + node}"] = {
+                "__typename": "ForumReplyMessage",
+                "id": board.message_id(topic, node),
+                "author": {"login": data["author"]},
+                "body": f"<p>{data['body']}</p>",
+                "postTime": data["time"].isoformat() + ".000-08:00",
+                "kudosSumWeight": data["kudos"],
+            }
+        next_data = json.dumps({"props": {"pageProps": {"apolloState": apollo}}})
+        title = root["time"].strftime("%B %d, %Y %I:%M %p")
+        return f"""<!DOCTYPE html>
+<html><head><title>{html.escape(root['subject'])}</title></head>
+<body>
+<article data-testid="StandardMessageView">
+  <h1 data-testid="MessageSubject">{html.escape(root['subject'])}</h1>
+  <a data-testid="userLink" href="/users/{root['author']}">{root['author']}</a>
+  <span data-testid="messageTime"><span title="{title}">{title}</span></span>
+  <div class="lia-message-body">{html.escape(root['body'])}</div>
+  <span data-testid="kudosCount">{root['kudos']}</span>
+</article>
+<script id="__NEXT_DATA__" type="application/json">{next_data}</script>
+</body></html>"""
+
+
+def make_server(host, port, state):
+    handler = type("BoundEmulatorHandler", (EmulatorHandler,), {"state": state})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Tech Community GraphQL emulator for scale testing.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--boards", type=int, default=1, help="Number of synthetic boards")
+    parser.add_argument("--threads", type=int, default=1000, help="Threads per board")
+    parser.add_argument("--mean-replies", type=float, default=5.0, help="Mean replies per thread")
+    parser.add_argument("--reply-dist", choices=["fixed", "exponential", "pareto"], default="exponential", help="Reply count distribution")
+    parser.add_argument("--reply-shape", choices=["flat", "chain", "random", "bushy"], default="random", help="Shape of the reply tree")
+    parser.add_argument("--page-size", type=int, default=50, help="Maximum items returned per GraphQL page")
+    parser.add_argument("--inline-replies", type=int, default=0, help="Replies embedded in the discussion page itself")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean response latency in milliseconds")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "exponential", "lognormal"], default="fixed", help="Latency distribution")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of GraphQL calls answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of GraphQL calls answered with an 'errors' payload")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for synthetic data and fault injection")
+    args = parser.parse_args()
+
+    board = SyntheticBoard(
+        boards=args.boards,
+        threads=args.threads,
+        mean_replies=args.mean_replies,
+        reply_dist=args.reply_dist,
+        reply_shape=args.reply_shape,
+        seed=args.seed,
+    )
+    state = EmulatorState(
+        board,
+        page_size=args.page_size,
+        latency_ms=args.latency_ms,
+        latency_dist=args.latency_dist,
+        rate_429=args.rate_429,
+        error_rate=args.error_rate,
+        inline_replies=args.inline_replies,
+        seed=args.seed,
+    )
+    server = make_server(args.host, args.port, state)
+    base_url = f"http://{args.host}:{args.port}"
+    print(f"Emulating {args.boards} board(s) x {args.threads} threads at {base_url}")
+    print(f"Board URLs: {', '.join(f'{base_url}/category/emulated/discussions/board{b}' for b in range(args.boards))}")
+    print(f"Run: scrapy crawl techcommunity -s TECHCOMMUNITY_BASE_URL={base_url}")
+    print(f"Request counters: {base_url}/__stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
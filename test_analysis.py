@@ -0,0 +1,86 @@
+import sys
+import os
+import sqlite3
+
+# Add current directory to path so we can import the project modules
+sys.path.append(os.getcwd())
+
+import pytest
+
+from customer_intent_scraper.analysis import (
+    LOCAL_ANALYZER, AnalysisStore, changed_since_filter, pending_filter, platform_filter,
+)
+from customer_intent_scraper.db import upsert_discussions
+from customer_intent_scraper.schema import apply_migrations
+
+
+def discussion(i, platform="Tech Community", content=None, thumbs_up_count=0):
+    return (
+        f"m{i}", str(i), platform, "Copilot", f"Title {i}", "author", "2025-01-01",
+        content or f"Content {i}", f"https://example.com/{i}", 0, thumbs_up_count, None,
+    )
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "discussions.db"))
+    apply_migrations(conn)
+    with conn:
+        upsert_discussions(conn.cursor(), [discussion(1), discussion(2), discussion(3, platform="Reddit")])
+    return conn
+
+
+def select(conn, *filters):
+    clauses = [clause for clause, _ in filters]
+    params = [param for _, values in filters for param in values]
+    sql = f"SELECT id, text_hash FROM discussions WHERE {' AND '.join(clauses)} ORDER BY id"
+    return conn.execute(sql, params).fetchall()
+
+
+def pending(conn, version):
+    return [row[0] for row in select(conn, pending_filter(LOCAL_ANALYZER, version))]
+
+
+def analysed(conn, columns="discussion_id, version"):
+    return conn.execute(f"SELECT {columns} FROM analysis ORDER BY discussion_id, version").fetchall()
+
+
+def test_field_limited_writes_leave_other_columns_alone(conn):
+    store = AnalysisStore(conn, LOCAL_ANALYZER, 1)
+    rows = select(conn, pending_filter(LOCAL_ANALYZER, "1"))
+    store.write([(id_, hash_, {"category": "Bug", "summary": "Broken"}) for id_, hash_ in rows])
+    store.write([(id_, hash_, {"cluster_id": 7, "pain_points": ["slow"]}) for id_, hash_ in rows],
+                fields=("cluster_id", "pain_points"))
+    assert analysed(conn, "category, summary, cluster_id, pain_points") == [("Bug", "Broken", 7, '["slow"]')] * 3
+
+
+def test_supersede_only_touches_the_selected_discussions(conn):
+    old = AnalysisStore(conn, LOCAL_ANALYZER, 1)
+    old.write([(id_, hash_, {"category": "Bug"}) for id_, hash_ in select(conn, pending_filter(LOCAL_ANALYZER, "1"))])
+
+    # A --platform refit: only Tech Community discussions get version 2
+    new = AnalysisStore(conn, LOCAL_ANALYZER, 2)
+    rows = select(conn, pending_filter(LOCAL_ANALYZER, "2"), platform_filter("Tech Community"))
+    new.write([(id_, hash_, {"category": "Question"}) for id_, hash_ in rows], supersede=True)
+    assert analysed(conn) == [("m1", "2"), ("m2", "2"), ("m3", "1")]
+
+    # A --since refit: only the discussion changed since then gets version 3
+    conn.execute("UPDATE discussions SET updated_at = '2030-01-01 00:00:00' WHERE id = 'm2'")
+    latest = AnalysisStore(conn, LOCAL_ANALYZER, 3)
+    rows = select(conn, pending_filter(LOCAL_ANALYZER, "3"), changed_since_filter("2030-01-01"))
+    assert [row[0] for row in rows] == ["m2"]
+    latest.write([(id_, hash_, {"category": "Idea"}) for id_, hash_ in rows])
+    assert latest.supersede() == 1
+    assert analysed(conn) == [("m1", "2"), ("m2", "3"), ("m3", "1")]
+
+
+def test_pending_filter_reselects_edited_discussions(conn):
+    store = AnalysisStore(conn, LOCAL_ANALYZER, 1)
+    store.write([(id_, hash_, {"category": "Bug"}) for id_, hash_ in select(conn, pending_filter(LOCAL_ANALYZER, "1"))])
+    assert pending(conn, "1") == []
+    assert pending(conn, "2") == ["m1", "m2", "m3"]
+
+    with conn:
+        # A kudos change is not a reason to analyse again, an edit is
+        upsert_discussions(conn.cursor(), [discussion(1, thumbs_up_count=5), discussion(2, content="Edited")])
+    assert pending(conn, "1") == ["m2"]
@@ -0,0 +1,80 @@
+import sys
+import os
+import sqlite3
+
+# Add current directory to path so we can import the project modules
+sys.path.append(os.getcwd())
+
+from customer_intent_scraper.dedup import MinHasher, NearDuplicateIndex, shingles, similarity
+from customer_intent_scraper.schema import apply_migrations
+
+POST = (
+    "Copilot in Outlook stopped summarising long email threads after the latest update. "
+    "It now says the thread is too long even for ten messages, and the same prompt worked last week. "
+    "We are on the monthly enterprise channel with E5 licences and Copilot assigned to every user."
+)
+CROSS_POST = POST.replace("ten messages", "ten short messages") + " Any ideas?"
+OTHER_POST = (
+    "How do I stop Teams from starting at login on a shared kiosk device? The setting keeps coming back "
+    "after every restart even though Intune policy says it is disabled for the whole group."
+)
+
+
+def make_index(path, **kwargs):
+    conn = sqlite3.connect(path)
+    apply_migrations(conn)
+    return NearDuplicateIndex(conn, **kwargs)
+
+
+def test_shingles_are_word_trigrams():
+    assert shingles("One two three four") == {"one two three", "two three four"}
+    assert shingles("Too short") == {"too", "short"}
+    assert shingles("") == set()
+
+
+def test_signatures_are_stable_and_estimate_similarity():
+    first, second = MinHasher(seed=1), MinHasher(seed=1)
+    assert first.signature(POST) == second.signature(POST)
+    assert first.signature("") is None
+    assert similarity(first.signature(POST), first.signature(CROSS_POST)) >= 0.8
+    assert similarity(first.signature(POST), first.signature(OTHER_POST)) < 0.2
+
+
+def test_duplicates_in_one_batch_are_found_before_flush(tmp_path):
+    index = make_index(str(tmp_path / "d.db"))
+    assert index.assign("a", POST) == ("a", 0.0)
+    canonical_id, score = index.assign("b", CROSS_POST)
+    assert canonical_id == "a"
+    assert score >= 0.8
+    assert index.assign("c", OTHER_POST)[0] == "c"
+
+
+def test_index_carries_over_between_crawls(tmp_path):
+    path = str(tmp_path / "d.db")
+    index = make_index(path)
+    index.assign("a", POST)
+    index.flush()
+    index.conn.close()
+
+    index = make_index(path)
+    assert index.assign("b", CROSS_POST)[0] == "a"
+    # A re-crawled discussion keeps the decision made when it was first seen
+    assert index.assign("a", OTHER_POST) == ("a", 1.0)
+    index.flush()
+    stored = index.conn.execute("SELECT canonical_id FROM minhash_signatures WHERE discussion_id = 'b'").fetchone()
+    assert stored == ("a",)
+
+
+def test_batches_are_flushed_automatically(tmp_path):
+    index = make_index(str(tmp_path / "d.db"), batch_size=2)
+    index.assign("a", POST)
+    index.assign("c", OTHER_POST)
+    assert not index.pending
+    count = index.conn.execute("SELECT COUNT(*) FROM minhash_bands").fetchone()[0]
+    assert count == 2 * index.bands
+
+
+def test_threshold_is_respected(tmp_path):
+    index = make_index(str(tmp_path / "d.db"), threshold=1.0)
+    index.assign("a", POST)
+    assert index.assign("b", CROSS_POST)[0] == "b"
@@ -0,0 +1,47 @@
+import sys
+import os
+import json
+import sqlite3
+
+# Add current directory to path so we can import the project modules
+sys.path.append(os.getcwd())
+
+from scrapy.http import HtmlResponse, Request
+
+from customer_intent_scraper.middlewares import CustomerIntentScraperDownloaderMiddleware
+
+
+class Stats:
+    def inc_value(self, key, spider=None):
+        pass
+
+
+class Spider:
+    name = "techcommunity"
+    api_headers = {
+        "Content-Type": "application/json",
+        "Cookie": "LiSESSIONID=secret",
+        "Authorization": "Bearer secret",
+        "X-CSRF-Token": "secret",
+        "x-csrf": "secret",
+        "User-Agent": "test",
+    }
+
+
+def test_recorded_cassette_has_no_credentials(tmp_path):
+    path = str(tmp_path / "cassette.db")
+    middleware = CustomerIntentScraperDownloaderMiddleware("record", path, stats=Stats())
+    request = Request("https://techcommunity.microsoft.com/", meta={"playwright": True})
+    response = HtmlResponse(
+        request.url,
+        body=b"<html></html>",
+        headers={"Content-Type": "text/html", "Set-Cookie": "LiSESSIONID=secret"},
+        request=request,
+    )
+    middleware.process_response(request, response, Spider())
+    middleware.spider_closed(Spider())
+
+    headers, extra = sqlite3.connect(path).execute("SELECT headers, extra FROM interactions").fetchone()
+    assert "secret" not in headers and "secret" not in extra
+    assert list(json.loads(headers)) == ["Content-Type"]
+    assert json.loads(extra)["api_headers"] == {"Content-Type": "application/json", "User-Agent": "test"}
@@ -0,0 +1,204 @@
+import sys
+import os
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+# Add current directory to path so we can import the project modules
+sys.path.append(os.getcwd())
+
+import pytest
+from twisted.internet import defer, threads
+
+from customer_intent_scraper import pipelines
+from customer_intent_scraper.pipelines import NearDuplicatePipeline, SQLitePipeline
+
+
+class Spider:
+    name = "techcommunity"
+    logger = logging.getLogger("test_pipelines")
+
+
+class FakeReactor:
+    """Stands in for the reactor: calls from the writer thread run when the test pumps them."""
+
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def callFromThread(self, f, *args):
+        self.calls.put((f, args))
+
+    def pump(self, until, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not until():
+            if time.monotonic() > deadline:
+                raise AssertionError("timed out waiting for the writer")
+            try:
+                f, args = self.calls.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            f(*args)
+
+
+class FakeThreads:
+    @staticmethod
+    def deferToThread(f, *args):
+        return defer.succeed(f(*args))
+
+    # Results come back through the (fake) reactor passed in
+    deferToThreadPool = staticmethod(threads.deferToThreadPool)
+
+
+@pytest.fixture
+def fake_reactor(monkeypatch):
+    fake = FakeReactor()
+    monkeypatch.setattr(pipelines, "reactor", fake)
+    monkeypatch.setattr(pipelines, "threads", FakeThreads)
+    return fake
+
+
+def make_item(i):
+    return {
+        "message_id": f"m{i}",
+        "title": f"Title {i}",
+        "content": f"Content of discussion {i}",
+        "discussion_url": f"https://techcommunity.microsoft.com/discussions/copilot/title-{i}/{i}",
+        "replies": [{"id": f"r{i}", "content": f"Reply {i}"}],
+    }
+
+
+def outcomes(deferreds):
+    results = [None] * len(deferreds)
+
+    def store(value, i):
+        results[i] = value
+
+    for i, d in enumerate(deferreds):
+        d.addBoth(store, i)
+    return results
+
+
+def test_backpressure_with_queue_of_one(tmp_path, fake_reactor):
+    db = str(tmp_path / "discussions.db")
+    pipeline = SQLitePipeline(db, batch_size=2, flush_interval=0.05, queue_size=1)
+    spider = Spider()
+    pipeline.open_spider(spider)
+
+    deferreds = [pipeline.process_item(make_item(i), spider) for i in range(20)]
+    results = outcomes(deferreds)
+    assert pipeline.waiting, "a queue of one should hold items back"
+
+    fake_reactor.pump(lambda: all(result is not None for result in results))
+    assert all(isinstance(result, dict) for result in results)
+
+    pipeline.close_spider(spider)
+    fake_reactor.pump(lambda: not pipeline.writer.is_alive())
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM discussions").fetchone()[0] == 20
+    assert conn.execute("SELECT COUNT(*) FROM replies").fetchone()[0] == 20
+
+
+def test_writer_death_fails_every_pending_item(tmp_path, fake_reactor):
+    db = str(tmp_path / "discussions.db")
+    pipeline = SQLitePipeline(db, batch_size=1, flush_interval=0.05, queue_size=1)
+    spider = Spider()
+    release = threading.Event()
+
+    def broken_flush(jobs, spider):
+        # Holds the first batch until the queue and the waiting list are full, then dies
+        release.wait(5)
+        raise MemoryError("writer died")
+
+    pipeline.flush = broken_flush
+    pipeline.open_spider(spider)
+
+    deferreds = [pipeline.process_item(make_item(0), spider)]
+    fake_reactor.pump(lambda: pipeline.queue.empty())
+    deferreds += [pipeline.process_item(make_item(i), spider) for i in range(1, 5)]
+    results = outcomes(deferreds)
+    assert pipeline.waiting
+    release.set()
+
+    # Everything fails before close_spider, which Scrapy would not call otherwise
+    fake_reactor.pump(lambda: all(result is not None for result in results))
+    assert all(isinstance(result.value, Exception) for result in results)
+    assert not pipeline.waiting
+
+    fake_reactor.pump(lambda: not pipeline.writer.is_alive())
+    late = outcomes([pipeline.process_item(make_item(9), spider)])
+    assert isinstance(late[0].value, RuntimeError)
+    assert pipeline.close_spider(spider) is None
+
+
+def test_dedup_runs_off_the_reactor_thread(tmp_path, fake_reactor, request):
+    db = str(tmp_path / "discussions.db")
+    pipeline = NearDuplicatePipeline(db)
+    spider = Spider()
+    pipeline.open_spider(spider)
+    request.addfinalizer(lambda: pipeline.pool.started and pipeline.pool.stop())
+    threads_used = set()
+    assign = pipeline.index.assign
+
+    def recording_assign(discussion_id, text):
+        threads_used.add(threading.current_thread().name)
+        return assign(discussion_id, text)
+
+    pipeline.index.assign = recording_assign
+    text = "Copilot in Outlook stopped summarising long email threads after the latest update, " * 3
+    items = [
+        {"message_id": "a", "title": "Outlook summaries", "content": text},
+        {"message_id": "b", "title": "Outlook summaries", "content": text + "Any ideas?"},
+        {"title": "no id"},
+    ]
+    results = outcomes([defer.maybeDeferred(pipeline.process_item, item, spider) for item in items])
+    fake_reactor.pump(lambda: all(result is not None for result in results))
+    assert [result.get("canonical_id") for result in results] == ["a", "a", None]
+    assert threads_used and threading.current_thread().name not in threads_used
+
+    closed = []
+    pipeline.close_spider(spider).addCallback(closed.append)
+    fake_reactor.pump(lambda: closed)
+    assert not pipeline.pool.started
+    conn = sqlite3.connect(db)
+    assert conn.execute("SELECT COUNT(*) FROM minhash_signatures").fetchone()[0] == 2
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def crawl(db, items, fake_reactor):
+    pipeline = SQLitePipeline(db, batch_size=100, flush_interval=0.05, report_changes=True)
+    spider = Spider()
+    pipeline.open_spider(spider)
+    results = outcomes([pipeline.process_item(item, spider) for item in items])
+    fake_reactor.pump(lambda: all(result is not None for result in results))
+    pipeline.close_spider(spider)
+    fake_reactor.pump(lambda: not pipeline.writer.is_alive())
+    return results
+
+
+def test_recrawl_reports_and_exports_only_changes(tmp_path, fake_reactor):
+    pq = pytest.importorskip("pyarrow.parquet")
+    db = str(tmp_path / "discussions.db")
+    first = crawl(db, [make_item(i) for i in range(3)], fake_reactor)
+    assert all(item["written"] == {"discussion": True, "replies": [f"r{i}"]} for i, item in enumerate(first))
+
+    items = [make_item(i) for i in range(3)]
+    items[1]["content"] = "Edited content"
+    items[2]["replies"][0]["content"] = "Edited reply"
+    second = crawl(db, items, fake_reactor)
+    assert [item["written"] for item in second] == [
+        {"discussion": False, "replies": []},
+        {"discussion": True, "replies": []},
+        {"discussion": False, "replies": ["r2"]},
+    ]
+
+    export = tmp_path / "exports"
+    parquet = pipelines.ParquetPipeline(str(export), row_group_size=10)
+    for item in second:
+        parquet.process_item(item, Spider())
+    parquet.close_spider(Spider())
+    discussions = pq.read_table(str(export / "discussions")).column("id").to_pylist()
+    replies = pq.read_table(str(export / "replies")).column("id").to_pylist()
+    assert discussions == ["m1"]
+    assert replies == ["r2"]
@@ -0,0 +1,46 @@
+import sys
+import os
+
+# Add current directory to path so we can import the project modules
+sys.path.append(os.getcwd())
+
+from customer_intent_scraper.shaping import TRUNCATION_MARKER, estimate_tokens, strip_boilerplate, truncate
+
+
+def test_code_survives():
+    assert strip_boilerplate("In C# I use x => { return a; }") == "In C# I use x => { return a; }"
+    assert strip_boilerplate("Run Get-MgUser | Select-Object -ExpandProperty Id") == \
+        "Run Get-MgUser | Select-Object -ExpandProperty Id"
+    assert strip_boilerplate("if (a && !b) { x[i] += *p; }") == "if (a && !b) { x[i] += *p; }"
+
+
+def test_formulas_survive():
+    assert strip_boilerplate("=IF(A1<>B1, SUM(C:C)*2, \"\")") == "=IF(A1<>B1, SUM(C:C)*2, \"\")"
+    assert strip_boilerplate("Budget: $5k + 20% => ~$6k") == "Budget: $5k + 20% => ~$6k"
+
+
+def test_decoration_is_stripped():
+    assert strip_boilerplate("Update ========== Teams crashes") == "Update Teams crashes"
+    assert strip_boilerplate("Solved 🎉🎉🎉 thanks to the tip above") == "Solved thanks to the tip above"
+    assert strip_boilerplate("Wait... it works!!!") == "Wait... it works!!!"
+
+
+def test_truncate_keeps_head_and_tail():
+    text = " ".join(f"word{i}" for i in range(1000))
+    result = truncate(text, 50)
+    assert estimate_tokens(result) <= 50
+    assert result.startswith("word0 ")
+    assert result.endswith(" word999")
+    assert TRUNCATION_MARKER in result
+
+
+def test_truncate_cuts_long_words_by_characters():
+    result = truncate("a" * 10000, 50)
+    assert estimate_tokens(result) <= 50
+    assert result.startswith("aaaa")
+    assert result.endswith("aaaa")
+
+
+def test_truncate_leaves_short_text_alone():
+    assert truncate("short text", 50) == "short text"
+    assert truncate("a" * 10000, 0) == "a" * 10000
@@ -0,0 +1,84 @@
+import sys
+import os
+import time
+
+# Add current directory to path so we can import the project modules
+sys.path.append(os.getcwd())
+
+from customer_intent_scraper.stores import BoundedCache
+
+
+def age(cache, key, seconds):
+    # Pretend an entry was stored ``seconds`` ago, in memory and on disk
+    value, size, stored_at = cache.entries[key]
+    cache.entries[key] = (value, size, stored_at - seconds)
+    if cache.conn is not None:
+        cache.conn.execute("UPDATE cache_entries SET stored_at = stored_at - ? WHERE key = ?", (seconds, key))
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = BoundedCache(max_entries=2)
+    cache["a"] = 1
+    cache["b"] = 2
+    assert cache.get("a") == 1
+    cache["c"] = 3
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.snapshot()["evictions"] == 1
+
+
+def test_byte_limit_evicts_oldest_entries():
+    cache = BoundedCache(max_bytes=25)
+    cache["a"] = "x" * 10
+    cache["b"] = "y" * 10
+    assert len(cache) == 2
+    cache["c"] = "z" * 10
+    assert len(cache) == 2
+    assert "a" not in cache
+    assert cache.snapshot()["bytes"] <= 25
+
+
+def test_expired_entries_are_missing():
+    cache = BoundedCache(ttl=60)
+    cache["a"] = 1
+    age(cache, "a", 120)
+    assert "a" not in cache
+    assert cache.get("a", "gone") == "gone"
+    assert cache.snapshot()["expirations"] == 1
+
+
+def test_contains_agrees_with_get_on_the_disk_tier(tmp_path):
+    cache = BoundedCache(max_entries=1, ttl=60, db_path=str(tmp_path / "cache.db"))
+    cache["a"] = {"v": 1}
+    cache["b"] = {"v": 2}
+    assert "a" not in cache.entries
+    assert "a" in cache
+    assert cache.get("a") == {"v": 1}
+    assert cache.snapshot()["disk_hits"] == 1
+
+    cache["c"] = {"v": 3}
+    age(cache, "c", 120)
+    cache["d"] = {"v": 4}
+    assert "c" not in cache
+    assert cache.get("c") is None
+
+
+def test_prune_disk_drops_expired_and_oldest_rows(tmp_path):
+    cache = BoundedCache(ttl=60, db_path=str(tmp_path / "cache.db"), max_disk_entries=3)
+    for key in "abcde":
+        cache[key] = key
+        time.sleep(0.01)
+    age(cache, "a", 120)
+    assert cache.prune_disk() == 2
+    rows = [row[0] for row in cache.conn.execute("SELECT key FROM cache_entries ORDER BY stored_at")]
+    assert rows == ["c", "d", "e"]
+    assert cache.snapshot()["disk_pruned"] == 2
+
+
+def test_disk_tier_is_pruned_every_few_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(BoundedCache, "PRUNE_EVERY", 5)
+    cache = BoundedCache(db_path=str(tmp_path / "cache.db"), max_disk_entries=2)
+    for i in range(5):
+        cache[str(i)] = i
+    assert cache.conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] == 2
+    assert cache.writes == 0